@@ -10,4 +10,17 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DIRECT_URL = os.getenv("DATABASE_URL") or os.getenv("DIRECT_URL")
 
 MODEL_EMBED = "text-embedding-3-small"
-MODEL_CHAT = "gpt-4o"
\ No newline at end of file
+MODEL_CHAT = "gpt-4o"
+
+# Pool de conexiones a Postgres (ver app/core/db.py)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Segundos máximos esperando una conexión libre del pool
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# statement_timeout aplicado en cada checkout (ms)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Tuning de pgvector fijado en cada checkout (ver scripts/pgvector_index.py).
+# probes ~ sqrt(lists) en IVFFlat; ef_search >= top_k en HNSW (más alto = más recall, más lento)
+VECTOR_IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", "10"))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
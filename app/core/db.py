@@ -0,0 +1,245 @@
+# app/core/db.py
+# Pools de conexiones a Postgres (Supabase).
+#
+# - Sync  (psycopg2):  db_connection()        -> scripts, smoke tests, CLI
+# - Async (psycopg 3): async_db_connection()  -> endpoints FastAPI
+#
+# Cada checkout valida la conexión y fija statement_timeout y el tuning de pgvector
+# (ivfflat.probes / hnsw.ef_search) en UN solo round trip (SELECT set_config(...)).
+# Si la conexión está rota se descarta y se toma otra.
+
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Dict, Optional
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from app.core.config import (
+    DIRECT_URL,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT_MS,
+    VECTOR_IVFFLAT_PROBES,
+    VECTOR_HNSW_EF_SEARCH,
+)
+
+# Parametrizable (a diferencia de SET) y sirve también como health check
+# Las variables de pgvector se aceptan aunque la extensión aún no esté cargada en la sesión
+CHECKOUT_SQL = (
+    "SELECT set_config('statement_timeout', %s, false),"
+    " set_config('ivfflat.probes', %s, false),"
+    " set_config('hnsw.ef_search', %s, false)"
+)
+
+_CHECKOUT_ATTEMPTS = 2
+
+
+def get_conn_str() -> str:
+    conn_str = DIRECT_URL or os.getenv("DATABASE_URL")
+    if not conn_str:
+        raise ValueError("No se encontró la cadena de conexión a la base de datos.")
+    return conn_str
+
+
+def _timeout_ms(statement_timeout_ms: Optional[int]) -> str:
+    ms = DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+    return str(max(int(ms), 1))
+
+
+def _checkout_params(timeout_ms: str):
+    return (timeout_ms, str(VECTOR_IVFFLAT_PROBES), str(VECTOR_HNSW_EF_SEARCH))
+
+
+# =========================
+# Sync (psycopg2)
+# =========================
+
+class SyncPool:
+    """
+    ThreadedConnectionPool + semáforo: psycopg2 lanza PoolError cuando se agota;
+    aquí preferimos esperar hasta DB_POOL_TIMEOUT segundos por una conexión libre.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, dsn: str):
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.in_use = 0
+        self.checkouts = 0
+        self.health_check_failures = 0
+        self.wait_seconds_total = 0.0
+
+    def _checkout(self, timeout_ms: str):
+        last_error: Optional[Exception] = None
+        for _ in range(_CHECKOUT_ATTEMPTS):
+            conn = self._pool.getconn()
+            try:
+                # Solo lecturas: autocommit evita sesiones "idle in transaction"
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(CHECKOUT_SQL, _checkout_params(timeout_ms))
+                return conn
+            except psycopg2.Error as e:
+                last_error = e
+                with self._lock:
+                    self.health_check_failures += 1
+                self._pool.putconn(conn, close=True)
+        raise last_error
+
+    @contextmanager
+    def connection(self, statement_timeout_ms: Optional[int] = None):
+        t0 = time.perf_counter()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise TimeoutError(f"Sin conexiones libres en el pool tras {DB_POOL_TIMEOUT}s")
+
+        conn = None
+        try:
+            conn = self._checkout(_timeout_ms(statement_timeout_ms))
+            with self._lock:
+                self.in_use += 1
+                self.checkouts += 1
+                self.wait_seconds_total += time.perf_counter() - t0
+
+            yield conn
+        finally:
+            if conn is not None:
+                with self._lock:
+                    self.in_use -= 1
+                self._pool.putconn(conn, close=bool(conn.closed))
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._pool._pool),
+                "checkouts": self.checkouts,
+                "health_check_failures": self.health_check_failures,
+                "avg_wait_ms": round(1000 * self.wait_seconds_total / self.checkouts, 2) if self.checkouts else 0.0,
+            }
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+
+_sync_pool: Optional[SyncPool] = None
+_sync_pool_lock = threading.Lock()
+
+
+def get_sync_pool() -> SyncPool:
+    """Pool sync del proceso (se crea y pre-calienta en el primer uso)."""
+    global _sync_pool
+    if _sync_pool is None:
+        with _sync_pool_lock:
+            if _sync_pool is None:
+                _sync_pool = SyncPool(DB_POOL_MIN, DB_POOL_MAX, get_conn_str())
+    return _sync_pool
+
+
+@contextmanager
+def db_connection(statement_timeout_ms: Optional[int] = None):
+    with get_sync_pool().connection(statement_timeout_ms) as conn:
+        yield conn
+
+
+# =========================
+# Async (psycopg 3)
+# =========================
+
+_async_pool = None
+_async_stats = {"checkouts": 0, "health_check_failures": 0}
+
+
+def get_async_pool():
+    """Pool async del proceso. Se abre en el startup de FastAPI (open_async_pool)."""
+    global _async_pool
+    if _async_pool is None:
+        from psycopg_pool import AsyncConnectionPool
+
+        _async_pool = AsyncConnectionPool(
+            get_conn_str(),
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+            timeout=DB_POOL_TIMEOUT,
+            # prepare_threshold=None: sin prepared statements (compatible con el pooler de Supabase)
+            kwargs={"autocommit": True, "prepare_threshold": None},
+            open=False,
+        )
+    return _async_pool
+
+
+async def open_async_pool() -> None:
+    """Abre el pool y espera a tener DB_POOL_MIN conexiones listas (pre-warm)."""
+    await get_async_pool().open(wait=True, timeout=max(DB_POOL_TIMEOUT, 30.0))
+
+
+async def close_async_pool() -> None:
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+@asynccontextmanager
+async def async_db_connection(statement_timeout_ms: Optional[int] = None):
+    import psycopg
+
+    pool = get_async_pool()
+    timeout_ms = _timeout_ms(statement_timeout_ms)
+
+    conn = None
+    last_error: Optional[Exception] = None
+    for _ in range(_CHECKOUT_ATTEMPTS):
+        conn = await pool.getconn()
+        try:
+            await conn.execute(CHECKOUT_SQL, _checkout_params(timeout_ms))
+            break
+        except psycopg.Error as e:
+            # putconn descarta la conexión si quedó rota (status BAD)
+            last_error = e
+            _async_stats["health_check_failures"] += 1
+            await pool.putconn(conn)
+            conn = None
+
+    if conn is None:
+        raise last_error
+
+    _async_stats["checkouts"] += 1
+    try:
+        yield conn
+    finally:
+        await pool.putconn(conn)
+
+
+# =========================
+# Stats (/api/health)
+# =========================
+
+def pool_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"sync": None, "async": None}
+
+    if _sync_pool is not None:
+        stats["sync"] = _sync_pool.stats()
+
+    if _async_pool is not None:
+        s = _async_pool.get_stats()
+        stats["async"] = {
+            "min": DB_POOL_MIN,
+            "max": DB_POOL_MAX,
+            "size": s.get("pool_size", 0),
+            "idle": s.get("pool_available", 0),
+            "waiting": s.get("requests_waiting", 0),
+            "checkouts": _async_stats["checkouts"],
+            "health_check_failures": _async_stats["health_check_failures"],
+            "avg_wait_ms": round(s["requests_wait_ms"] / s["requests_num"], 2) if s.get("requests_num") else 0.0,
+        }
+
+    return stats
@@ -0,0 +1,295 @@
+# app/core/deadline.py
+# Presupuesto de tiempo por petición + reintentos y hedging para OpenAI.
+#
+# - Cada pregunta abre un deadline (REQUEST_DEADLINE_S) en un contextvar. Embedding,
+#   SQL (statement_timeout) y chat toman de ahí su timeout: nunca esperan más de lo
+#   que le queda a la petición. Agotado el presupuesto -> DeadlineExceeded (504).
+# - Reintentos acotados con backoff exponencial + jitter completo, solo para errores
+#   transitorios (timeout, conexión, 429, 5xx). El cliente OpenAI va con max_retries=0
+#   para que no haya dos políticas encimadas.
+# - Hedging de embeddings: si la primera llamada tarda más que el percentil
+#   HEDGE_PERCENTILE de las últimas, se lanza una segunda y gana la que llegue primero.
+# - budget_low(s): para degradar (p. ej. saltar keywords) cuando queda poco tiempo.
+
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from app.core.config import DB_STATEMENT_TIMEOUT_MS
+
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "90"))
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+RETRY_BASE_S = float(os.getenv("RETRY_BASE_S", "0.25"))
+RETRY_MAX_S = float(os.getenv("RETRY_MAX_S", "2"))
+HEDGE_EMBED = os.getenv("HEDGE_EMBED", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Por debajo de esto (s) se salta la búsqueda por keywords
+KEYWORD_MIN_BUDGET_S = float(os.getenv("KEYWORD_MIN_BUDGET_S", "5"))
+
+T = TypeVar("T")
+
+# Errores de la librería openai que vale la pena reintentar (por nombre: import perezoso)
+_TRANSIENT_NAMES = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el presupuesto de tiempo de la petición."""
+
+    status_code = 504
+    retry_after = 1
+    reason = "deadline"
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Tiempo agotado para responder (etapa: {stage})")
+
+
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("rag_deadline", default=None)
+
+_stats = {"retries": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0, "degraded": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def deadline_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return dict(_stats, hedge_threshold_ms=_round_ms(embed_latency.threshold()))
+
+
+def _round_ms(s: Optional[float]) -> Optional[float]:
+    return round(1000 * s, 1) if s is not None else None
+
+
+# =========================
+# Deadline de la petición
+# =========================
+
+def start_deadline(seconds: float = REQUEST_DEADLINE_S) -> None:
+    _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def end_deadline() -> None:
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Segundos que le quedan a la petición; None si no hay deadline (scripts, warmup)."""
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+
+def check_deadline(stage: str) -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        _count("deadline_exceeded")
+        raise DeadlineExceeded(stage)
+
+
+def call_timeout(cap: float = OPENAI_TIMEOUT_S) -> float:
+    """Timeout para una llamada: el menor entre `cap` y lo que resta de la petición."""
+    left = remaining()
+    return cap if left is None else max(0.1, min(cap, left))
+
+
+def statement_timeout_ms() -> Optional[int]:
+    """statement_timeout para el checkout: nunca más allá del deadline."""
+    left = remaining()
+    if left is None:
+        return None
+    return max(1, min(DB_STATEMENT_TIMEOUT_MS, int(1000 * left)))
+
+
+def budget_low(min_s: float) -> bool:
+    left = remaining()
+    low = left is not None and left < min_s
+    if low:
+        _count("degraded")
+    return low
+
+
+# =========================
+# Reintentos
+# =========================
+
+def is_transient(e: BaseException) -> bool:
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    if type(e).__name__ in _TRANSIENT_NAMES:
+        return True
+    status = getattr(e, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def _backoff(attempt: int) -> Optional[float]:
+    """Pausa antes del reintento `attempt` (1..n); None si ya no cabe en el deadline."""
+    delay = random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * (2 ** (attempt - 1))))
+    left = remaining()
+    if left is not None and left <= delay:
+        return None
+    return delay
+
+
+def with_retries(fn: Callable[[], T], stage: str, retries: int = OPENAI_MAX_RETRIES) -> T:
+    attempt = 0
+    while True:
+        check_deadline(stage)
+        try:
+            return fn()
+        except Exception as e:
+            attempt += 1
+            delay = _backoff(attempt) if attempt <= retries and is_transient(e) else None
+            if delay is None:
+                raise
+            _count("retries")
+            print(f"⚠️ {stage}: reintento {attempt}/{retries} en {delay:.2f}s ({type(e).__name__})")
+            time.sleep(delay)
+
+
+async def with_retries_async(fn: Callable[[], Awaitable[T]], stage: str, retries: int = OPENAI_MAX_RETRIES) -> T:
+    attempt = 0
+    while True:
+        check_deadline(stage)
+        try:
+            return await fn()
+        except Exception as e:
+            attempt += 1
+            delay = _backoff(attempt) if attempt <= retries and is_transient(e) else None
+            if delay is None:
+                raise
+            _count("retries")
+            print(f"⚠️ {stage}: reintento {attempt}/{retries} en {delay:.2f}s ({type(e).__name__})")
+            await asyncio.sleep(delay)
+
+
+# =========================
+# Hedging
+# =========================
+
+class LatencyTracker:
+    """Latencias recientes de una llamada; threshold() = percentil configurado."""
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, window: int = 200, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+
+embed_latency = LatencyTracker()
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+    return _hedge_pool
+
+
+def _timed(fn: Callable[[], T], tracker: LatencyTracker) -> Callable[[], T]:
+    def run() -> T:
+        t0 = time.perf_counter()
+        out = fn()
+        tracker.add(time.perf_counter() - t0)
+        return out
+    return run
+
+
+def _timed_async(fn: Callable[[], Awaitable[T]], tracker: LatencyTracker) -> Callable[[], Awaitable[T]]:
+    async def run() -> T:
+        t0 = time.perf_counter()
+        out = await fn()
+        tracker.add(time.perf_counter() - t0)
+        return out
+    return run
+
+
+def hedged(fn: Callable[[], T], tracker: LatencyTracker = embed_latency, enabled: bool = HEDGE_EMBED) -> T:
+    """
+    Llama fn(); si tarda más que tracker.threshold(), lanza una segunda llamada
+    idéntica y devuelve la primera respuesta exitosa.
+    """
+    fn = _timed(fn, tracker)
+    delay = tracker.threshold() if enabled else None
+    if delay is None:
+        return fn()
+
+    pool = _get_hedge_pool()
+    first = pool.submit(contextvars.copy_context().run, fn)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
+
+    _count("hedges")
+    second = pool.submit(contextvars.copy_context().run, fn)
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                if fut is second:
+                    _count("hedge_wins")
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+async def hedged_async(fn: Callable[[], Awaitable[T]], tracker: LatencyTracker = embed_latency, enabled: bool = HEDGE_EMBED) -> T:
+    """Versión async de hedged(); la llamada perdedora se cancela."""
+    fn = _timed_async(fn, tracker)
+    delay = tracker.threshold() if enabled else None
+    if delay is None:
+        return await fn()
+
+    first = asyncio.ensure_future(fn())
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        _count("hedges")
+        second = asyncio.ensure_future(fn())
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        _count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,176 @@
+# app/core/metrics.py
+# Métricas Prometheus del pipeline RAG (endpoint /metrics en main.py).
+#
+# - rag_stage_seconds{stage}: latencia por etapa (expand_query, embed, rmf_lookup,
+#   article_lookup, fallback_query, fallback, llm_first_token, ...)
+#   fallback_query es la consulta única de años (vector + keywords juntos, ver
+#   retrieval/fallback.py); reemplaza a vector_search / keyword_search, que ya no
+#   se emiten en el camino principal. keyword_search queda en rag_errors_total
+#   para retrieve_by_keywords.
+# - rag_route_total{route}, rag_used_year_total{year}, rag_evidence_count
+# - rag_errors_total{stage}, rag_cache_total{result}
+# - rag_tokens_total{kind,route}, rag_prompt_tokens_by_doc_type_total{doc_type}, rag_cost_usd_total{route}
+# - Cada etapa también queda en el trace de la petición (app/core/tracing.py)
+# - Gauges leídos al momento del scrape (pool, caches, admisión) vía register_stats()
+#
+# El costo por observación es un perf_counter() y un observe() sobre un hijo ya
+# resuelto: despreciable frente a cualquier llamada a red.
+
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.tokens import attribute_prompt_tokens, usage_cost
+from app.core.tracing import current_trace, trace_stage, trace_set
+
+STAGES = (
+    "expand_query",
+    "embed",
+    "embed_api",
+    "rmf_lookup",
+    "session_lookup",
+    "article_lookup",
+    "fallback_query",
+    "keyword_search",
+    "fallback",
+    "llm_first_token",
+    "llm_stream",
+    "pipeline",
+)
+
+ROUTES = ("rmf_rule_lookup", "article_lookup", "vector_fallback", "session_followup")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latencia por etapa del pipeline RAG", ["stage"], buckets=_LATENCY_BUCKETS)
+ERRORS = Counter("rag_errors_total", "Errores por etapa", ["stage"])
+ROUTE = Counter("rag_route_total", "Respuestas por ruta de retrieval", ["route"])
+USED_YEAR = Counter("rag_used_year_total", "Ejercicio de la normativa usada en la respuesta", ["year"])
+EVIDENCE = Histogram("rag_evidence_count", "Chunks de evidencia por respuesta", buckets=(0, 1, 2, 4, 6, 8, 12, 16, 24))
+CACHE = Counter("rag_cache_total", "Resultado de las caches de respuesta", ["result"])  # exact | semantic | miss
+TOKENS = Counter("rag_tokens_total", "Tokens de OpenAI por ruta", ["kind", "route"])  # embedding | prompt | completion
+DOC_TYPE_TOKENS = Counter("rag_prompt_tokens_by_doc_type_total", "Tokens de prompt atribuidos al doc_type de la evidencia", ["doc_type"])
+COST = Counter("rag_cost_usd_total", "Costo estimado en USD por ruta (requiere TOKEN_PRICE_*)", ["route"])
+
+# Hijos pre-resueltos: evita el lookup de labels en el camino caliente
+_stage = {s: STAGE_SECONDS.labels(s) for s in STAGES}
+_errors = {s: ERRORS.labels(s) for s in STAGES}
+_route = {r: ROUTE.labels(r) for r in ROUTES}
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    child = _stage.get(stage) or STAGE_SECONDS.labels(stage)
+    child.observe(seconds)
+    trace_stage(stage, seconds)
+
+
+def record_error(stage: str) -> None:
+    (_errors.get(stage) or ERRORS.labels(stage)).inc()
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """with stage_timer("embed"): ...  -> observa la duración y cuenta el error si falla."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:  # GeneratorExit / CancelledError (cliente que se fue) no cuentan
+        record_error(stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def record_answer(route: Optional[str], used_year: Any, evidence_count: int) -> None:
+    if route:
+        (_route.get(route) or ROUTE.labels(route)).inc()
+    USED_YEAR.labels(str(used_year)).inc()
+    EVIDENCE.observe(evidence_count)
+
+
+def record_cache(result: str) -> None:
+    CACHE.labels(result).inc()
+    trace_set("cache", "answer", result)
+
+
+def record_usage(route: str, evidence: List[Dict[str, Any]]) -> None:
+    """Al cerrar la petición: agrega el trace["usage"] por ruta y por doc_type."""
+    rt = current_trace()
+    if rt is None:
+        return
+    usage = rt.data["usage"]
+
+    for kind in ("embedding", "prompt", "completion"):
+        n = usage.get(f"{kind}_tokens", 0)
+        if n:
+            TOKENS.labels(kind, route).inc(n)
+
+    by_doc_type = attribute_prompt_tokens(usage, evidence)
+    for doc_type, n in by_doc_type.items():
+        DOC_TYPE_TOKENS.labels(doc_type).inc(n)
+    if by_doc_type:
+        usage["by_doc_type"] = by_doc_type
+
+    cost = usage_cost(usage)
+    if cost:
+        usage["cost_usd"] = cost
+        COST.labels(route).inc(cost)
+
+
+# =========================
+# Gauges desde los stats() existentes (pool, caches, admisión)
+# =========================
+
+class _StatsCollector:
+    def __init__(self):
+        self._sources: List[tuple] = []
+
+    def add(self, prefix: str, fn: Callable[[], Dict[str, Any]], label: Optional[str]) -> None:
+        self._sources.append((prefix, fn, label))
+
+    @staticmethod
+    def _numeric(v: Any) -> bool:
+        return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+    def collect(self):
+        for prefix, fn, label in self._sources:
+            try:
+                stats = fn() or {}
+            except Exception:
+                continue
+
+            if label is None:
+                for key, v in stats.items():
+                    if self._numeric(v):
+                        yield GaugeMetricFamily(f"{prefix}_{key}", f"{prefix}.{key}", value=v)
+                continue
+
+            # Un nivel de anidación -> label (p. ej. admission{lane="embed"})
+            families: Dict[str, GaugeMetricFamily] = {}
+            for part, sub in stats.items():
+                if not isinstance(sub, dict):
+                    continue
+                for key, v in sub.items():
+                    if not self._numeric(v):
+                        continue
+                    fam = families.get(key)
+                    if fam is None:
+                        fam = families[key] = GaugeMetricFamily(f"{prefix}_{key}", f"{prefix}.{key}", labels=[label])
+                    fam.add_metric([str(part)], v)
+            yield from families.values()
+
+
+_collector = _StatsCollector()
+REGISTRY.register(_collector)
+
+
+def register_stats(prefix: str, fn: Callable[[], Dict[str, Any]], label: Optional[str] = None) -> None:
+    """Expone los campos numéricos de fn() como gauges `<prefix>_<campo>` en cada scrape."""
+    _collector.add(prefix, fn, label)
+
+
+def render_metrics() -> tuple:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
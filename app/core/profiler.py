@@ -0,0 +1,121 @@
+# app/core/profiler.py
+# Profiler por muestreo, bajo demanda, para peticiones en producción.
+#
+# Se activa por petición:
+#   - header  X-Profile: <PROFILE_TOKEN>   (solo si PROFILE_TOKEN está definido)
+#   - o al azar: PROFILE_SAMPLE_RATE=0.01  (1% de las peticiones)
+#
+# Un hilo aparte toma el stack del hilo perfilado cada PROFILE_INTERVAL_MS
+# (sys._current_frames) y al terminar escribe PROFILE_DIR/<fecha>_<label>_<id>.folded
+# en formato "folded stacks" (flamegraph.pl, speedscope, inferno).
+#
+# Apagado (default) no hay hilo ni hooks: solo una comparación por petición.
+# En endpoints async se muestrea el hilo del event loop, así que el perfil incluye
+# lo que otras peticiones concurrentes hagan en ese lapso.
+
+import os
+import sys
+import time
+import uuid
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_S = float(os.getenv("PROFILE_MAX_S", "120"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".profiles")
+
+_MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Muestrea el stack de un hilo a intervalos fijos y acumula stacks colapsados."""
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS, max_s: float = PROFILE_MAX_S):
+        self.thread_id = thread_id
+        self.interval_s = max(0.001, interval_ms / 1000.0)
+        self.max_s = max_s
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.profile_id}", daemon=True)
+        self._t0 = 0.0
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return name.replace(";", ":").replace(" ", "_")
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None and len(stack) < _MAX_DEPTH:
+            stack.append(self._frame_name(frame))
+            frame = frame.f_back
+        self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        deadline = self._t0 + self.max_s
+        while not self._stop.wait(self.interval_s):
+            if time.monotonic() > deadline:
+                return
+            self._sample()
+
+    def start(self) -> "SamplingProfiler":
+        self._t0 = time.monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, label: str, directory: str = PROFILE_DIR) -> Optional[str]:
+        if not self.counts:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        safe_label = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in label)
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{safe_label}_{self.profile_id}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.counts.most_common():
+                f.write(f"{stack} {n}\n")
+        return path
+
+
+def should_profile(header_value: Optional[str] = None) -> bool:
+    """Header con el token correcto, o muestreo aleatorio. Apagado por default."""
+    if PROFILE_TOKEN is not None and header_value == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profiled(label: str, enabled: bool) -> Iterator[Optional[SamplingProfiler]]:
+    """
+    with profiled("chat", should_profile(hdr)) as prof: ...
+    Perfila el hilo actual mientras dura el bloque; `prof` es None si no aplica.
+    """
+    if not enabled:
+        yield None
+        return
+
+    prof = SamplingProfiler(threading.get_ident()).start()
+    try:
+        yield prof
+    finally:
+        prof.stop()
+        try:
+            path = prof.write(label)
+            if path:
+                print(f"🔥 Perfil escrito: {path} ({prof.samples} muestras)")
+        except OSError as e:
+            print(f"⚠️ No se pudo escribir el perfil: {e}")
@@ -1,5 +1,5 @@
 import os
-from supabase import create_client, Client
+import threading
 from dotenv import load_dotenv
 
 # Cargar las variables del archivo .env (asegúrate de que el .env esté en la raíz del proyecto)
@@ -9,10 +9,28 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("⚠️ Error: Faltan las credenciales SUPABASE_URL o SUPABASE_KEY en el archivo .env")
+# El cliente se crea en el primer uso: importar este módulo no abre conexiones
+_client = None
+_lock = threading.Lock()
 
-# Crear y exportar la instancia del cliente
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-print("✅ Conexión a Supabase inicializada correctamente.")
\ No newline at end of file
+def get_supabase():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise ValueError("⚠️ Error: Faltan las credenciales SUPABASE_URL o SUPABASE_KEY en el archivo .env")
+
+                from supabase import create_client
+
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                print("✅ Conexión a Supabase inicializada correctamente.")
+    return _client
+
+
+def __getattr__(name):
+    # Compatibilidad: `from app.core.supabase_client import supabase`
+    if name == "supabase":
+        return get_supabase()
+    raise AttributeError(name)
@@ -0,0 +1,138 @@
+# app/core/tokens.py
+# Conteo de tokens y costo por petición (embeddings + chat).
+#
+# - Se usa lo que reporta la API: `usage` de embeddings y, en el stream del chat,
+#   el último chunk con stream_options={"include_usage": True}.
+# - Si el stream se corta antes (cliente que se fue, error), se estima con tiktoken
+#   y el trace queda marcado con "estimated": true.
+# - Sin tiktoken, o si no se puede descargar su encoding, ~4 caracteres por token.
+#   El warm-up precarga el encoding (preload_encoding) para no descargarlo dentro
+#   de una petición.
+# - Todo se acumula en trace["usage"]; metrics.record_usage lo agrega por ruta y
+#   por doc_type de la evidencia al terminar la petición.
+#
+# Precios opcionales (USD por millón de tokens); sin precio no se calcula costo:
+#   TOKEN_PRICE_EMBED_PER_1M, TOKEN_PRICE_PROMPT_PER_1M, TOKEN_PRICE_COMPLETION_PER_1M
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from app.core.config import MODEL_CHAT
+from app.core.tracing import current_trace, trace_add, trace_set
+
+PRICE_PER_1M = {
+    "embedding_tokens": float(os.getenv("TOKEN_PRICE_EMBED_PER_1M", "0") or 0),
+    "prompt_tokens": float(os.getenv("TOKEN_PRICE_PROMPT_PER_1M", "0") or 0),
+    "completion_tokens": float(os.getenv("TOKEN_PRICE_COMPLETION_PER_1M", "0") or 0),
+}
+
+# Overhead aproximado del formato de chat por mensaje (guía de OpenAI)
+_TOKENS_PER_MESSAGE = 4
+_TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    # lru_cache también guarda el None: un fallo no se reintenta en cada petición
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Sin el BPE en cache tiktoken lo descarga; sin salida a internet eso falla
+        print(f"⚠️ tiktoken sin encoding para {model} ({e}); se estima ~4 caracteres por token")
+        return None
+
+
+def preload_encoding(model: str = MODEL_CHAT) -> str:
+    """Carga (y si hace falta descarga) el encoding fuera de las peticiones. Para el warm-up."""
+    return "tiktoken" if _encoding(model) is not None else "estimate"
+
+
+def count_tokens(text: str, model: str = MODEL_CHAT) -> int:
+    """Tokens de un texto; sin tiktoken (o sin su encoding), ~4 caracteres por token."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = MODEL_CHAT) -> str:
+    """Primeros `max_tokens` tokens del texto."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _encoding(model)
+    if enc is None:
+        return text[: 4 * max_tokens]
+    ids = enc.encode(text, disallowed_special=())
+    return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = MODEL_CHAT) -> int:
+    return sum(_TOKENS_PER_MESSAGE + count_tokens(m.get("content") or "", model) for m in messages) + _TOKENS_PER_REPLY
+
+
+# =========================
+# Registro en el trace de la petición
+# =========================
+
+def record_embedding_usage(resp: Any) -> None:
+    usage = getattr(resp, "usage", None)
+    tokens = getattr(usage, "total_tokens", None) or getattr(usage, "prompt_tokens", None) or 0
+    trace_add("usage", "embedding_tokens", tokens)
+
+
+def record_chat_usage(messages: List[Dict[str, str]], usage: Any, completion_text: str) -> None:
+    """Llamar al cerrar el stream del LLM, con o sin `usage` de la API."""
+    if current_trace() is None:
+        return
+
+    if usage is not None:
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+    else:
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(completion_text)
+        trace_set("usage", "estimated", True)
+
+    trace_add("usage", "prompt_tokens", prompt_tokens)
+    trace_add("usage", "completion_tokens", completion_tokens)
+    # Para repartir el prompt entre doc_types (ver attribute_prompt_tokens)
+    trace_add("usage", "prompt_chars", sum(len(m.get("content") or "") for m in messages))
+
+
+def usage_cost(usage: Dict[str, Any]) -> Optional[float]:
+    if not any(PRICE_PER_1M.values()):
+        return None
+    return round(sum(usage.get(k, 0) * price / 1_000_000 for k, price in PRICE_PER_1M.items()), 6)
+
+
+def attribute_prompt_tokens(usage: Dict[str, Any], evidence: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Reparte prompt_tokens entre los doc_type de la evidencia en proporción a los
+    caracteres que cada uno aporta al prompt. El resto (instrucciones, historial,
+    pregunta) queda en "overhead".
+    """
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    prompt_chars = usage.get("prompt_chars", 0)
+    if not prompt_tokens or not prompt_chars:
+        return {}
+
+    chars: Dict[str, int] = {}
+    for e in evidence:
+        doc_type = e.get("doc_type") or "desconocido"
+        chars[doc_type] = chars.get(doc_type, 0) + len(e.get("chunk_text") or "")
+
+    out: Dict[str, int] = {}
+    for doc_type, n in chars.items():
+        out[doc_type] = int(prompt_tokens * min(1.0, n / prompt_chars))
+    out["overhead"] = max(0, prompt_tokens - sum(out.values()))
+    return out
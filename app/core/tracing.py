@@ -0,0 +1,129 @@
+# app/core/tracing.py
+# Trace estructurado por petición, guardado en un ring buffer del servidor.
+#
+# Cada pregunta abre un RequestTrace (contextvar) y las etapas lo van llenando:
+#   - stages:      [{"stage": "embed", "ms": 182.4}, ...]   (desde metrics.stage_timer)
+#   - sql:         [{"stage": "rmf_lookup", "rows": 2}, ...]
+#   - years_tried: [{"year": 2025, "vector_rows": 0, "keyword_rows": 0}, ...]
+#   - cache:       {"answer": "exact|semantic|miss", "embedding": "hit|miss"}
+#   - usage:       {"embedding_tokens", "prompt_tokens", "completion_tokens", "by_doc_type", "cost_usd"}
+#   - result:      el debug de siempre (ruta, evidencia, fuentes con extracto)
+#
+# Los endpoints devuelven solo el trace_id; el detalle se pide a /trace/{id}.
+
+import os
+import time
+import uuid
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+TRACE_STORE_MAX = int(os.getenv("TRACE_STORE_MAX", "1000"))
+
+
+class RequestTrace:
+    def __init__(self, question: str, ejercicio: int, regimen: str):
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.data: Dict[str, Any] = {
+            "trace_id": self.trace_id,
+            "created_at": time.time(),
+            "question": question,
+            "ejercicio": ejercicio,
+            "regimen": regimen,
+            "status": "running",
+            "cache": {},
+            "usage": {},
+            "stages": [],
+            "sql": [],
+            "years_tried": [],
+        }
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        self.data["stages"].append({"stage": stage, "ms": round(1000 * seconds, 2)})
+
+    def finish(self, status: str = "ok", result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        self.data["status"] = status
+        self.data["total_ms"] = round(1000 * (time.perf_counter() - self.started), 2)
+        if result is not None:
+            self.data["result"] = result
+        if error is not None:
+            self.data["error"] = error
+
+
+class TraceStore:
+    """Ring buffer acotado por número de traces. Thread-safe."""
+
+    def __init__(self, max_entries: int = TRACE_STORE_MAX):
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[str, RequestTrace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, rt: RequestTrace) -> None:
+        with self._lock:
+            self._data[rt.trace_id] = rt
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rt = self._data.get(trace_id)
+            return dict(rt.data) if rt is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._data), "max_entries": self.max_entries}
+
+
+trace_store = TraceStore()
+
+_current: "contextvars.ContextVar[Optional[RequestTrace]]" = contextvars.ContextVar("rag_trace", default=None)
+
+
+# =========================
+# API para el pipeline
+# =========================
+
+def start_trace(question: str, ejercicio: int, regimen: str) -> RequestTrace:
+    """Abre el trace de la petición actual; queda visible en /trace/{id} desde ya."""
+    rt = RequestTrace(question, ejercicio, regimen)
+    trace_store.put(rt)
+    _current.set(rt)
+    return rt
+
+
+def end_trace() -> None:
+    _current.set(None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def trace_stage(stage: str, seconds: float) -> None:
+    rt = _current.get()
+    if rt is not None:
+        rt.add_stage(stage, seconds)
+
+
+def trace_set(section: str, key: str, value: Any) -> None:
+    """trace_set("cache", "answer", "exact")"""
+    rt = _current.get()
+    if rt is not None:
+        rt.data.setdefault(section, {})[key] = value
+
+
+def trace_add(section: str, key: str, n: float) -> None:
+    """trace_add("usage", "prompt_tokens", 1834)  -> acumula"""
+    rt = _current.get()
+    if rt is not None and n:
+        bucket = rt.data.setdefault(section, {})
+        bucket[key] = bucket.get(key, 0) + n
+
+
+def trace_append(section: str, item: Dict[str, Any]) -> None:
+    """trace_append("sql", {"stage": "rmf_lookup", "rows": 2})"""
+    rt = _current.get()
+    if rt is not None:
+        rt.data.setdefault(section, []).append(item)
@@ -0,0 +1,201 @@
+# app/services/admission.py
+# Control de admisión (backpressure) para el trabajo que va a OpenAI.
+#
+# Dos carriles independientes, "embed" y "chat", cada uno con:
+#   - límite de llamadas concurrentes
+#   - cola de espera acotada (si está llena se rechaza de inmediato -> 429)
+#   - presupuesto de espera en cola (si se agota se rechaza -> 503)
+#
+# Sirve igual a hilos (pipeline sync, CLI por lotes) y a corrutinas (pipeline
+# async): la cola es FIFO y común para ambos.
+
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Deque, Dict, Iterator, AsyncIterator, Optional
+
+
+class AdmissionRejected(Exception):
+    """El carril está saturado; el cliente debe reintentar después de `retry_after` s."""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        self.lane = lane
+        self.reason = reason  # "queue_full" | "wait_timeout"
+        self.retry_after = retry_after
+        self.status_code = 429 if reason == "queue_full" else 503
+        super().__init__(f"Servicio saturado ({lane}: {reason}); reintenta en {retry_after}s")
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop is not None else None
+
+    def grant(self) -> None:
+        # Se llama con el lock del carril tomado
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionLane:
+    """Semáforo con cola FIFO acotada y presupuesto de espera."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait_s: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max(0.0, max_wait_s)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_wait_timeout = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self.hold_total_s = 0.0
+        self.released = 0
+
+    # -----------------------------
+    # Internos (con lock)
+    # -----------------------------
+
+    def _retry_after(self) -> int:
+        # Tiempo estimado para que se vacíe la cola actual al ritmo observado
+        avg_hold = self.hold_total_s / self.released if self.released else 1.0
+        return max(1, math.ceil(avg_hold * (len(self._waiters) + 1) / self.limit))
+
+    def _enter_or_enqueue(self, waiter: _Waiter) -> bool:
+        if self._in_use < self.limit and not self._waiters:
+            self._in_use += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(self.name, "queue_full", self._retry_after())
+        self._waiters.append(waiter)
+        return False
+
+    def _give_up(self, waiter: _Waiter, timed_out: bool = True) -> bool:
+        """Se deja de esperar. True si de todos modos alcanzó a recibir el lugar."""
+        if waiter.granted:
+            return True
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        if timed_out:
+            self.rejected_wait_timeout += 1
+        return False
+
+    def _admitted(self, waited_s: float) -> None:
+        self.admitted += 1
+        self.wait_total_s += waited_s
+        self.wait_max_s = max(self.wait_max_s, waited_s)
+
+    def _release(self, held_s: float) -> None:
+        with self._lock:
+            self.released += 1
+            self.hold_total_s += held_s
+            # El lugar pasa directo al siguiente en la fila (in_use no cambia)
+            if self._waiters:
+                self._waiters.popleft().grant()
+            else:
+                self._in_use -= 1
+
+    # -----------------------------
+    # API
+    # -----------------------------
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        t0 = time.monotonic()
+        waiter = _Waiter()
+        with self._lock:
+            entered = self._enter_or_enqueue(waiter)
+        if not entered:
+            waiter.event.wait(self.max_wait_s)
+            with self._lock:
+                if not self._give_up(waiter):
+                    raise AdmissionRejected(self.name, "wait_timeout", self._retry_after())
+        t1 = time.monotonic()
+        with self._lock:
+            self._admitted(t1 - t0)
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - t1)
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        t0 = time.monotonic()
+        waiter = _Waiter(asyncio.get_running_loop())
+        with self._lock:
+            entered = self._enter_or_enqueue(waiter)
+        if not entered:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait_s)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if not self._give_up(waiter):
+                        raise AdmissionRejected(self.name, "wait_timeout", self._retry_after())
+            except asyncio.CancelledError:
+                # El cliente se fue: si ya teníamos lugar, lo devolvemos
+                with self._lock:
+                    granted = self._give_up(waiter, timed_out=False)
+                if granted:
+                    self._release(0.0)
+                raise
+        t1 = time.monotonic()
+        with self._lock:
+            self._admitted(t1 - t0)
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - t1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_use": self._in_use,
+                "queue_depth": len(self._waiters),
+                "max_queue": self.max_queue,
+                "max_wait_s": self.max_wait_s,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_wait_timeout": self.rejected_wait_timeout,
+                "avg_wait_ms": round(1000 * self.wait_total_s / self.admitted, 1) if self.admitted else 0.0,
+                "max_wait_ms": round(1000 * self.wait_max_s, 1),
+            }
+
+
+embed_admission = AdmissionLane(
+    "embed",
+    limit=int(os.getenv("ADMISSION_EMBED_LIMIT", "16")),
+    max_queue=int(os.getenv("ADMISSION_EMBED_QUEUE", "64")),
+    max_wait_s=float(os.getenv("ADMISSION_EMBED_MAX_WAIT_S", "3")),
+)
+
+chat_admission = AdmissionLane(
+    "chat",
+    limit=int(os.getenv("ADMISSION_CHAT_LIMIT", "32")),
+    max_queue=int(os.getenv("ADMISSION_CHAT_QUEUE", "64")),
+    max_wait_s=float(os.getenv("ADMISSION_CHAT_MAX_WAIT_S", "5")),
+)
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {"embed": embed_admission.stats(), "chat": chat_admission.stats()}
@@ -0,0 +1,143 @@
+# app/services/cache/answer_cache.py
+# Cache exacta de respuestas (LRU + TTL) delante de generate_response_with_rag.
+#
+# Llave: pregunta normalizada (sin acentos, mayúsculas ni puntuación) + ejercicio
+# + régimen. Cada entrada guarda la versión del corpus con que se generó: si
+# reingest.py cambia la versión, la cache se vacía sola.
+#
+# Segundo nivel en shared_backend (SQLite del host o Redis), común a todos los
+# workers: la versión va dentro de la llave compartida, así que un corpus nuevo
+# nunca lee respuestas viejas (esas expiran solas por TTL).
+
+import os
+import re
+import json
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.services.cache.shared_backend import CacheBackend, shared_backend
+
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "1000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """'¿Qué dice el Artículo 27 de la LISR?' -> 'que dice el articulo 27 de la lisr'"""
+    q = unicodedata.normalize("NFKD", question or "")
+    q = "".join(ch for ch in q if not unicodedata.combining(ch)).lower()
+    q = _PUNCT_RE.sub(" ", q)
+    return _SPACES_RE.sub(" ", q).strip()
+
+
+def answer_cache_key(question: str, ejercicio: int, regimen: str) -> str:
+    return f"{ejercicio}|{normalize_question(regimen or 'General')}|{normalize_question(question)}"
+
+
+def _shared_key(key: str, version: str) -> str:
+    return "ans:" + hashlib.sha256(f"{version}\x00{key}".encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """LRU acotado por número de entradas, con expiración por TTL, + nivel compartido. Thread-safe."""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX, ttl_s: float = ANSWER_CACHE_TTL_S, backend: CacheBackend = shared_backend):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.backend = backend
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version: str) -> None:
+        # Cambió el corpus: nada de lo cacheado es confiable
+        if version != self._version:
+            if self._data:
+                self.invalidations += 1
+            self._data.clear()
+            self._version = version
+
+    def _local_put(self, key: str, entry: Dict[str, Any]) -> None:
+        self._data[key] = (time.monotonic(), entry)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str, version: str) -> Optional[Dict[str, Any]]:
+        """Memoria del proceso y, si no está, el nivel compartido (I/O: desde async usar to_thread)."""
+        with self._lock:
+            self._sync_version(version)
+            item = self._data.get(key)
+            if item is not None and time.monotonic() - item[0] <= self.ttl_s:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+
+        blob = self.backend.get(_shared_key(key, version))
+        entry = json.loads(blob) if blob is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            if version == self._version:
+                self._local_put(key, entry)
+        return entry
+
+    def put(self, key: str, version: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sync_version(version)
+            self._local_put(key, entry)
+        blob = json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8")
+        self.backend.set(_shared_key(key, version), blob, self.ttl_s)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "corpus_version": self._version,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache()
+
+
+# =========================
+# Helpers para los orquestadores (sync / async)
+# =========================
+
+def replay_cached(entry: Dict[str, Any], kind: str = "exact") -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Eventos meta + delta equivalentes a los del pipeline, servidos desde cache (`kind`: exact | semantic)."""
+    yield "meta", {**entry["meta"], "cache": kind}
+    yield "delta", {"text": entry["answer"]}
+
+
+def cached_debug(entry: Dict[str, Any], kind: str = "exact", extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {**entry["debug"], "cache": kind, **(extra or {})}
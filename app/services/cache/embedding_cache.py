@@ -0,0 +1,135 @@
+# app/services/cache/embedding_cache.py
+# Cache de embeddings en dos niveles, llave = sha256(modelo + texto).
+#
+#   1) LRU en memoria (por proceso), vectores float32 compactos.
+#   2) Backend compartido (shared_backend: SQLite del host o Redis): sobrevive
+#      reinicios y lo comparten todos los workers. SHARED_CACHE_URL="" lo desactiva.
+#
+# expand_query es determinista, así que la misma pregunta produce el mismo texto a
+# embeber: un hit evita 150-400 ms y una llamada con rate limit.
+
+import os
+import threading
+import hashlib
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.services.cache.shared_backend import CacheBackend, shared_backend
+
+EMBED_CACHE_MAX = int(os.getenv("EMBED_CACHE_MAX", "5000"))
+
+_PREFIX = "emb:"
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    a = array("f")
+    a.frombytes(blob)
+    return a.tolist()
+
+
+class EmbeddingCache:
+    """LRU en memoria + backend compartido. Thread-safe."""
+
+    def __init__(self, max_entries: int = EMBED_CACHE_MAX, backend: CacheBackend = shared_backend):
+        self.max_entries = max(1, max_entries)
+        self.backend = backend
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _shared_get(self, keys: List[str]) -> Dict[str, bytes]:
+        found = self.backend.get_many([_PREFIX + k for k in keys])
+        return {k[len(_PREFIX):]: v for k, v in found.items()}
+
+    def _shared_put(self, items: Dict[str, bytes]) -> None:
+        # Los embeddings no caducan: mismo modelo + texto = mismo vector
+        self.backend.set_many({_PREFIX + k: v for k, v in items.items()})
+
+    # -----------------------------
+    # Memoria
+    # -----------------------------
+
+    def _mem_put(self, key: str, blob: bytes) -> None:
+        self._mem[key] = blob
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    # -----------------------------
+    # API
+    # -----------------------------
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vector por texto (None si no está en ningún nivel)."""
+        keys = [embedding_key(model, t) for t in texts]
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, k in enumerate(keys):
+                blob = self._mem.get(k)
+                if blob is not None:
+                    self._mem.move_to_end(k)
+                    self.memory_hits += 1
+                    out[i] = _unpack(blob)
+                else:
+                    pending.setdefault(k, []).append(i)
+
+        if not pending:
+            return out
+
+        found = self._shared_get(list(pending))
+        with self._lock:
+            for k, idxs in pending.items():
+                blob = found.get(k)
+                if blob is None:
+                    self.misses += len(idxs)
+                    continue
+                self.shared_hits += len(idxs)
+                self._mem_put(k, blob)
+                for i in idxs:
+                    out[i] = _unpack(blob)
+        return out
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: List[str], vecs: List[List[float]]) -> None:
+        items = {embedding_key(model, t): _pack(v) for t, v in zip(texts, vecs) if v is not None}
+        with self._lock:
+            for k, blob in items.items():
+                self._mem_put(k, blob)
+            self.writes += len(items)
+        self._shared_put(items)
+
+    def put(self, model: str, text: str, vec: List[float]) -> None:
+        self.put_many(model, [text], [vec])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.memory_hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._mem),
+                "max_entries": self.max_entries,
+                "shared_backend": self.backend.name,
+                "memory_hits": self.memory_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                "writes": self.writes,
+            }
+
+
+embedding_cache = EmbeddingCache()
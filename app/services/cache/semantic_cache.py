@@ -0,0 +1,154 @@
+# app/services/cache/semantic_cache.py
+# Cache semántica de respuestas: vecino más cercano sobre los embeddings de
+# preguntas anteriores.
+#
+# Paráfrasis como "límite de previsión social" y "tope de exención de previsión
+# social" no pegan en la cache exacta, pero sus embeddings quedan muy cerca y
+# resuelven a los mismos chunks. Si la similitud coseno con alguna pregunta previa
+# (mismo ejercicio/régimen y misma versión del corpus) supera el umbral, se omite
+# retrieval + LLM.
+#
+# Las preguntas con números distintos ("artículo 27" vs "artículo 28") quedan
+# muy cerca en el espacio de embeddings; por eso los números citados forman
+# parte del scope y nunca se cruzan.
+#
+# Memoria acotada: matriz float32 de SEMANTIC_CACHE_MAX x dim (~6 KB por entrada
+# con text-embedding-3-small); al llenarse se reemplaza la entrada más antigua.
+
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.cache.answer_cache import cached_debug
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_MAX = int(os.getenv("SEMANTIC_CACHE_MAX", "2000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+
+_NUMBER_RE = re.compile(r"\d+(?:[.\-]\w+)*")
+
+
+def semantic_scope(question: str, ejercicio: int, regimen: str) -> str:
+    """'Art. 27 fracción V' (2025, General) -> '2025|general|27'"""
+    numbers = ",".join(sorted(set(_NUMBER_RE.findall(question or ""))))
+    return f"{ejercicio}|{(regimen or 'General').strip().lower()}|{numbers}"
+
+
+class SemanticCache:
+    """Ring buffer de (vector normalizado, scope, entrada). Thread-safe."""
+
+    def __init__(self, capacity: int = SEMANTIC_CACHE_MAX, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.capacity = max(1, capacity)
+        self.threshold = threshold
+        self._vecs = None  # np.ndarray (capacity, dim), se crea con el primer put
+        self._scopes: List[Optional[str]] = [None] * self.capacity
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.similarity_sum = 0.0
+
+    @staticmethod
+    def _normalize(vec: List[float]):
+        import numpy as np  # perezoso: no pesa en el arranque
+
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    def _sync_version(self, version: str) -> None:
+        if version != self._version:
+            self._scopes = [None] * self.capacity
+            self._entries = [None] * self.capacity
+            self._size = 0
+            self._next = 0
+            self._version = version
+
+    def lookup(self, vec: List[float], scope: str, version: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(entrada, similitud) del vecino más cercano si supera el umbral; si no, None."""
+        import numpy as np
+
+        q = self._normalize(vec)
+        with self._lock:
+            self._sync_version(version)
+            if self._size == 0 or self._vecs is None or self._vecs.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+
+            sims = self._vecs[: self._size] @ q
+            mask = np.fromiter((s == scope for s in self._scopes[: self._size]), dtype=bool, count=self._size)
+            if not mask.any():
+                self.misses += 1
+                return None
+
+            sims = np.where(mask, sims, -1.0)
+            best = int(np.argmax(sims))
+            sim = float(sims[best])
+            if sim < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.similarity_sum += sim
+            return self._entries[best], sim
+
+    def put(self, vec: List[float], scope: str, version: str, entry: Dict[str, Any]) -> None:
+        import numpy as np
+
+        q = self._normalize(vec)
+        with self._lock:
+            self._sync_version(version)
+            if self._vecs is None or self._vecs.shape[1] != q.shape[0]:
+                self._vecs = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+                self._size = 0
+                self._next = 0
+
+            i = self._next
+            self._vecs[i] = q
+            self._scopes[i] = scope
+            self._entries[i] = entry
+            self._next = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "size": self._size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "corpus_version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_hit_similarity": round(self.similarity_sum / self.hits, 4) if self.hits else None,
+                "memory_bytes": int(self._vecs.nbytes) if self._vecs is not None else 0,
+            }
+
+
+semantic_cache = SemanticCache()
+
+
+# =========================
+# Helpers para los orquestadores (sync / async)
+# =========================
+
+def semantic_entry(question: str, plan: Dict[str, Any], answer: str, meta: Dict[str, Any], debug: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "question": question,
+        "answer": answer,
+        "meta": meta,
+        "debug": debug,
+        "chunk_ids": [e.get("chunk_id") for e in plan["evidence"]],
+    }
+
+
+def semantic_debug(hit: Tuple[Dict[str, Any], float]) -> Dict[str, Any]:
+    entry, similarity = hit
+    return cached_debug(entry, "semantic", {"cache_similarity": round(similarity, 4), "cached_question": entry["question"]})
@@ -0,0 +1,208 @@
+# app/services/cache/shared_backend.py
+# Backend de cache compartido entre workers (segundo nivel de las caches por proceso).
+#
+# Con N workers de uvicorn cada LRU en memoria se calienta N veces. Este nivel lo
+# comparten todos, así que el hit rate no cae al agregar workers:
+#
+#   SHARED_CACHE_URL=sqlite:///.cache/shared.sqlite3   (default: mismo host, WAL)
+#   SHARED_CACHE_URL=redis://localhost:6379/0          (varios hosts; cualquier servidor RESP)
+#   SHARED_CACHE_URL=                                   (desactivado: solo memoria)
+#
+# La interfaz es mínima (get_many / set_many con TTL opcional, valores bytes): las
+# caches de arriba serializan y ponen prefijo a sus llaves. Si el backend falla se
+# omite durante SHARED_CACHE_RETRY_S segundos; la petición nunca se cae por la cache.
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "sqlite:///" + os.path.join(".cache", "shared.sqlite3"))
+SHARED_CACHE_TIMEOUT_S = float(os.getenv("SHARED_CACHE_TIMEOUT_S", "0.2"))
+SHARED_CACHE_RETRY_S = float(os.getenv("SHARED_CACHE_RETRY_S", "30"))
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key        TEXT PRIMARY KEY,
+    value      BLOB NOT NULL,
+    expires_at REAL
+)
+"""
+
+# Cada cuántas escrituras se purgan las llaves expiradas (SQLite no expira solo)
+_SQLITE_PURGE_EVERY = 500
+
+
+class CacheBackend:
+    """Backend nulo; las subclases implementan _get_many / _set_many."""
+
+    name = "none"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self.gets = 0
+        self.hits = 0
+        self.sets = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.name != "none"
+
+    def _available(self) -> bool:
+        return self.enabled and time.monotonic() >= self._down_until
+
+    def _failed(self, e: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+            was_up = time.monotonic() >= self._down_until
+            self._down_until = time.monotonic() + SHARED_CACHE_RETRY_S
+        if was_up:
+            print(f"⚠️ Cache compartida ({self.name}) no disponible por {SHARED_CACHE_RETRY_S:.0f}s: {e}")
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        return {}
+
+    def _set_many(self, items: Dict[str, bytes], ttl_s: Optional[float]) -> None:
+        pass
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not keys or not self._available():
+            return {}
+        try:
+            found = self._get_many(keys)
+        except Exception as e:
+            self._failed(e)
+            return {}
+        with self._lock:
+            self.gets += len(keys)
+            self.hits += len(found)
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, bytes], ttl_s: Optional[float] = None) -> None:
+        if not items or not self._available():
+            return
+        try:
+            self._set_many(items, ttl_s)
+        except Exception as e:
+            self._failed(e)
+            return
+        with self._lock:
+            self.sets += len(items)
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        self.set_many({key: value}, ttl_s)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "available": self._available(),
+                "gets": self.gets,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.gets, 4) if self.gets else 0.0,
+                "sets": self.sets,
+                "errors": self.errors,
+            }
+
+
+class SQLiteBackend(CacheBackend):
+    """Archivo SQLite en WAL: lo comparten los workers del mismo host. Una conexión por hilo."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SQLITE_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        marks = ",".join("?" * len(keys))
+        rows = self._db().execute(
+            f"SELECT key, value FROM kv WHERE key IN ({marks}) AND (expires_at IS NULL OR expires_at > ?)",
+            [*keys, time.time()],
+        ).fetchall()
+        return {k: bytes(v) for k, v in rows}
+
+    def _set_many(self, items: Dict[str, bytes], ttl_s: Optional[float]) -> None:
+        now = time.time()
+        expires_at = now + ttl_s if ttl_s else None
+        conn = self._db()
+        conn.executemany(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            [(k, v, expires_at) for k, v in items.items()],
+        )
+        with self._lock:
+            self._writes += len(items)
+            purge = self._writes >= _SQLITE_PURGE_EVERY
+            if purge:
+                self._writes = 0
+        if purge:
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+
+class RedisBackend(CacheBackend):
+    """Cualquier servidor que hable el protocolo de Redis (Redis, Valkey, KeyDB, ...)."""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._client = None
+
+    def _redis(self):
+        if self._client is None:
+            import redis
+
+            # RESP2: lo habla cualquier servidor compatible (sin HELLO/RESP3)
+            self._client = redis.Redis.from_url(
+                self.url,
+                protocol=2,
+                socket_timeout=SHARED_CACHE_TIMEOUT_S,
+                socket_connect_timeout=SHARED_CACHE_TIMEOUT_S,
+            )
+        return self._client
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        values = self._redis().mget(keys)
+        return {k: v for k, v in zip(keys, values) if v is not None}
+
+    def _set_many(self, items: Dict[str, bytes], ttl_s: Optional[float]) -> None:
+        pipe = self._redis().pipeline(transaction=False)
+        for k, v in items.items():
+            pipe.set(k, v, ex=max(1, int(ttl_s)) if ttl_s else None)
+        pipe.execute()
+
+
+def make_backend(url: Optional[str] = SHARED_CACHE_URL) -> CacheBackend:
+    url = (url or "").strip()
+    if not url:
+        return CacheBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"SHARED_CACHE_URL no soportada: {url!r} (usa sqlite:///ruta o redis://host:puerto/db)")
+
+
+shared_backend = make_backend()
@@ -0,0 +1,97 @@
+# app/services/corpus_version.py
+# Versión del corpus (tabla public.corpus_version, ver migrations/001_corpus_version.sql).
+#
+# reingest.py escribe un sello nuevo al terminar; aquí lo leemos como mucho cada
+# CORPUS_VERSION_REFRESH_S segundos. Las caches usan la versión como parte de la llave.
+
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+from app.core.db import db_connection, async_db_connection
+
+CORPUS_VERSION_REFRESH_S = float(os.getenv("CORPUS_VERSION_REFRESH_S", "30"))
+
+CORPUS_VERSION_SQL = "SELECT version FROM public.corpus_version WHERE id = 1"
+
+_lock = threading.Lock()
+# checked_at también se guarda cuando la lectura falla (sin migración 001, base
+# caída): el fallo se reintenta como mucho cada CORPUS_VERSION_REFRESH_S
+_state = {"version": None, "checked_at": None, "warned": False}
+
+
+def _cached() -> Tuple[bool, Optional[str]]:
+    """(vigente, versión); vigente=False si hay que volver a leer la tabla."""
+    with _lock:
+        checked_at = _state["checked_at"]
+        fresh = checked_at is not None and time.monotonic() - checked_at < CORPUS_VERSION_REFRESH_S
+        return fresh, _state["version"]
+
+
+def _store(row) -> Optional[str]:
+    version = str(row[0]) if row and row[0] is not None else None
+    with _lock:
+        _state["version"] = version
+        _state["checked_at"] = time.monotonic()
+    return version
+
+
+def _failed(e: Exception) -> None:
+    # Sin tabla de versión no hay forma segura de invalidar: las caches se desactivan
+    with _lock:
+        _state["version"] = None
+        _state["checked_at"] = time.monotonic()
+        if _state["warned"]:
+            return
+        _state["warned"] = True
+    print(f"⚠️ No se pudo leer public.corpus_version (caches desactivadas, reintento cada {CORPUS_VERSION_REFRESH_S:g}s): {e}")
+
+
+def _read(conn) -> Optional[str]:
+    with conn.cursor() as cur:
+        cur.execute(CORPUS_VERSION_SQL)
+        return _store(cur.fetchone())
+
+
+def get_corpus_version(conn=None) -> Optional[str]:
+    """
+    Versión actual del corpus o None si no se puede determinar.
+
+    conn: conexión que el llamador ya tiene tomada. Así la lectura no pide una
+    segunda conexión al pool mientras la primera sigue ocupada (con el pool
+    saturado eso termina en timeouts de checkout). Las conexiones del pool son
+    autocommit: un error aquí no deja la transacción del llamador abortada.
+    """
+    fresh, version = _cached()
+    if fresh:
+        return version
+    try:
+        if conn is not None:
+            return _read(conn)
+        with db_connection() as c:
+            return _read(c)
+    except Exception as e:
+        _failed(e)
+        return None
+
+
+async def _read_async(aconn) -> Optional[str]:
+    async with aconn.cursor() as cur:
+        await cur.execute(CORPUS_VERSION_SQL)
+        return _store(await cur.fetchone())
+
+
+async def get_corpus_version_async(aconn=None) -> Optional[str]:
+    """Igual que get_corpus_version, con el pool async (o la conexión aconn del llamador)."""
+    fresh, version = _cached()
+    if fresh:
+        return version
+    try:
+        if aconn is not None:
+            return await _read_async(aconn)
+        async with async_db_connection() as c:
+            return await _read_async(c)
+    except Exception as e:
+        _failed(e)
+        return None
@@ -0,0 +1,79 @@
+# app/services/embedding_batcher.py
+# Agrupa llamadas a embed_text de varios hilos en una sola petición de embeddings.
+#
+# Uso típico (CLI por lotes):
+#   batcher = EmbeddingBatcher(embed_texts, max_batch=64, max_wait_ms=25)
+#   install_embedding_batcher(batcher)   # rag_engine.embed_text pasa por aquí
+#   ...
+#   batcher.close()
+
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+
+class EmbeddingBatcher:
+    """
+    Cada hilo llama embed(text) y se bloquea hasta tener su vector; un hilo de fondo
+    junta hasta `max_batch` textos (o lo que llegue en `max_wait_ms`) y hace UNA
+    llamada a `embed_many`.
+    """
+
+    def __init__(self, embed_many: Callable[[List[str]], List[List[float]]], max_batch: int = 64, max_wait_ms: int = 25):
+        self._embed_many = embed_many
+        self._max_batch = max(1, max_batch)
+        self._max_wait = max(0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._closed = False
+        self.calls = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, text: str) -> List[float]:
+        if self._closed:
+            raise RuntimeError("EmbeddingBatcher cerrado")
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut.result()
+
+    def close(self) -> None:
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stop = False
+            # Junta lo que llegue durante la ventana, sin pasar de max_batch
+            while len(batch) < self._max_batch:
+                try:
+                    nxt = self._queue.get(timeout=self._max_wait)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: List[Tuple[str, Future]]) -> None:
+        texts = [t for t, _ in batch]
+        try:
+            vecs = self._embed_many(texts)
+            self.calls += 1
+            self.texts += len(texts)
+            for (_, fut), vec in zip(batch, vecs):
+                fut.set_result(vec)
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
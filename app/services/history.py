@@ -0,0 +1,92 @@
+# app/services/history.py
+# Historial de conversación con presupuesto de tokens.
+#
+# Antes: history[-4:] tal cual. Dos respuestas legales largas podían duplicar el
+# prompt, y lo anterior a esos 4 mensajes se perdía aunque fuera relevante.
+#
+# Ahora (compact_history):
+#   - Los mensajes más recientes van íntegros mientras quepan en HISTORY_TOKEN_BUDGET.
+#     Si el último por sí solo no cabe, se recorta.
+#   - Los anteriores se reducen a una línea: la pregunta (recortada) o las citas
+#     que usó la respuesta (Art. 27 LISR, Regla 3.5.1, ...). Esas líneas van en un
+#     mensaje de sistema acotado a HISTORY_SUMMARY_MAX_TOKENS.
+# Así los tokens de historial por turno quedan acotados aunque la sesión sea larga.
+
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from app.core.tokens import count_tokens, truncate_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+
+_QUESTION_CHARS = 160
+_MAX_CITATIONS = 8
+
+# "Art. 27 LISR", "Artículo 69-B del CFF", "Regla 3.5.1", "regla 2.7.1.46"
+CITATION_RE = re.compile(
+    r"(?i)\b(?:art(?:[ií]culo|\.)\s*\d{1,3}(?:\s*[-–]\s*[a-z]\b)?(?:\s*bis\b)?"
+    r"(?:\s+(?:de\s+la\s+|del\s+)?(?:LISR|LIVA|LIEPS|CFF|RLISR|RCFF|LFT|LSS))?"
+    r"|regla\s+\d+(?:\.\d+){1,5})"
+)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def message_tokens(m: Dict[str, Any]) -> int:
+    """Tokens del contenido; las sesiones ya traen el conteo en m["tokens"]."""
+    n = m.get("tokens")
+    return n if isinstance(n, int) else count_tokens(m.get("content") or "")
+
+
+def citations(text: str) -> List[str]:
+    seen: Dict[str, str] = {}
+    for m in CITATION_RE.finditer(text or ""):
+        ref = _SPACES_RE.sub(" ", m.group(0)).strip()
+        seen.setdefault(ref.lower(), ref)
+        if len(seen) >= _MAX_CITATIONS:
+            break
+    return list(seen.values())
+
+
+def compact_line(m: Dict[str, Any]) -> str:
+    content = _SPACES_RE.sub(" ", m.get("content") or "").strip()
+    if m.get("role") == "user":
+        return "P: " + (content[:_QUESTION_CHARS] + "…" if len(content) > _QUESTION_CHARS else content)
+    refs = citations(content)
+    return "R: citó " + ", ".join(refs) if refs else "R: (sin citas)"
+
+
+def compact_history(history: List[Dict[str, Any]], budget: int = HISTORY_TOKEN_BUDGET) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """Mensajes listos para el LLM + resumen {kept, summarized, tokens} para el trace."""
+    kept: List[Dict[str, str]] = []
+    used = 0
+    i = len(history)
+    while i > 0:
+        m = history[i - 1]
+        n = message_tokens(m)
+        if used + n > budget:
+            if not kept:
+                # El mensaje más reciente es el que más importa: recortado, pero va
+                kept.append({"role": m["role"], "content": truncate_tokens(m.get("content") or "", budget)})
+                used = budget
+                i -= 1
+            break
+        kept.insert(0, {"role": m["role"], "content": m.get("content") or ""})
+        used += n
+        i -= 1
+
+    lines = [compact_line(m) for m in history[:i]]
+    # Las más viejas salen primero si el resumen no cabe
+    while lines and count_tokens("\n".join(lines)) > HISTORY_SUMMARY_MAX_TOKENS:
+        lines.pop(0)
+
+    messages: List[Dict[str, str]] = []
+    summary_tokens = 0
+    if lines:
+        summary = "Turnos anteriores de la conversación (resumen y citas usadas):\n" + "\n".join(lines)
+        summary_tokens = count_tokens(summary)
+        messages.append({"role": "system", "content": summary})
+    messages.extend(kept)
+
+    return messages, {"kept": len(kept), "summarized": len(lines), "tokens": used + summary_tokens}
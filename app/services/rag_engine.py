@@ -1,22 +1,71 @@
 # app/services/rag_engine.py
-# VERSIÓN 2.0 - Con Query Expansion y top_k dinámico
+# VERSIÓN 2.1 - Con Query Expansion, top_k dinámico y streaming (SSE)
 
 import os
 import re
-import psycopg2
-from typing import List, Dict, Any, Generator
-
-from openai import OpenAI
-
-from app.core.config import OPENAI_API_KEY, DIRECT_URL, MODEL_EMBED, MODEL_CHAT
-
+import time
+import threading
+from typing import List, Dict, Any, Generator, Optional, Tuple
+
+from app.core.config import OPENAI_API_KEY, MODEL_EMBED, MODEL_CHAT
+from app.core.db import db_connection
+from app.core.metrics import stage_timer, observe_stage, record_error, record_answer, record_cache, record_usage
+from app.core.profiler import profiled, should_profile
+from app.core.deadline import (
+    DeadlineExceeded,
+    OPENAI_TIMEOUT_S,
+    start_deadline,
+    end_deadline,
+    call_timeout,
+    statement_timeout_ms,
+    check_deadline,
+    with_retries,
+    hedged,
+)
+from app.core.tokens import record_chat_usage, record_embedding_usage
+from app.core.tracing import RequestTrace, start_trace, end_trace, trace_set, trace_append
+from app.services.admission import AdmissionRejected, embed_admission, chat_admission
+from app.services.cache.embedding_cache import embedding_cache
+from app.services.cache.answer_cache import answer_cache, answer_cache_key, replay_cached, cached_debug
+from app.services.cache.semantic_cache import (
+    SEMANTIC_CACHE_ENABLED,
+    semantic_cache,
+    semantic_entry,
+    semantic_scope,
+    semantic_debug,
+)
+from app.services.corpus_version import get_corpus_version
+from app.services.history import compact_history
+from app.services.sessions import (
+    session_store,
+    session_history,
+    session_turn,
+    followup_request,
+    narrow_evidence,
+)
+
+from app.services.retrieval.chunk_lookup import get_chunks_by_ids
 from app.services.retrieval.fallback import retrieve_context_with_fallback
 from app.services.retrieval.doc_router import resolve_candidate_documents
 from app.services.retrieval.query_expansion import expand_query  # NUEVO
-from app.services.retrieval.rmf_rule_lookup import try_get_rmf_rule_chunks
+from app.services.retrieval.norm_index import lookup_rmf_rule
+
 
+# Cliente OpenAI perezoso: importar este módulo no abre nada (arranque rápido)
+_client = None
+_client_lock = threading.Lock()
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                # Reintentos propios (app/core/deadline.py): la librería no reintenta
+                _client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=OPENAI_TIMEOUT_S)
+    return _client
 
 # Obtener top_k de variables de entorno (default 12)
 TOP_K = int(os.getenv("TOP_K_DEFAULT", 12))
@@ -46,20 +95,60 @@ CONTEXTO RECUPERADO DE LA BASE DE DATOS:
 
 
 # =========================
-# DB + Embeddings
+# Embeddings
 # =========================
 
-def get_db_connection():
-    conn_str = DIRECT_URL or os.getenv("DATABASE_URL")
-    if not conn_str:
-        raise ValueError("No se encontró la cadena de conexión a la base de datos.")
-    return psycopg2.connect(conn_str)
+# Batcher opcional (CLI por lotes): si está instalado, embed_text agrupa
+# las peticiones de todos los hilos en una sola llamada a la API.
+_embedding_batcher = None
+
+
+def install_embedding_batcher(batcher) -> None:
+    global _embedding_batcher
+    _embedding_batcher = batcher
+
+
+def _create_embeddings(inputs: List[str]):
+    """Llamada a la API con timeout del deadline, reintentos y hedging."""
+    def call():
+        return get_client().embeddings.create(input=inputs, model=MODEL_EMBED, timeout=call_timeout())
+    return with_retries(lambda: hedged(call), "embed_api")
 
 
 def embed_text(text: str) -> List[float]:
     clean_text = (text or "").replace("\n", " ")
-    resp = client.embeddings.create(input=[clean_text], model=MODEL_EMBED)
-    return resp.data[0].embedding
+    cached = embedding_cache.get(MODEL_EMBED, clean_text)
+    trace_set("cache", "embedding", "hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+
+    if _embedding_batcher is not None:
+        return _embedding_batcher.embed(clean_text)  # embed_texts ya guarda en cache
+
+    with embed_admission.slot(), stage_timer("embed_api"):
+        resp = _create_embeddings([clean_text])
+    record_embedding_usage(resp)
+    vec = resp.data[0].embedding
+    embedding_cache.put(MODEL_EMBED, clean_text, vec)
+    return vec
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embeddings en lote: una sola llamada a la API para los N textos que no están en cache."""
+    if not texts:
+        return []
+    clean = [(t or "").replace("\n", " ") for t in texts]
+    vecs = embedding_cache.get_many(MODEL_EMBED, clean)
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    trace_set("cache", "embedding", "miss" if missing else "hit")
+    if missing:
+        with embed_admission.slot(), stage_timer("embed_api"):
+            resp = _create_embeddings([clean[i] for i in missing])
+        record_embedding_usage(resp)
+        for d in resp.data:
+            vecs[missing[d.index]] = d.embedding
+        embedding_cache.put_many(MODEL_EMBED, [clean[i] for i in missing], [vecs[i] for i in missing])
+    return vecs
 
 
 # =========================
@@ -93,219 +182,518 @@ def build_system_message(evidence: List[Dict[str, Any]]) -> str:
 # LLM streaming
 # =========================
 
-def generate_answer_stream(system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> Generator[str, None, None]:
+def build_messages(system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
     messages = [{"role": "system", "content": system_prompt}]
-    
+
     if history:
-        messages.extend(history[-4:])
-        
+        # Recientes íntegros dentro de HISTORY_TOKEN_BUDGET; los viejos, resumidos a sus citas
+        past, info = compact_history(history)
+        for key, value in info.items():
+            trace_set("history", key, value)
+        messages.extend(past)
+
     messages.append({"role": "user", "content": user_prompt})
+    return messages
 
-    stream = client.chat.completions.create(
-        model=MODEL_CHAT,
-        messages=messages,
-        temperature=0.2,
-        stream=True
-    )
 
-    for chunk in stream:
-        content = chunk.choices[0].delta.content
-        if content:
-            yield content
+def generate_answer_stream(system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> Generator[str, None, None]:
+    messages = build_messages(system_prompt, user_prompt, history)
+
+    # El lugar en el carril "chat" se ocupa durante todo el stream
+    with chat_admission.slot(), stage_timer("llm_stream"):
+        t0 = time.perf_counter()
+        first = True
+        usage, parts, stream = None, [], None
+        try:
+            # Solo se reintenta la apertura; un stream a medias no se repite
+            stream = with_retries(
+                lambda: get_client().chat.completions.create(
+                    model=MODEL_CHAT,
+                    messages=messages,
+                    temperature=0.2,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=call_timeout(),
+                ),
+                "llm_stream",
+            )
+
+            for chunk in stream:
+                # Un stream que gotea más allá del deadline se corta (y libera el hilo)
+                check_deadline("llm_stream")
+                # El último chunk trae solo `usage` (choices vacío)
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if first:
+                        observe_stage("llm_first_token", time.perf_counter() - t0)
+                        first = False
+                    parts.append(content)
+                    yield content
+        finally:
+            if stream is not None:
+                stream.close()
+            # Sin `usage` (stream cortado) se estima con tiktoken
+            record_chat_usage(messages, usage, "".join(parts))
 
 
-def generate_response_with_rag(
-    question: str,
-    regimen: str = "General",
-    ejercicio: int = 2025,
-    trace: bool = False,
-    history: List[Dict[str, str]] = None
-):
-    conn = None
-    try:
-        conn = get_db_connection()
+# =========================
+# Ruteo + evidencia
+# =========================
 
-        evidence: List[Dict[str, Any]] = []
-        used_year: int = ejercicio
-        expanded_question: str = question
-        keywords: List[str] = []
+# "Regla 2.1.1", "regla 2.7.1.46"
+RULE_REF_RE = re.compile(r"(?i)\bregla\s+(\d+(?:\.\d+){1,5})\b")
+
+# Cita literal estricta de una regla RMF: regresamos el chunk tal cual (sin LLM)
+RULE_QUOTE_RE = re.compile(r"(?i)\b(c[ií]tame|textualmente|cita literal|cita textual)\b")
+
+# Cita literal "amplia" (paso 2.5)
+LITERAL_RE = re.compile(r"(?i)\b(c[ií]tame|cita|textual|literal)\b")
+
+
+def detect_route(evidence: List[Dict[str, Any]]) -> str:
+    if any((e.get("source") == "session_followup") for e in evidence):
+        return "session_followup"
+    if any((e.get("source") == "rmf_rule_lookup") for e in evidence):
+        return "rmf_rule_lookup"
+    if any((e.get("source") == "article_lookup") for e in evidence):
+        return "article_lookup"
+    return "vector_fallback"
+
+
+def source_summary(e: Dict[str, Any], excerpt: bool = True) -> Dict[str, Any]:
+    s = {
+        "chunk_id": e.get("chunk_id"),
+        "document_id": e.get("document_id"),
+        "norm_kind": e.get("norm_kind"),
+        "norm_id": e.get("norm_id"),
+        "doc_type": e.get("doc_type"),
+        "source_filename": e.get("source_filename"),
+        "page_start": e.get("page_start"),
+        "page_end": e.get("page_end"),
+        "score": e.get("score"),
+        "source": e.get("source"),
+    }
+    if excerpt:
+        s["excerpt"] = (e.get("chunk_text") or "")[:200]
+    return s
+
+
+def build_trace(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Debug estándar que devuelve /chat cuando trace=true."""
+    if plan.get("debug"):
+        return plan["debug"]
+
+    evidence = plan["evidence"]
+    return {
+        "route_used": plan["route_used"],
+        "used_year": plan["used_year"],
+        "evidence_count": len(evidence),
+        "expanded_query": plan["expanded_query"],
+        "keywords": plan["keywords"],
+        "sources": [source_summary(e) for e in evidence[:8]],
+        "chunk_ids": [e.get("chunk_id") for e in evidence if e.get("chunk_id") is not None],
+    }
+
+
+def build_user_prompt(question: str, regimen: str, ejercicio: int, used_year: int) -> str:
+    note_rule = f"\n\nNota: Basado en normativa {used_year}." if used_year not in (ejercicio, 0) else ""
+
+    return (
+        f"Pregunta actual: {question}\n"
+        f"Contexto: Ejercicio {ejercicio}, Régimen {regimen}.\n"
+        f"Responde usando SOLO el contexto recuperado y mantén la continuidad de la charla."
+        f"{note_rule}"
+    )
 
-        # ------------------------------------------------------------
-        # 1) RMF: lookup exacto si la pregunta menciona "Regla X.X.X"
-        # ------------------------------------------------------------
-        m_rule = re.search(r"(?i)\bregla\s+(\d+(?:\.\d+){1,5})\b", question or "")
-        if m_rule:
-            rule_id = m_rule.group(1)
 
-            # Opcional: si quieres forzar un RMF base por año desde env:
-            # set RMF_BASE_DOC_ID_2025=RMF_2025-30122024, etc.
-            prefer_doc = os.getenv(f"RMF_BASE_DOC_ID_{ejercicio}", None)
+def select_literal_rule_chunks(evidence: List[Dict[str, Any]]) -> Tuple[str, Any, List[Dict[str, Any]]]:
+    """
+    rmf_rule_lookup suele traer 1 chunk de "índice/título" y 1+ chunks con el
+    "cuerpo" de la regla. Para cita literal queremos el cuerpo.
+    Heurística: nos quedamos con los chunks de la(s) página(s) MÁS ALTA(s).
+    """
+    # 1) Determinar la página "más profunda" (máxima) dentro de la evidencia
+    pages = [int(e.get("page_start")) for e in evidence if e.get("page_start") is not None]
+    max_page = max(pages) if pages else None
+
+    # 2) Filtrar: quedarnos con los chunks de esa página (normalmente es el cuerpo)
+    if max_page is not None:
+        selected = [e for e in evidence if int(e.get("page_start") or -1) == max_page]
+    else:
+        selected = evidence
+
+    # 3) Orden estable por página y chunk_id
+    selected = sorted(
+        selected,
+        key=lambda e: (
+            int(e.get("page_start") or 10**9),
+            int(e.get("page_end") or 10**9),
+            int(e.get("chunk_id") or 10**9),
+        ),
+    )
+
+    literal = "\n\n".join((e.get("chunk_text") or "").strip() for e in selected).strip()
+
+    # Formato blockquote sin usar backslashes dentro de f-string (evita SyntaxError)
+    lines = literal.splitlines()
+    return "> " + "\n> ".join(lines), max_page, selected
+
+
+def finish_plan(plan: Dict[str, Any], question: str, regimen: str, ejercicio: int) -> Dict[str, Any]:
+    """
+    Pasos 2.5 y 3: cita literal sin LLM o construcción de prompts.
+    Compartido por la versión sync y async del pipeline.
+    """
+    evidence = plan["evidence"]
+
+    # ------------------------------------------------------------
+    # 2.5) Si el usuario pide "cita literal/textual" y venimos de rmf_rule_lookup,
+    #      devolvemos la(s) regla(s) sin pasar por el LLM.
+    # ------------------------------------------------------------
+    if LITERAL_RE.search(question or "") and evidence and all((e.get("source") == "rmf_rule_lookup") for e in evidence):
+        response_text, max_page, selected = select_literal_rule_chunks(evidence)
+        plan["route_used"] = "rmf_rule_lookup"
+        plan["literal"] = response_text
+        plan["debug"] = {
+            "route_used": "rmf_rule_lookup",
+            "used_year": plan["used_year"],
+            "evidence_count": len(evidence),
+            "literal_max_page": max_page,
+            "literal_selected_chunk_ids": [e.get("chunk_id") for e in selected],
+        }
+        return plan
+
+    # ------------------------------------------------------------
+    # 3) Construcción de prompt
+    # ------------------------------------------------------------
+    plan["route_used"] = detect_route(evidence)
+    plan["system_prompt"] = build_system_message(evidence)
+    plan["user_prompt"] = build_user_prompt(question, regimen, ejercicio, plan["used_year"])
+    article = plan.get("session_article")
+    if article:
+        plan["user_prompt"] += f"\nSeguimiento sobre el Artículo {article['norm_id']} ({article.get('source_filename') or ''})."
+    return plan
+
+
+def new_plan(question: str, ejercicio: int) -> Dict[str, Any]:
+    return {
+        "route_used": None,
+        "used_year": ejercicio,
+        "evidence": [],
+        "expanded_query": question,
+        "keywords": [],
+        "literal": None,
+        "query_vec": None,
+        "cached": None,  # (entrada, similitud) si respondió la cache semántica
+        "session_article": None,  # artículo del turno anterior en seguimientos
+    }
+
+
+def rmf_rule_request(question: str, ejercicio: int, limit: int = TOP_K) -> Optional[Dict[str, Any]]:
+    """Argumentos para lookup_rmf_rule si la pregunta menciona "Regla X.X.X"."""
+    m_rule = RULE_REF_RE.search(question or "")
+    if not m_rule:
+        return None
+
+    # Opcional: si quieres forzar un RMF base por año desde env:
+    # set RMF_BASE_DOC_ID_2025=RMF_2025-30122024, etc.
+    return {
+        "ejercicio": ejercicio,
+        "rule_id": m_rule.group(1),
+        "prefer_document_id": os.getenv(f"RMF_BASE_DOC_ID_{ejercicio}", None),
+        "limit": limit,
+    }
+
+
+def apply_rule_evidence(plan: Dict[str, Any], evidence: List[Dict[str, Any]], question: str) -> bool:
+    """
+    Registra la evidencia RMF en el plan. Devuelve True si ya hay respuesta
+    (cita literal del chunk, sin LLM) y el pipeline puede terminar.
+    """
+    if not evidence:
+        return False
+
+    plan["route_used"] = "rmf_rule_lookup"
+    plan["evidence"] = evidence
+    # Si el usuario pide cita literal/textual, regresamos el chunk tal cual (sin LLM)
+    if RULE_QUOTE_RE.search(question or ""):
+        literal = evidence[0].get("chunk_text", "") or ""
+        plan["literal"] = "> " + literal.replace("\n", "\n> ")
+        return True
+    return False
+
+
+def apply_followup_evidence(
+    plan: Dict[str, Any],
+    evidence: List[Dict[str, Any]],
+    followup: Dict[str, Any],
+    session: Dict[str, Any],
+) -> bool:
+    """Registra la evidencia reutilizada de la sesión. Devuelve True si hubo evidencia."""
+    if not evidence:
+        return False
+
+    evidence, matched = narrow_evidence(evidence, followup)
+    session_store.count_followup()
+    trace_set("session", "followup", {**followup, "reused": len(evidence), "matched": matched})
+    plan.update(
+        route_used="session_followup",
+        evidence=evidence,
+        used_year=session.get("used_year") or plan["used_year"],
+        session_article=session.get("article"),
+    )
+    return True
 
-            evidence = try_get_rmf_rule_chunks(
-                conn,
-                ejercicio=ejercicio,
-                rule_id=rule_id,
-                prefer_document_id=prefer_doc,
-                limit=TOP_K,
-            )
-            if evidence:
-                used_year = ejercicio
-                expanded_question = question
-                keywords = []
-                        # Si el usuario pide cita literal/textual, regresamos el chunk tal cual (sin LLM)
-                if re.search(r"(?i)\b(c[ií]tame|textualmente|cita literal|cita textual)\b", question or ""):
-                    literal = evidence[0].get("chunk_text", "") or ""
-                    quoted = literal.replace("\n", "\n> ")
-                    response = "> " + quoted
-
-                dbg = {}
-                if trace:
-                    dbg = {
-                        "route_used": "rmf_rule_lookup",
-                        "used_year": used_year,
-                        "evidence_count": len(evidence),
-                        "expanded_query": expanded_question,
-                        "keywords": keywords,
-                        "sources": [
-                            {
-                                "chunk_id": e.get("chunk_id"),
-                                "document_id": e.get("document_id"),
-                                "norm_kind": e.get("norm_kind"),
-                                "norm_id": e.get("norm_id"),
-                                "doc_type": e.get("doc_type"),
-                                "source_filename": e.get("source_filename"),
-                                "page_start": e.get("page_start"),
-                                "page_end": e.get("page_end"),
-                                "score": e.get("score"),
-                                "source": e.get("source"),
-                                "excerpt": (e.get("chunk_text") or "")[:200],
-                            }
-                            for e in evidence[:8]
-                        ],
-                    }
-                return response, dbg
-
-        # ------------------------------------------------------------
-        # 2) Si no hubo match exacto, seguimos con vector + fallback
-        # ------------------------------------------------------------
-        if not evidence:
-            expanded_question, keywords = expand_query(question)
-            query_vec = embed_text(expanded_question)
 
+def retrieve_evidence(
+    conn,
+    question: str,
+    ejercicio: int = 2025,
+    top_k: int = TOP_K,
+    query_vec: Optional[List[float]] = None,
+    cache_scope: Optional[Tuple[str, str]] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Pasos 1 y 2 del pipeline: ruta + evidencia, sin LLM.
+
+    `query_vec` permite pasar un embedding ya calculado (p. ej. en lote para /search);
+    debe corresponder a expand_query(question)[0].
+    """
+    plan = new_plan(question, ejercicio)
+
+    # ------------------------------------------------------------
+    # 0) Seguimiento ("¿y la fracción XI?"): evidencia del turno anterior
+    # ------------------------------------------------------------
+    followup = followup_request(question, session)
+    if followup:
+        with stage_timer("session_lookup"):
+            evidence = get_chunks_by_ids(conn, session["chunk_ids"])
+        trace_append("sql", {"stage": "session_lookup", "rows": len(evidence)})
+        if apply_followup_evidence(plan, evidence, followup, session):
+            return plan
+
+    # ------------------------------------------------------------
+    # 1) RMF: lookup exacto si la pregunta menciona "Regla X.X.X"
+    # ------------------------------------------------------------
+    rule_req = rmf_rule_request(question, ejercicio, limit=top_k)
+    if rule_req:
+        with stage_timer("rmf_lookup"):
+            evidence = lookup_rmf_rule(conn, **rule_req)
+        trace_append("sql", {"stage": "rmf_lookup", "rule_id": rule_req["rule_id"], "rows": len(evidence)})
+        if apply_rule_evidence(plan, evidence, question):
+            return plan
+
+    # ------------------------------------------------------------
+    # 2) Si no hubo match exacto, seguimos con vector + fallback
+    # ------------------------------------------------------------
+    if not plan["evidence"]:
+        with stage_timer("expand_query"):
+            expanded_question, keywords = expand_query(question)
+        if query_vec is None:
+            with stage_timer("embed"):
+                query_vec = embed_text(expanded_question)
+        plan["query_vec"] = query_vec
+
+        # Cache semántica: una paráfrasis de algo ya respondido no pasa por retrieval ni LLM
+        if cache_scope is not None:
+            hit = semantic_cache.lookup(query_vec, *cache_scope)
+            if hit is not None:
+                plan.update(cached=hit, expanded_query=expanded_question, keywords=keywords)
+                return plan
+
+        with stage_timer("fallback"):
             evidence, used_year = retrieve_context_with_fallback(
                 conn,
                 query_vec,
                 ejercicio,
                 question=question,
-                top_k=TOP_K,
+                top_k=top_k,
                 keywords=keywords
             )
-                # ------------------------------------------------------------
-        # 2.5) Si el usuario pide "cita literal/textual" y venimos de rmf_rule_lookup,
-        #      devolvemos la(s) regla(s) sin pasar por el LLM.
-        #
-        #      Importante: rmf_rule_lookup suele traer 1 chunk de "índice/título"
-        #      y 1+ chunks con el "cuerpo" de la regla. Para cita literal queremos el cuerpo.
-        #      Heurística: nos quedamos con los chunks de la(s) página(s) MÁS ALTA(s).
-        # ------------------------------------------------------------
-        wants_literal = bool(re.search(r"(?i)\b(c[ií]tame|cita|textual|literal)\b", question or ""))
-
-        if wants_literal and evidence and all((e.get("source") == "rmf_rule_lookup") for e in evidence):
-            # 1) Determinar la página "más profunda" (máxima) dentro de la evidencia
-            pages = [int(e.get("page_start")) for e in evidence if e.get("page_start") is not None]
-            max_page = max(pages) if pages else None
-
-            # 2) Filtrar: quedarnos con los chunks de esa página (normalmente es el cuerpo)
-            if max_page is not None:
-                selected = [e for e in evidence if int(e.get("page_start") or -1) == max_page]
-            else:
-                selected = evidence
-
-            # 3) Orden estable por página y chunk_id
-            selected = sorted(
-                selected,
-                key=lambda e: (
-                    int(e.get("page_start") or 10**9),
-                    int(e.get("page_end") or 10**9),
-                    int(e.get("chunk_id") or 10**9),
-                ),
-            )
+        plan.update(evidence=evidence, used_year=used_year, expanded_query=expanded_question, keywords=keywords)
+
+    if plan["route_used"] is None:
+        plan["route_used"] = detect_route(plan["evidence"])
+    return plan
 
-            literal = "\n\n".join((e.get("chunk_text") or "").strip() for e in selected).strip()
 
-            # Formato blockquote sin usar backslashes dentro de f-string (evita SyntaxError)
-            lines = literal.splitlines()
-            response_text = "> " + "\n> ".join(lines)
+def prepare_rag(
+    conn,
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    cache_scope: Optional[Tuple[str, str]] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Resuelve ruta + evidencia y deja listo lo necesario para responder.
 
-            if trace:
-                debug = {
-                    "route_used": "rmf_rule_lookup",
-                    "used_year": used_year,
-                    "evidence_count": len(evidence),
-                    "literal_max_page": max_page,
-                    "literal_selected_chunk_ids": [e.get("chunk_id") for e in selected],
-                }
-                return response_text, debug
+    Devuelve un "plan" (dict) con route_used, used_year, evidence, expanded_query,
+    keywords y, o bien `literal` (respuesta directa sin LLM), o bien
+    `system_prompt` + `user_prompt` para el LLM.
+    """
+    plan = retrieve_evidence(conn, question, ejercicio, cache_scope=cache_scope, session=session)
+    if plan["literal"] is not None or plan["cached"] is not None:
+        return plan
 
-            return response_text, {}
+    return finish_plan(plan, question, regimen, ejercicio)
 
 
-        # ------------------------------------------------------------
-        # 3) Construcción de prompt + respuesta
-        # ------------------------------------------------------------
-        system_prompt = build_system_message(evidence)
+def stream_meta(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadatos que viajan antes del primer token (evento SSE `meta`)."""
+    evidence = plan["evidence"]
+    return {
+        "route_used": plan["route_used"],
+        "used_year": plan["used_year"],
+        "evidence_count": len(evidence),
+        "sources": [source_summary(e, excerpt=False) for e in evidence[:8]],
+    }
 
-        note_rule = f"\n\nNota: Basado en normativa {used_year}." if used_year not in (ejercicio, 0) else ""
 
-        user_prompt = (
-            f"Pregunta actual: {question}\n"
-            f"Contexto: Ejercicio {ejercicio}, Régimen {regimen}.\n"
-            f"Responde usando SOLO el contexto recuperado y mantén la continuidad de la charla."
-            f"{note_rule}"
-        )
+def done_payload(rt: RequestTrace, debug: Dict[str, Any], trace: bool) -> Dict[str, Any]:
+    """Cierra el trace de la petición y arma el evento `done`."""
+    rt.finish("ok", result=debug)
+    return {"debug": {**debug, "trace_id": rt.trace_id} if trace else {}, "trace_id": rt.trace_id}
 
-        response_text = ""
-        for chunk in generate_answer_stream(system_prompt, user_prompt, history):
-            response_text += chunk
-
-        debug = {}
-        if trace:
-            route_used = "vector_fallback"
-            if any((e.get("source") == "rmf_rule_lookup") for e in evidence):
-                route_used = "rmf_rule_lookup"
-            elif any((e.get("source") == "article_lookup") for e in evidence):
-                route_used = "article_lookup"
-
-            debug = {
-                "route_used": route_used,
-                "used_year": used_year,
-                "evidence_count": len(evidence),
-                "expanded_query": expanded_question,
-                "keywords": keywords,
-                "sources": [
-                    {
-                        "chunk_id": e.get("chunk_id"),
-                        "document_id": e.get("document_id"),
-                        "norm_kind": e.get("norm_kind"),
-                        "norm_id": e.get("norm_id"),
-                        "doc_type": e.get("doc_type"),
-                        "source_filename": e.get("source_filename"),
-                        "page_start": e.get("page_start"),
-                        "page_end": e.get("page_end"),
-                        "score": e.get("score"),
-                        "source": e.get("source"),
-                        "excerpt": (e.get("chunk_text") or "")[:200],
-                    }
-                    for e in evidence[:8]
-                ],
-            }
-
-        return response_text, debug
 
+# =========================
+# Orquestador
+# =========================
+
+def stream_response_with_rag(
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    trace: bool = False,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None,
+) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+    """
+    Versión streaming del pipeline. Emite tuplas (evento, data):
+      ("meta",  {route_used, used_year, evidence_count, sources})
+      ("delta", {"text": ...})            # 1..n veces
+      ("done",  {"debug": {...}, "trace_id": ...})   # debug vacío si trace=False
+      ("error", {"error": ..., "trace_id": ...})     # en lugar de done si algo falla
+
+    Con `session_id` el historial y la evidencia del turno anterior salen de la
+    sesión guardada en el servidor (ver app/services/sessions.py).
+
+    El trace completo (etapas, SQL, años, caches) queda en app.core.tracing.trace_store.
+    """
+    if not session_id:
+        yield from _stream_response_with_rag(question, regimen, ejercicio, trace, history)
+        return
+
+    session = session_store.get(session_id)
+    answer = ""
+    # El debug completo hace falta para guardar el turno; al cliente solo si pidió trace
+    for event, data in _stream_response_with_rag(question, regimen, ejercicio, True, history or session_history(session), session):
+        if event == "delta":
+            answer += data["text"]
+        elif event == "done":
+            session_store.save(session_id, session_turn(session, question, answer, data["debug"]))
+            if not trace:
+                data = {"debug": {}, "trace_id": data["trace_id"]}
+        yield event, data
+
+
+def _stream_response_with_rag(
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    trace: bool = False,
+    history: List[Dict[str, str]] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+    rt = start_trace(question, ejercicio, regimen)
+    start_deadline()
+    try:
+        # Caches exacta y semántica (solo sin historial: con historial la respuesta depende de la charla)
+        cache_key = cache_version = sem_scope = None
+        if not history:
+            cache_version = get_corpus_version()
+            if cache_version is not None:
+                cache_key = answer_cache_key(question, ejercicio, regimen)
+                if SEMANTIC_CACHE_ENABLED:
+                    sem_scope = (semantic_scope(question, ejercicio, regimen), cache_version)
+                hit = answer_cache.get(cache_key, cache_version)
+                record_cache("exact" if hit is not None else "miss")
+                if hit is not None:
+                    yield from replay_cached(hit)
+                    yield "done", done_payload(rt, cached_debug(hit), trace)
+                    return
+
+        # La conexión vuelve al pool antes del streaming del LLM
+        with db_connection(statement_timeout_ms()) as conn:
+            plan = prepare_rag(conn, question, regimen, ejercicio, cache_scope=sem_scope, session=session)
+
+        if plan["cached"] is not None:
+            record_cache("semantic")
+            record_usage("semantic_cache", [])  # solo el embedding de la pregunta
+            answer_cache.put(cache_key, cache_version, plan["cached"][0])
+            yield from replay_cached(plan["cached"][0], "semantic")
+            yield "done", done_payload(rt, semantic_debug(plan["cached"]), trace)
+            return
+
+        meta = stream_meta(plan)
+        yield "meta", meta
+
+        answer = ""
+        if plan["literal"] is not None:
+            answer = plan["literal"]
+            yield "delta", {"text": answer}
+        else:
+            for chunk in generate_answer_stream(plan["system_prompt"], plan["user_prompt"], history):
+                answer += chunk
+                yield "delta", {"text": chunk}
+
+        debug = build_trace(plan)
+        record_answer(plan["route_used"], plan["used_year"], len(plan["evidence"]))
+        record_usage(plan["route_used"], plan["evidence"])
+        observe_stage("pipeline", time.perf_counter() - rt.started)
+        if cache_key is not None:
+            answer_cache.put(cache_key, cache_version, {"answer": answer, "meta": meta, "debug": debug})
+        if sem_scope is not None and plan["query_vec"] is not None:
+            semantic_cache.put(plan["query_vec"], *sem_scope, semantic_entry(question, plan, answer, meta, debug))
+
+        yield "done", done_payload(rt, debug, trace)
+
+    except (AdmissionRejected, DeadlineExceeded) as e:
+        rt.finish("timeout" if isinstance(e, DeadlineExceeded) else "rejected", error=str(e))
+        raise  # saturación o sin tiempo: el endpoint responde 429/503/504 con Retry-After
     except Exception as e:
-        return f"Error: {str(e)}", {"error": str(e)}
+        record_error("pipeline")
+        record_usage("error", [])  # lo ya gastado antes de fallar también cuenta
+        rt.finish("error", error=str(e))
+        yield "error", {"error": str(e), "trace_id": rt.trace_id}
     finally:
-        if conn:
-            conn.close()
-
+        end_deadline()
+        end_trace()
 
+def generate_response_with_rag(
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    trace: bool = False,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None,
+):
+    response_text = ""
+    debug: Dict[str, Any] = {}
+
+    # Perfil opcional (PROFILE_SAMPLE_RATE); apagado no cuesta nada
+    with profiled("generate_response_with_rag", should_profile()):
+        for event, data in stream_response_with_rag(question, regimen, ejercicio, trace, history, session_id):
+            if event == "delta":
+                response_text += data["text"]
+            elif event == "done":
+                debug = data["debug"]
+            elif event == "error":
+                return f"Error: {data['error']}", {"error": data["error"], "trace_id": data.get("trace_id")}
+
+    return response_text, debug
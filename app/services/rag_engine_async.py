@@ -0,0 +1,372 @@
+# app/services/rag_engine_async.py
+# Variante async del pipeline RAG (AsyncOpenAI + psycopg 3).
+#
+# Misma lógica que rag_engine.py (ruteo, prompts, trace); solo cambia el I/O,
+# para que un worker atienda cientos de conversaciones sin bloquear el threadpool.
+
+import time
+import asyncio
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
+
+from app.core.config import OPENAI_API_KEY, MODEL_EMBED, MODEL_CHAT
+from app.core.db import async_db_connection
+from app.core.metrics import stage_timer, observe_stage, record_error, record_answer, record_cache, record_usage
+from app.core.deadline import (
+    DeadlineExceeded,
+    OPENAI_TIMEOUT_S,
+    start_deadline,
+    end_deadline,
+    call_timeout,
+    statement_timeout_ms,
+    check_deadline,
+    with_retries_async,
+    hedged_async,
+)
+from app.core.tokens import record_chat_usage, record_embedding_usage
+from app.core.tracing import start_trace, end_trace, trace_set, trace_append
+from app.services.admission import AdmissionRejected, embed_admission, chat_admission
+from app.services.cache.embedding_cache import embedding_cache
+from app.services.cache.answer_cache import answer_cache, answer_cache_key, replay_cached, cached_debug
+from app.services.cache.semantic_cache import (
+    SEMANTIC_CACHE_ENABLED,
+    semantic_cache,
+    semantic_entry,
+    semantic_scope,
+    semantic_debug,
+)
+from app.services.corpus_version import get_corpus_version_async
+from app.services.singleflight import answer_flights
+from app.services.sessions import session_store, session_history, session_turn, followup_request
+
+from app.services.rag_engine import (
+    TOP_K,
+    detect_route,
+    new_plan,
+    rmf_rule_request,
+    apply_rule_evidence,
+    apply_followup_evidence,
+    finish_plan,
+    build_messages,
+    build_trace,
+    stream_meta,
+    done_payload,
+)
+from app.services.retrieval.chunk_lookup import get_chunks_by_ids_async
+from app.services.retrieval.fallback import retrieve_context_with_fallback_async
+from app.services.retrieval.query_expansion import expand_query
+from app.services.retrieval.norm_index import lookup_rmf_rule_async
+
+
+# Cliente perezoso (se crea en el primer uso o en el warm-up)
+_aclient = None
+
+
+def get_aclient():
+    global _aclient
+    if _aclient is None:
+        from openai import AsyncOpenAI
+
+        # Reintentos propios (app/core/deadline.py): la librería no reintenta
+        _aclient = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0, timeout=OPENAI_TIMEOUT_S)
+    return _aclient
+
+
+# =========================
+# Embeddings
+# =========================
+
+async def _create_embeddings_async(inputs: List[str]):
+    """Llamada a la API con timeout del deadline, reintentos y hedging."""
+    async def call():
+        return await get_aclient().embeddings.create(input=inputs, model=MODEL_EMBED, timeout=call_timeout())
+    return await with_retries_async(lambda: hedged_async(call), "embed_api")
+
+
+async def embed_text_async(text: str) -> List[float]:
+    return (await embed_texts_async([text]))[0]
+
+
+async def embed_texts_async(texts: List[str]) -> List[List[float]]:
+    """Embeddings en lote: una sola llamada a la API para los N textos que no están en cache."""
+    if not texts:
+        return []
+    clean = [(t or "").replace("\n", " ") for t in texts]
+    # El nivel SQLite es I/O de disco: fuera del event loop
+    vecs = await asyncio.to_thread(embedding_cache.get_many, MODEL_EMBED, clean)
+    missing = [i for i, v in enumerate(vecs) if v is None]
+    trace_set("cache", "embedding", "miss" if missing else "hit")
+    if missing:
+        async with embed_admission.aslot():
+            with stage_timer("embed_api"):
+                resp = await _create_embeddings_async([clean[i] for i in missing])
+        record_embedding_usage(resp)
+        for d in resp.data:
+            vecs[missing[d.index]] = d.embedding
+        await asyncio.to_thread(embedding_cache.put_many, MODEL_EMBED, [clean[i] for i in missing], [vecs[i] for i in missing])
+    return vecs
+
+
+# =========================
+# LLM streaming
+# =========================
+
+async def generate_answer_stream_async(system_prompt: str, user_prompt: str, history: List[Dict[str, str]] = None) -> AsyncGenerator[str, None]:
+    messages = build_messages(system_prompt, user_prompt, history)
+
+    # El lugar en el carril "chat" se ocupa durante todo el stream
+    async with chat_admission.aslot():
+        with stage_timer("llm_stream"):
+            t0 = time.perf_counter()
+            first = True
+            usage, parts, stream = None, [], None
+            try:
+                # Solo se reintenta la apertura; un stream a medias no se repite
+                stream = await with_retries_async(
+                    lambda: get_aclient().chat.completions.create(
+                        model=MODEL_CHAT,
+                        messages=messages,
+                        temperature=0.2,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        timeout=call_timeout(),
+                    ),
+                    "llm_stream",
+                )
+
+                async for chunk in stream:
+                    check_deadline("llm_stream")
+                    # El último chunk trae solo `usage` (choices vacío)
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        if first:
+                            observe_stage("llm_first_token", time.perf_counter() - t0)
+                            first = False
+                        parts.append(content)
+                        yield content
+            finally:
+                if stream is not None:
+                    await stream.close()
+                record_chat_usage(messages, usage, "".join(parts))
+
+
+# =========================
+# Orquestador
+# =========================
+
+async def retrieve_evidence_async(
+    aconn,
+    question: str,
+    ejercicio: int = 2025,
+    top_k: int = TOP_K,
+    query_vec: Optional[List[float]] = None,
+    cache_scope: Optional[Tuple[str, str]] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Versión async de rag_engine.retrieve_evidence (ruta + evidencia, sin LLM)."""
+    plan = new_plan(question, ejercicio)
+
+    # 0) Seguimiento ("¿y la fracción XI?"): evidencia del turno anterior
+    followup = followup_request(question, session)
+    if followup:
+        with stage_timer("session_lookup"):
+            evidence = await get_chunks_by_ids_async(aconn, session["chunk_ids"])
+        trace_append("sql", {"stage": "session_lookup", "rows": len(evidence)})
+        if apply_followup_evidence(plan, evidence, followup, session):
+            return plan
+
+    # 1) RMF: lookup exacto si la pregunta menciona "Regla X.X.X"
+    rule_req = rmf_rule_request(question, ejercicio, limit=top_k)
+    if rule_req:
+        with stage_timer("rmf_lookup"):
+            evidence = await lookup_rmf_rule_async(aconn, **rule_req)
+        trace_append("sql", {"stage": "rmf_lookup", "rule_id": rule_req["rule_id"], "rows": len(evidence)})
+        if apply_rule_evidence(plan, evidence, question):
+            return plan
+
+    # 2) Si no hubo match exacto, seguimos con vector + fallback
+    if not plan["evidence"]:
+        with stage_timer("expand_query"):
+            expanded_question, keywords = expand_query(question)
+        if query_vec is None:
+            with stage_timer("embed"):
+                query_vec = await embed_text_async(expanded_question)
+        plan["query_vec"] = query_vec
+
+        # Cache semántica: una paráfrasis de algo ya respondido no pasa por retrieval ni LLM
+        if cache_scope is not None:
+            hit = semantic_cache.lookup(query_vec, *cache_scope)
+            if hit is not None:
+                plan.update(cached=hit, expanded_query=expanded_question, keywords=keywords)
+                return plan
+
+        with stage_timer("fallback"):
+            evidence, used_year = await retrieve_context_with_fallback_async(
+                aconn,
+                query_vec,
+                ejercicio,
+                question=question,
+                top_k=top_k,
+                keywords=keywords
+            )
+        plan.update(evidence=evidence, used_year=used_year, expanded_query=expanded_question, keywords=keywords)
+
+    if plan["route_used"] is None:
+        plan["route_used"] = detect_route(plan["evidence"])
+    return plan
+
+
+async def prepare_rag_async(
+    aconn,
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    cache_scope: Optional[Tuple[str, str]] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Versión async de rag_engine.prepare_rag (mismo plan de salida)."""
+    plan = await retrieve_evidence_async(aconn, question, ejercicio, cache_scope=cache_scope, session=session)
+    if plan["literal"] is not None or plan["cached"] is not None:
+        return plan
+
+    return finish_plan(plan, question, regimen, ejercicio)
+
+
+async def stream_response_with_rag_async(
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    trace: bool = False,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None,
+) -> AsyncGenerator[Tuple[str, Dict[str, Any]], None]:
+    """
+    Mismos eventos que rag_engine.stream_response_with_rag: meta, delta, done | error.
+
+    Sin historial, las preguntas idénticas concurrentes comparten un solo vuelo
+    (embedding + retrieval + LLM) y reciben el mismo stream de tokens.
+    Con `session_id` el historial y la evidencia previa salen de la sesión del servidor.
+    """
+    session = None
+    if session_id:
+        session = await asyncio.to_thread(session_store.get, session_id)
+        history = history or session_history(session)
+
+    # Siempre se calcula el debug (vuelo compartido, turno de la sesión); cada consumidor decide si lo ve
+    if history:
+        events = _stream_response_with_rag_async(question, regimen, ejercicio, True, history, session)
+    else:
+        key = answer_cache_key(question, ejercicio, regimen)
+        events = answer_flights.stream(key, lambda: _stream_response_with_rag_async(question, regimen, ejercicio, True))
+
+    answer = ""
+    async for event, data in events:
+        if event == "delta":
+            answer += data["text"]
+        elif event == "done":
+            if session_id:
+                await asyncio.to_thread(session_store.save, session_id, session_turn(session, question, answer, data["debug"]))
+            if not trace:
+                data = {"debug": {}, "trace_id": data["trace_id"]}
+        yield event, data
+
+
+async def _stream_response_with_rag_async(
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    trace: bool = False,
+    history: List[Dict[str, str]] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> AsyncGenerator[Tuple[str, Dict[str, Any]], None]:
+    rt = start_trace(question, ejercicio, regimen)
+    start_deadline()
+    try:
+        # Caches exacta y semántica (solo sin historial: con historial la respuesta depende de la charla)
+        cache_key = cache_version = sem_scope = None
+        if not history:
+            cache_version = await get_corpus_version_async()
+            if cache_version is not None:
+                cache_key = answer_cache_key(question, ejercicio, regimen)
+                if SEMANTIC_CACHE_ENABLED:
+                    sem_scope = (semantic_scope(question, ejercicio, regimen), cache_version)
+                # El nivel compartido (SQLite/Redis) es I/O: fuera del event loop
+                hit = await asyncio.to_thread(answer_cache.get, cache_key, cache_version)
+                record_cache("exact" if hit is not None else "miss")
+                if hit is not None:
+                    for event in replay_cached(hit):
+                        yield event
+                    yield "done", done_payload(rt, cached_debug(hit), trace)
+                    return
+
+        # La conexión vuelve al pool antes del streaming del LLM
+        async with async_db_connection(statement_timeout_ms()) as aconn:
+            plan = await prepare_rag_async(aconn, question, regimen, ejercicio, cache_scope=sem_scope, session=session)
+
+        if plan["cached"] is not None:
+            record_cache("semantic")
+            record_usage("semantic_cache", [])  # solo el embedding de la pregunta
+            await asyncio.to_thread(answer_cache.put, cache_key, cache_version, plan["cached"][0])
+            for event in replay_cached(plan["cached"][0], "semantic"):
+                yield event
+            yield "done", done_payload(rt, semantic_debug(plan["cached"]), trace)
+            return
+
+        meta = stream_meta(plan)
+        yield "meta", meta
+
+        answer = ""
+        if plan["literal"] is not None:
+            answer = plan["literal"]
+            yield "delta", {"text": answer}
+        else:
+            async for chunk in generate_answer_stream_async(plan["system_prompt"], plan["user_prompt"], history):
+                answer += chunk
+                yield "delta", {"text": chunk}
+
+        debug = build_trace(plan)
+        record_answer(plan["route_used"], plan["used_year"], len(plan["evidence"]))
+        record_usage(plan["route_used"], plan["evidence"])
+        observe_stage("pipeline", time.perf_counter() - rt.started)
+        if cache_key is not None:
+            await asyncio.to_thread(answer_cache.put, cache_key, cache_version, {"answer": answer, "meta": meta, "debug": debug})
+        if sem_scope is not None and plan["query_vec"] is not None:
+            semantic_cache.put(plan["query_vec"], *sem_scope, semantic_entry(question, plan, answer, meta, debug))
+
+        yield "done", done_payload(rt, debug, trace)
+
+    except (AdmissionRejected, DeadlineExceeded) as e:
+        rt.finish("timeout" if isinstance(e, DeadlineExceeded) else "rejected", error=str(e))
+        raise  # saturación o sin tiempo: el endpoint responde 429/503/504 con Retry-After
+    except Exception as e:
+        record_error("pipeline")
+        record_usage("error", [])  # lo ya gastado antes de fallar también cuenta
+        rt.finish("error", error=str(e))
+        yield "error", {"error": str(e), "trace_id": rt.trace_id}
+    finally:
+        end_deadline()
+        end_trace()
+
+async def generate_response_with_rag_async(
+    question: str,
+    regimen: str = "General",
+    ejercicio: int = 2025,
+    trace: bool = False,
+    history: List[Dict[str, str]] = None,
+    session_id: Optional[str] = None,
+):
+    response_text = ""
+    debug: Dict[str, Any] = {}
+
+    async for event, data in stream_response_with_rag_async(question, regimen, ejercicio, trace, history, session_id):
+        if event == "delta":
+            response_text += data["text"]
+        elif event == "done":
+            debug = data["debug"]
+        elif event == "error":
+            return f"Error: {data['error']}", {"error": data["error"], "trace_id": data.get("trace_id")}
+
+    return response_text, debug
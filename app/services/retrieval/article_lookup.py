@@ -1,32 +1,8 @@
 # app/services/retrieval/article_lookup.py
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence, Tuple
 
 
-def try_get_article_chunks(
-    conn,
-    document_id: str,
-    article_number: int,
-    article_suffix: str = "",
-    suffix_word: str = "",
-    limit: int = 50
-) -> List[Dict[str, Any]]:
-    """
-    Lookup determinístico por artículo usando el esquema Ruta2:
-      chunks.norm_kind = 'ARTICLE'
-      chunks.norm_id   = '69-B' | '88-TER' | '69-B-BIS' | '137-BIS', etc.
-    """
-    # Normalización a tu convención de norm_id
-    num = str(article_number).strip()
-    lit = (article_suffix or "").strip().upper()
-    suf = (suffix_word or "").strip().upper()
-
-    norm_id = num
-    if lit:
-        norm_id += f"-{lit}"
-    if suf:
-        norm_id += f"-{suf}"
-
-    sql = """
+ARTICLE_CHUNKS_SQL = """
     SELECT
       c.chunk_id,
       d.source_filename,
@@ -45,11 +21,63 @@ def try_get_article_chunks(
     LIMIT %s
     """
 
-    cur = conn.cursor()
-    cur.execute(sql, (document_id, norm_id, limit))
-    rows = cur.fetchall()
-    cur.close()
 
+# Varios documentos candidatos y varios artículos en UNA consulta. Por cada norm_id
+# gana el primer documento en el orden del router (doc_rank = 1), con hasta
+# %s chunks por artículo: lo mismo que el loop documento por documento.
+ARTICLES_BATCH_SQL = """
+    WITH hits AS (
+      SELECT
+        c.chunk_id,
+        c.document_id,
+        c.norm_id,
+        d.source_filename,
+        c.text,
+        d.doc_type,
+        d.published_date,
+        c.page_start,
+        c.page_end,
+        1.0 as score,
+        dense_rank() OVER (
+          PARTITION BY c.norm_id ORDER BY array_position(%s::text[], c.document_id)
+        ) AS doc_rank,
+        row_number() OVER (
+          PARTITION BY c.norm_id, c.document_id ORDER BY c.chunk_id
+        ) AS rn
+      FROM public.chunks c
+      JOIN public.documents d ON c.document_id = d.document_id
+      WHERE c.document_id = ANY(%s::text[])
+        AND c.norm_kind = 'ARTICLE'
+        AND c.norm_id = ANY(%s::text[])
+    )
+    SELECT chunk_id, document_id, norm_id, source_filename, text, doc_type,
+           published_date, page_start, page_end, score
+    FROM hits
+    WHERE doc_rank = 1 AND rn <= %s
+    ORDER BY array_position(%s::text[], norm_id), chunk_id
+    """
+
+
+def build_article_norm_id(article_number: int, article_suffix: str = "", suffix_word: str = "") -> str:
+    """Normalización a la convención de norm_id: 69-B, 88-TER, 69-B-BIS, 137-BIS."""
+    num = str(article_number).strip()
+    lit = (article_suffix or "").strip().upper()
+    suf = (suffix_word or "").strip().upper()
+
+    norm_id = num
+    if lit:
+        norm_id += f"-{lit}"
+    if suf:
+        norm_id += f"-{suf}"
+    return norm_id
+
+
+def _article_query(document_id: str, article_number: int, article_suffix: str, suffix_word: str, limit: int) -> Tuple[str, str, tuple]:
+    norm_id = build_article_norm_id(article_number, article_suffix, suffix_word)
+    return norm_id, ARTICLE_CHUNKS_SQL, (document_id, norm_id, limit)
+
+
+def _rows_to_evidence(rows, document_id: str, norm_id: str) -> List[Dict[str, Any]]:
     evidence: List[Dict[str, Any]] = []
     for r in rows:
         pub_date = r[4].isoformat() if r[4] else "S/F"
@@ -69,3 +97,102 @@ def try_get_article_chunks(
         })
 
     return evidence
+
+
+def try_get_article_chunks(
+    conn,
+    document_id: str,
+    article_number: int,
+    article_suffix: str = "",
+    suffix_word: str = "",
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    Lookup determinístico por artículo usando el esquema Ruta2:
+      chunks.norm_kind = 'ARTICLE'
+      chunks.norm_id   = '69-B' | '88-TER' | '69-B-BIS' | '137-BIS', etc.
+    """
+    norm_id, sql, params = _article_query(document_id, article_number, article_suffix, suffix_word, limit)
+
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.close()
+
+    return _rows_to_evidence(rows, document_id, norm_id)
+
+
+async def try_get_article_chunks_async(
+    aconn,
+    document_id: str,
+    article_number: int,
+    article_suffix: str = "",
+    suffix_word: str = "",
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """Igual que try_get_article_chunks, sobre una conexión async (psycopg 3)."""
+    norm_id, sql, params = _article_query(document_id, article_number, article_suffix, suffix_word, limit)
+
+    async with aconn.cursor() as cur:
+        await cur.execute(sql, params)
+        rows = await cur.fetchall()
+
+    return _rows_to_evidence(rows, document_id, norm_id)
+
+
+# =========================
+# Lookup por lotes (documentos candidatos x artículos)
+# =========================
+
+def _batch_params(document_ids: Sequence[str], norm_ids: Sequence[str], limit: int) -> tuple:
+    docs = list(dict.fromkeys(document_ids))
+    norms = list(dict.fromkeys(norm_ids))
+    return (docs, docs, norms, limit, norms)
+
+
+def _batch_rows_to_evidence(rows) -> List[Dict[str, Any]]:
+    evidence: List[Dict[str, Any]] = []
+    for r in rows:
+        # Mismo formato que _rows_to_evidence, con document_id / norm_id de la fila
+        evidence.extend(_rows_to_evidence([(r[0], *r[3:])], r[1], r[2]))
+    return evidence
+
+
+def try_get_articles_chunks(
+    conn,
+    document_ids: Sequence[str],
+    norm_ids: Sequence[str],
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    Lookup de uno o varios artículos (norm_ids ya normalizados: '69-B', '27') en los
+    documentos candidatos, en un solo round trip. Por cada artículo se devuelven los
+    chunks del primer documento (en el orden dado) que lo tiene; los artículos salen
+    en el orden de norm_ids.
+    """
+    if not document_ids or not norm_ids:
+        return []
+
+    cur = conn.cursor()
+    cur.execute(ARTICLES_BATCH_SQL, _batch_params(document_ids, norm_ids, limit))
+    rows = cur.fetchall()
+    cur.close()
+
+    return _batch_rows_to_evidence(rows)
+
+
+async def try_get_articles_chunks_async(
+    aconn,
+    document_ids: Sequence[str],
+    norm_ids: Sequence[str],
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """Igual que try_get_articles_chunks, sobre una conexión async (psycopg 3)."""
+    if not document_ids or not norm_ids:
+        return []
+
+    async with aconn.cursor() as cur:
+        await cur.execute(ARTICLES_BATCH_SQL, _batch_params(document_ids, norm_ids, limit))
+        rows = await cur.fetchall()
+
+    return _batch_rows_to_evidence(rows)
@@ -0,0 +1,69 @@
+# app/services/retrieval/chunk_lookup.py
+# Lookup de chunks por chunk_id (evidencia de un turno anterior de la sesión).
+# Un solo SELECT por llave primaria: sin embedding ni búsqueda vectorial.
+from typing import List, Dict, Any
+
+
+CHUNKS_BY_ID_SQL = """
+    SELECT
+      c.chunk_id,
+      c.document_id,
+      c.norm_kind,
+      c.norm_id,
+      d.source_filename,
+      c.text,
+      d.doc_type,
+      d.published_date,
+      c.page_start,
+      c.page_end
+    FROM public.chunks c
+    JOIN public.documents d ON c.document_id = d.document_id
+    WHERE c.chunk_id = ANY(%s)
+    """
+
+
+def _rows_to_evidence(rows, chunk_ids: List[Any]) -> List[Dict[str, Any]]:
+    by_id: Dict[Any, Dict[str, Any]] = {}
+    for r in rows:
+        pub_date = r[7].isoformat() if r[7] else "S/F"
+        by_id[r[0]] = {
+            "chunk_id": r[0],
+            "document_id": r[1],
+            "norm_kind": r[2],
+            "norm_id": r[3],
+            "source_filename": r[4],
+            "chunk_text": r[5],
+            "doc_type": r[6],
+            "published_date": pub_date,
+            "page_start": r[8],
+            "page_end": r[9],
+            "score": 1.0,
+            "source": "session_followup",
+        }
+
+    # Mismo orden (relevancia) que en el turno original
+    return [by_id[cid] for cid in chunk_ids if cid in by_id]
+
+
+def get_chunks_by_ids(conn, chunk_ids: List[Any]) -> List[Dict[str, Any]]:
+    if not chunk_ids:
+        return []
+
+    cur = conn.cursor()
+    cur.execute(CHUNKS_BY_ID_SQL, (list(chunk_ids),))
+    rows = cur.fetchall()
+    cur.close()
+
+    return _rows_to_evidence(rows, chunk_ids)
+
+
+async def get_chunks_by_ids_async(aconn, chunk_ids: List[Any]) -> List[Dict[str, Any]]:
+    """Igual que get_chunks_by_ids, sobre una conexión async (psycopg 3)."""
+    if not chunk_ids:
+        return []
+
+    async with aconn.cursor() as cur:
+        await cur.execute(CHUNKS_BY_ID_SQL, (list(chunk_ids),))
+        rows = await cur.fetchall()
+
+    return _rows_to_evidence(rows, chunk_ids)
@@ -1,71 +1,124 @@
 # app/services/retrieval/fallback.py
-# VERSIÓN 3.0 - Corregido error "tuple index out of range" y lógica de vigencia.
+# VERSIÓN 3.6 - Artículos desde el índice en memoria (norm_index.py).
 
 import re
 from typing import List, Dict, Any, Tuple, Optional
-from .article_lookup import try_get_article_chunks
+from .article_lookup import build_article_norm_id
+from .norm_index import lookup_articles, lookup_articles_async
 from .doc_router import resolve_candidate_documents
-from .vector_retrieval import retrieve_context
+from .fusion import fuse_results, fusion_stats
+from .keyword_search import disable_fts, is_missing_fts, keyword_engine, keyword_match, keyword_tsquery
+from .vector_retrieval import (
+    VECTOR_COLUMNS_SQL,
+    VECTOR_TUNING_SQL,
+    DOC_TYPE_FILTER_SQL,
+    doc_type_filter_params,
+    tuning_params,
+    year_clause,
+    _rows_to_evidence,
+    _vec_literal,
+)
+from app.core.metrics import stage_timer, record_error
+from app.core.deadline import KEYWORD_MIN_BUDGET_S, budget_low, check_deadline
+from app.core.tracing import trace_append, trace_set
 
 ARTICLE_REF_RE = re.compile(r"\b(\d{1,3})\s*[-–]\s*([a-zA-Z])\b(\s*bis)?", re.IGNORECASE)
 
 
-def retrieve_by_keywords(conn, keywords: List[str], ejercicio: int, limit: int = 5) -> List[Dict[str, Any]]:
-    """
-    Búsqueda complementaria por palabras clave (ILIKE).
-    Útil cuando la búsqueda vectorial no encuentra términos específicos.
-    
-    Nota: exercise_year = 0 indica leyes federales (vigentes siempre)
-    """
-    if not keywords:
-        return []
-    
-    # Construir condiciones OR para cada keyword
-    conditions = []
-    for kw in keywords:
-        safe_kw = kw.replace("'", "''").replace("%", "\\%")
-        conditions.append(f"c.text ILIKE '%{safe_kw}%'")
-    
-    where_keywords = " OR ".join(conditions)
-    
-    # Query con lógica de vigencia: exercise_year = 0 (leyes) o año específico
+def _build_keyword_query(keywords: List[str], ejercicio: int, limit: int) -> Tuple[str, tuple]:
+    where_keywords, params, score_sql, score_params = keyword_match(keywords)
+
+    # Query con lógica de vigencia: exercise_year = 0 (leyes) o año específico.
+    # Relevancia primero (ts_rank_cd con fts); a igual score, ley > rmf > resto.
     query = f"""
-        SELECT 
+        SELECT
             c.text,
             c.document_id,
             COALESCE(d.source_filename, '') as source_filename,
             COALESCE(d.doc_type, '') as doc_type,
-            COALESCE(d.exercise_year, 0) as exercise_year
+            COALESCE(d.exercise_year, 0) as exercise_year,
+            c.chunk_id,
+            {score_sql} as score
         FROM chunks c
         LEFT JOIN documents d ON c.document_id = d.document_id
         WHERE ({where_keywords})
           AND (d.exercise_year = 0 OR d.exercise_year = %s OR d.exercise_year IS NULL)
-        ORDER BY 
+        ORDER BY
+            score DESC,
             CASE WHEN d.doc_type = 'ley' THEN 1
                  WHEN d.doc_type = 'rmf' THEN 2
                  ELSE 3 END,
             d.exercise_year DESC
         LIMIT %s
     """
-    
+    return query, tuple([*score_params, *params, ejercicio, limit])
+
+
+def _keyword_rows_to_results(rows) -> List[Dict[str, Any]]:
+    results = []
+    for row in rows:
+        results.append({
+            "chunk_text": row[0] if len(row) > 0 else "",
+            "document_id": row[1] if len(row) > 1 else "",
+            "source_filename": row[2] if len(row) > 2 else "",
+            "doc_type": row[3] if len(row) > 3 else "",
+            "exercise_year": row[4] if len(row) > 4 else 0,
+            "chunk_id": row[5] if len(row) > 5 else None,
+            "score": float(row[6]) if len(row) > 6 and row[6] is not None else 0.0,
+            "metadata": {},
+            "source": "keyword"
+        })
+    return results
+
+
+def retrieve_by_keywords(conn, keywords: List[str], ejercicio: int, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Búsqueda complementaria por palabras clave: full-text en español
+    (text_tsv @@ plainto_tsquery('public.es_unaccent', ...), score ts_rank_cd).
+    Si la base no tiene migrations/002_chunks_fts.sql (SQLSTATE 42703 / 42704)
+    el proceso pasa a ILIKE y se reintenta; ver keyword_search.py.
+    Útil cuando la búsqueda vectorial no encuentra términos específicos.
+
+    Nota: exercise_year = 0 indica leyes federales (vigentes siempre)
+    """
+    if not keywords:
+        return []
+
+    query, params = _build_keyword_query(keywords, ejercicio, limit)
+
     try:
         with conn.cursor() as cur:
-            cur.execute(query, (ejercicio, limit))
+            cur.execute(query, params)
             rows = cur.fetchall()
-            
-            results = []
-            for row in rows:
-                results.append({
-                    "chunk_text": row[0] if len(row) > 0 else "",
-                    "document_id": row[1] if len(row) > 1 else "",
-                    "source_filename": row[2] if len(row) > 2 else "",
-                    "doc_type": row[3] if len(row) > 3 else "",
-                    "exercise_year": row[4] if len(row) > 4 else 0,
-                    "metadata": {},
-                    "source": "keyword"
-                })
-            return results
+            return _keyword_rows_to_results(rows)
     except Exception as e:
+        if is_missing_fts(e):
+            disable_fts(e)
+            return retrieve_by_keywords(conn, keywords, ejercicio, limit)
+        record_error("keyword_search")
+        print(f"Error en búsqueda por keywords: {e}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+
+async def retrieve_by_keywords_async(aconn, keywords: List[str], ejercicio: int, limit: int = 5) -> List[Dict[str, Any]]:
+    """Igual que retrieve_by_keywords, sobre una conexión async (psycopg 3)."""
+    if not keywords:
+        return []
+
+    query, params = _build_keyword_query(keywords, ejercicio, limit)
+
+    try:
+        async with aconn.cursor() as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            return _keyword_rows_to_results(rows)
+    except Exception as e:
+        if is_missing_fts(e):
+            disable_fts(e)
+            return await retrieve_by_keywords_async(aconn, keywords, ejercicio, limit)
+        record_error("keyword_search")
         print(f"Error en búsqueda por keywords: {e}")
         import traceback
         traceback.print_exc()
@@ -73,114 +126,409 @@ def retrieve_by_keywords(conn, keywords: List[str], ejercicio: int, limit: int =
 
 
 def merge_results(vector_results: List[Dict], keyword_results: List[Dict], top_k: int) -> List[Dict]:
+    """Fusión vector + keywords (ver fusion.py; FUSION_MODE=append es el comportamiento anterior)."""
+    return fuse_results(vector_results, keyword_results, top_k)
+
+
+# =========================
+# Fallback de años en una sola consulta
+# =========================
+#
+# Antes: por cada año de years_to_check una consulta vectorial y otra por keywords,
+# en secuencia (hasta 8 round trips si los años recientes no tenían evidencia).
+# Ahora una sola consulta:
+#   - winner: primer año (en orden de prevalencia) con algún candidato vectorial o
+#     por keywords, con los mismos filtros que las consultas por año
+#   - vec / kw: las mismas consultas de antes, solo para el año ganador
+# El resultado es el mismo que el del loop: evidencia del primer año no vacío.
+#
+# winner usa EXISTS (exacto) y vec el índice vectorial (aproximado): con los
+# filtros de año / doc_type un scan HNSW / IVFFlat puede no devolver nada aunque
+# EXISTS fuera cierto. Si el ganador queda sin evidencia, retrieve_across_years
+# repite la consulta con los años siguientes, como hacía el loop.
+
+def _build_fallback_query(
+    query_vec: List[float],
+    years: List[int],
+    top_k: int,
+    prefer_doc_type: Optional[str],
+    include_base_year0: bool,
+    include_null_year: bool,
+    keywords: Optional[List[str]],
+) -> Tuple[str, tuple]:
+    qv = _vec_literal(query_vec)
+    doc_params = doc_type_filter_params(prefer_doc_type, None)
+    params: List[Any] = [list(years)]
+
+    # Con fts el tsquery se arma una sola vez (CTE kwq) y se reutiliza
+    kwq_cte = ""
+    tsquery_sql = ""
+    if keywords and keyword_engine() == "fts":
+        tsq, tsq_params = keyword_tsquery(keywords)
+        kwq_cte = f"""
+    kwq AS (
+        SELECT {tsq} AS q
+    ),"""
+        tsquery_sql = "(SELECT q FROM kwq)"
+        params.extend(tsq_params)
+
+    # merge_results descarta chunks sin texto: un año que solo tiene esos no gana
+    has_vector = f"""EXISTS (
+            SELECT 1
+            FROM public.chunks c
+            JOIN public.documents d ON c.document_id = d.document_id
+            WHERE {year_clause("years.y", include_base_year0, include_null_year)}{DOC_TYPE_FILTER_SQL}
+              AND COALESCE(c.text, '') <> ''
+        )"""
+    params.extend(doc_params)
+
+    has_keywords = ""
+    kw_cte = ""
+    kw_select = ""
+    if keywords:
+        where_keywords, kw_params, score_sql, score_params = keyword_match(keywords, tsquery_sql)
+        has_keywords = f"""
+        OR EXISTS (
+            SELECT 1
+            FROM public.chunks c
+            LEFT JOIN public.documents d ON c.document_id = d.document_id
+            WHERE ({where_keywords})
+              AND (d.exercise_year = 0 OR d.exercise_year = years.y OR d.exercise_year IS NULL)
+              AND COALESCE(c.text, '') <> ''
+        )"""
+        params.extend(kw_params)
+
+    params.extend([qv, *doc_params, qv, top_k])
+
+    if keywords:
+        kw_cte = f""",
+    kw AS (
+        SELECT
+            c.text,
+            c.document_id,
+            COALESCE(d.source_filename, '') AS source_filename,
+            COALESCE(d.doc_type, '') AS doc_type,
+            COALESCE(d.exercise_year, 0) AS exercise_year,
+            c.chunk_id,
+            {score_sql} AS score,
+            CASE WHEN d.doc_type = 'ley' THEN 1
+                 WHEN d.doc_type = 'rmf' THEN 2
+                 ELSE 3 END AS kw_rank
+        FROM public.chunks c
+        LEFT JOIN public.documents d ON c.document_id = d.document_id
+        WHERE EXISTS (SELECT 1 FROM winner)
+          AND ({where_keywords})
+          AND (d.exercise_year = 0 OR d.exercise_year = (SELECT y FROM winner) OR d.exercise_year IS NULL)
+        ORDER BY score DESC, kw_rank, d.exercise_year DESC
+        LIMIT %s
+    )"""
+        params.extend([*score_params, *kw_params, top_k // 2])
+        kw_select = """
+    UNION ALL
+    SELECT
+        'keyword', (SELECT y FROM winner),
+        kw.chunk_id, kw.document_id, NULL, NULL, kw.source_filename, kw.text, kw.doc_type,
+        NULL, NULL, NULL, kw.score,
+        kw.exercise_year, kw.kw_rank
+    FROM kw"""
+
+    # (SELECT y FROM winner) se evalúa una vez (InitPlan): el planner sigue
+    # pudiendo usar el índice vectorial para el ORDER BY <=> ... LIMIT
+    sql = f"""
+    WITH years AS (
+        SELECT y, ord FROM unnest(%s::int[]) WITH ORDINALITY AS t(y, ord)
+    ),{kwq_cte}
+    winner AS MATERIALIZED (
+        SELECT y
+        FROM years
+        WHERE {has_vector}{has_keywords}
+        ORDER BY ord
+        LIMIT 1
+    ),
+    vec AS (
+        SELECT{VECTOR_COLUMNS_SQL}
+        FROM public.chunks c
+        JOIN public.documents d ON c.document_id = d.document_id
+        WHERE EXISTS (SELECT 1 FROM winner)
+          AND {year_clause("(SELECT y FROM winner)", include_base_year0, include_null_year)}{DOC_TYPE_FILTER_SQL}
+        ORDER BY c.embedding <=> %s::vector
+        LIMIT %s
+    ){kw_cte}
+    SELECT
+        'vector' AS kind, (SELECT y FROM winner) AS used_year,
+        vec.*,
+        NULL::int AS exercise_year, NULL::int AS kw_rank
+    FROM vec{kw_select}
+    UNION ALL
+    -- El año ganador viaja aunque vec / kw queden vacíos
+    SELECT
+        'winner', y,
+        NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+        NULL, NULL
+    FROM winner
+    ORDER BY kind DESC, score DESC NULLS LAST, kw_rank, exercise_year DESC
+    """
+    return sql, tuple(params)
+
+
+def _split_fallback_rows(rows) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[int]]:
+    """(filas vectoriales, filas por keywords, año ganador) con el formato de siempre."""
+    vector_rows = [r[2:13] for r in rows if r[0] == "vector"]
+    keyword_rows = [(r[7], r[3], r[6], r[8], r[13], r[2], r[12]) for r in rows if r[0] == "keyword"]
+    used_year = next((r[1] for r in rows if r[0] == "winner"), None)
+    return _rows_to_evidence(vector_rows), _keyword_rows_to_results(keyword_rows), used_year
+
+
+def _has_evidence(ev_vector: List[Dict[str, Any]], ev_keywords: List[Dict[str, Any]]) -> bool:
+    # merge_results descarta los chunks sin texto
+    return bool(ev_keywords) or any(e.get("chunk_text") for e in ev_vector)
+
+
+def retrieve_across_years(
+    conn,
+    query_vec: List[float],
+    years: List[int],
+    top_k: int,
+    keywords: Optional[List[str]] = None,
+    prefer_doc_type: Optional[str] = None,
+    include_base_year0: bool = True,
+    include_null_year: bool = True,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[int]]:
+    """
+    (ev_vector, ev_keywords, used_year) del primer año con evidencia. Un round trip,
+    salvo que el índice vectorial no devuelva nada para el año ganador.
+    """
+    while True:
+        sql, params = _build_fallback_query(
+            query_vec, years, top_k, prefer_doc_type,
+            include_base_year0, include_null_year, keywords,
+        )
+        tuning = tuning_params(top_k, None, None)
+
+        cur = conn.cursor()
+        try:
+            if tuning:
+                cur.execute(VECTOR_TUNING_SQL, tuning)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        except Exception as e:
+            if keywords and is_missing_fts(e):
+                disable_fts(e)
+                continue
+            raise
+        finally:
+            cur.close()
+
+        ev_vector, ev_keywords, used_year = _split_fallback_rows(rows)
+        if used_year is None or _has_evidence(ev_vector, ev_keywords):
+            return ev_vector, ev_keywords, used_year
+        # Ganador sin evidencia en el scan del índice: siguen los años posteriores
+        years = years[years.index(used_year) + 1:]
+        if not years:
+            return [], [], None
+
+
+async def retrieve_across_years_async(
+    aconn,
+    query_vec: List[float],
+    years: List[int],
+    top_k: int,
+    keywords: Optional[List[str]] = None,
+    prefer_doc_type: Optional[str] = None,
+    include_base_year0: bool = True,
+    include_null_year: bool = True,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[int]]:
+    """Igual que retrieve_across_years, sobre una conexión async (psycopg 3)."""
+    while True:
+        sql, params = _build_fallback_query(
+            query_vec, years, top_k, prefer_doc_type,
+            include_base_year0, include_null_year, keywords,
+        )
+        tuning = tuning_params(top_k, None, None)
+
+        try:
+            async with aconn.cursor() as cur:
+                if tuning:
+                    await cur.execute(VECTOR_TUNING_SQL, tuning)
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+        except Exception as e:
+            if keywords and is_missing_fts(e):
+                disable_fts(e)
+                continue
+            raise
+
+        ev_vector, ev_keywords, used_year = _split_fallback_rows(rows)
+        if used_year is None or _has_evidence(ev_vector, ev_keywords):
+            return ev_vector, ev_keywords, used_year
+        years = years[years.index(used_year) + 1:]
+        if not years:
+            return [], [], None
+
+
+# =========================
+# Piezas compartidas (sync / async)
+# =========================
+
+def _article_fast_path(question: str) -> Optional[Dict[str, Any]]:
     """
-    Combina resultados de búsqueda vectorial y por keywords.
-    Elimina duplicados y prioriza resultados vectoriales.
+    Detecta "Artículo N-A [bis]" (uno o varios en la misma pregunta). Si el usuario
+    dice "Regla ...", NO debemos confundirlo con Artículo N-A.
     """
-    seen_texts = set()
-    merged = []
-    
-    # Primero agregamos resultados vectoriales (mayor relevancia)
-    for r in vector_results:
-        text_preview = (r.get("chunk_text") or "")[:200]
-        if text_preview and text_preview not in seen_texts:
-            seen_texts.add(text_preview)
-            r["source"] = "vector"
-            merged.append(r)
-    
-    # Luego agregamos resultados por keyword que no estén duplicados
-    for r in keyword_results:
-        text_preview = (r.get("chunk_text") or "")[:200]
-        if text_preview and text_preview not in seen_texts:
-            seen_texts.add(text_preview)
-            merged.append(r)
-    
-    return merged[:top_k]
+    has_regla = bool(re.search(r"(?i)\bregla\b", question or ""))
+    if has_regla:
+        return None
+
+    # norm_id -> ¿pidió la versión bis?
+    wants_bis: Dict[str, bool] = {}
+    for m in ARTICLE_REF_RE.finditer(question or ""):
+        norm_id = build_article_norm_id(int(m.group(1)), (m.group(2) or "").upper().strip())
+        wants_bis[norm_id] = wants_bis.get(norm_id, False) or bool(m.group(3))
+    if not wants_bis:
+        return None
+
+    return {
+        "norm_ids": list(wants_bis),
+        "wants_bis": wants_bis,
+        "candidates": resolve_candidate_documents(question),
+    }
+
+
+def _filter_bis(ev_direct: List[Dict[str, Any]], wants_bis: Dict[str, bool]) -> List[Dict[str, Any]]:
+    return [
+        e for e in ev_direct
+        if wants_bis.get(e.get("norm_id"), False) or "bis" not in (e.get("chunk_text") or "").lower()
+    ]
+
+
+def _trace_article_lookup(fast: Dict[str, Any], ev_direct: List[Dict[str, Any]]) -> None:
+    trace_append("sql", {
+        "stage": "article_lookup",
+        "documents": fast["candidates"],
+        "norm_ids": fast["norm_ids"],
+        "found": {e["norm_id"]: e["document_id"] for e in ev_direct},
+        "rows": len(ev_direct),
+    })
+
+
+def _vector_preferences(question: str) -> Dict[str, Any]:
+    """Preferencias para vector según intención (RMF vs. base legal)."""
+    has_regla = bool(re.search(r"(?i)\bregla\b", question or ""))
+    has_rmf = bool(re.search(r"(?i)\brmf\b", question or ""))
+
+    if has_regla or has_rmf:
+        return {"prefer_doc_type": "rmf", "include_base_year0": False, "include_null_year": False}
+    return {"prefer_doc_type": None, "include_base_year0": True, "include_null_year": True}
+
+
+def years_to_check(ejercicio: int) -> List[int]:
+    return [ejercicio, 2024, 2023, 2022] if ejercicio >= 2025 else [ejercicio]
+
+
+def _robust_selection(ev: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    # --- LÓGICA DE ROBUSTEZ PARA RMF Y ANEXOS ---
+    compilados = [e for e in ev if "compilado" in (e.get("source_filename") or "").lower()]
+    modificaciones = [e for e in ev if "modificacion" in (e.get("source_filename") or "").lower()]
+
+    if compilados:
+        return compilados[:top_k]
+    if modificaciones:
+        return modificaciones[:top_k]
+    return ev
+
+
+def _keywords_for_budget(keywords: Optional[List[str]]) -> Optional[List[str]]:
+    """Con poco presupuesto se omiten las keywords y basta la vectorial."""
+    if keywords and budget_low(KEYWORD_MIN_BUDGET_S):
+        trace_append("degraded", {"stage": "keyword_search"})
+        return None
+    return keywords
+
+
+def _fallback_result(
+    years: List[int],
+    ev_vector: List[Dict[str, Any]],
+    ev_keywords: List[Dict[str, Any]],
+    used_year: Optional[int],
+    ejercicio: int,
+    top_k: int,
+) -> Tuple[List[Dict[str, Any]], int]:
+    # Mismo trace que el loop por año: los años saltados quedan con 0 filas
+    for y in years:
+        if y == used_year:
+            trace_append("years_tried", {"year": y, "vector_rows": len(ev_vector), "keyword_rows": len(ev_keywords)})
+            break
+        trace_append("years_tried", {"year": y, "vector_rows": 0, "keyword_rows": 0})
+
+    ev = merge_results(ev_vector, ev_keywords, top_k)
+    if ev_keywords:
+        trace_set("retrieval", "fusion", fusion_stats(ev))
+    if used_year is None or not ev:
+        return [], ejercicio
+    return _robust_selection(ev, top_k), used_year
 
 
 def retrieve_context_with_fallback(
-    conn, 
-    query_vec: List[float], 
-    ejercicio: int, 
-    question: str, 
+    conn,
+    query_vec: List[float],
+    ejercicio: int,
+    question: str,
     top_k: int = 12,
     keywords: Optional[List[str]] = None
 ) -> Tuple[List[Dict[str, Any]], int]:
     """
     Recuperación de contexto con fallback jerárquico y búsqueda híbrida.
-    
+
     Nota sobre vigencia:
     - exercise_year = 0: Leyes federales (vigentes siempre)
     - exercise_year = 2025: RMF, Anexos del ejercicio 2025
     """
-    q = (question or "").lower()
-    has_regla = bool(re.search(r"(?i)\bregla\b", question or ""))
-    has_rmf = bool(re.search(r"(?i)\brmf\b", question or ""))    
-
     # 1. CAMINO RÁPIDO: Búsqueda por Artículo Directo
-    m = ARTICLE_REF_RE.search(question or "")
-    if m:
-    #    IMPORTANTE: si el usuario dice "Regla ...", NO debemos confundirlo con Artículo N-A.
-     m = ARTICLE_REF_RE.search(question or "")
-     if m and not has_regla:    
-        art_num = int(m.group(1))
-        art_suffix = (m.group(2) or "").upper().strip()
-        wants_bis = bool(m.group(3))
-        
-        for doc_id in resolve_candidate_documents(question):
-            ev_direct = try_get_article_chunks(conn, doc_id, art_num, art_suffix, limit=12)
-            if ev_direct:
-                if not wants_bis:
-                    ev_direct = [e for e in ev_direct if "bis" not in (e.get("chunk_text") or "").lower()]
-                return ev_direct, 0
-
-    # 2. BÚSQUEDA VECTORIAL INTELIGENTE (Jerarquía de Prevalencia)
-    years_to_check = [ejercicio, 2024, 2023, 2022] if ejercicio >= 2025 else [ejercicio]
-    
-    all_evidence = []
-    final_year = ejercicio
-    # Preferencias para vector según intención:
-    prefer_doc_type = None
-    include_base_year0 = True
-    include_null_year = True
-    if has_regla or has_rmf:
-        prefer_doc_type = "rmf"
-        include_base_year0 = False
-        include_null_year = False
-
-    for y in years_to_check:
-        # Búsqueda vectorial principal
-        ev_vector = retrieve_context(
-            conn,
-            query_vec,
-            y,
-            top_k=top_k,
-            prefer_doc_type=prefer_doc_type,
-            include_base_year0=include_base_year0,
-            include_null_year=include_null_year,
-        )
-        
-        # Búsqueda complementaria por keywords (incluye leyes con year=0)
-        ev_keywords = []
-        if keywords:
-            ev_keywords = retrieve_by_keywords(conn, keywords, y, limit=top_k // 2)
-        
-        # Combinar resultados
-        ev = merge_results(ev_vector, ev_keywords, top_k)
-        
-        if ev:
-            # --- LÓGICA DE ROBUSTEZ PARA RMF Y ANEXOS ---
-            compilados = [e for e in ev if "compilado" in (e.get("source_filename") or "").lower()]
-            modificaciones = [e for e in ev if "modificacion" in (e.get("source_filename") or "").lower()]
-            
-            if compilados:
-                all_evidence = compilados[:top_k]
-            elif modificaciones:
-                all_evidence = modificaciones[:top_k]
-            else:
-                all_evidence = ev
-                
-            final_year = y
-            break
+    fast = _article_fast_path(question)
+    if fast:
+        # Índice en memoria; si no está cargado, un solo round trip a Postgres
+        with stage_timer("article_lookup"):
+            ev_direct = lookup_articles(conn, fast["candidates"], fast["norm_ids"], limit=12)
+        _trace_article_lookup(fast, ev_direct)
+        if ev_direct:
+            return _filter_bis(ev_direct, fast["wants_bis"]), 0
+
+    # 2. BÚSQUEDA HÍBRIDA (Jerarquía de Prevalencia): todos los años en un round trip.
+    # Vector y keywords van en la misma consulta: una sola etapa, fallback_query
+    prefs = _vector_preferences(question)
+    years = years_to_check(ejercicio)
+    keywords = _keywords_for_budget(keywords)
+
+    check_deadline("fallback_query")
+    with stage_timer("fallback_query"):
+        ev_vector, ev_keywords, used_year = retrieve_across_years(conn, query_vec, years, top_k, keywords, **prefs)
+
+    return _fallback_result(years, ev_vector, ev_keywords, used_year, ejercicio, top_k)
+
+
+async def retrieve_context_with_fallback_async(
+    aconn,
+    query_vec: List[float],
+    ejercicio: int,
+    question: str,
+    top_k: int = 12,
+    keywords: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Igual que retrieve_context_with_fallback, sobre una conexión async (psycopg 3)."""
+    fast = _article_fast_path(question)
+    if fast:
+        with stage_timer("article_lookup"):
+            ev_direct = await lookup_articles_async(aconn, fast["candidates"], fast["norm_ids"], limit=12)
+        _trace_article_lookup(fast, ev_direct)
+        if ev_direct:
+            return _filter_bis(ev_direct, fast["wants_bis"]), 0
+
+    prefs = _vector_preferences(question)
+    years = years_to_check(ejercicio)
+    keywords = _keywords_for_budget(keywords)
+
+    check_deadline("fallback_query")
+    with stage_timer("fallback_query"):
+        ev_vector, ev_keywords, used_year = await retrieve_across_years_async(aconn, query_vec, years, top_k, keywords, **prefs)
 
-    return all_evidence, final_year
+    return _fallback_result(years, ev_vector, ev_keywords, used_year, ejercicio, top_k)
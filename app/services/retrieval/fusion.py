@@ -0,0 +1,121 @@
+# app/services/retrieval/fusion.py
+# Fusión de resultados vectoriales y por keywords (búsqueda híbrida).
+#
+# Antes (merge_results): los hits de keywords iban DESPUÉS de todos los vectoriales
+# y se deduplicaba por los primeros 200 caracteres del texto. Un hit léxico fuerte
+# nunca superaba a uno vectorial débil, y el mismo chunk podía colarse dos veces.
+#
+# Ahora se deduplica por chunk_id y se ordena por un score combinado:
+#
+#   FUSION_MODE=rrf       (default) Reciprocal Rank Fusion: sum(w_s / (RRF_K + rank_s))
+#   FUSION_MODE=weighted  scores min-max normalizados por fuente: sum(w_s * norm_s)
+#                         (una fuente con scores constantes aporta NEUTRAL_SCORE)
+#   FUSION_MODE=append    comportamiento anterior (merge_results)
+#
+# Pesos por fuente: FUSION_WEIGHT_VECTOR / FUSION_WEIGHT_KEYWORD.
+# Para medir el efecto sobre evidencia y tamaño de prompt: scripts/compare_fusion.py
+
+import os
+from typing import Any, Dict, List, Optional
+
+FUSION_MODE = os.getenv("FUSION_MODE", "rrf").strip().lower()
+RRF_K = float(os.getenv("RRF_K", "60"))
+FUSION_WEIGHTS = {
+    "vector": float(os.getenv("FUSION_WEIGHT_VECTOR", "1.0")),
+    "keyword": float(os.getenv("FUSION_WEIGHT_KEYWORD", "1.0")),
+}
+
+FUSION_MODES = ("rrf", "weighted", "append")
+
+
+def _key(r: Dict[str, Any]):
+    # Sin chunk_id (filas antiguas) se cae a los primeros 200 caracteres, como antes
+    cid = r.get("chunk_id")
+    return ("id", cid) if cid is not None else ("text", (r.get("chunk_text") or "")[:200])
+
+
+# Scores todos iguales (ILIKE da 0 a todo, un solo hit) no dicen nada: valor neutro.
+# Con 1.0 esos hits empataban con el mejor de la otra fuente y la superaban.
+NEUTRAL_SCORE = 0.5
+
+
+def _normalized(results: List[Dict[str, Any]]) -> List[float]:
+    scores = [float(r.get("score") or 0.0) for r in results]
+    if not scores:
+        return []
+    lo, hi = min(scores), max(scores)
+    if hi - lo <= 1e-12:
+        return [NEUTRAL_SCORE] * len(scores)
+    return [(s - lo) / (hi - lo) for s in scores]
+
+
+def append_results(vector_results: List[Dict], keyword_results: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Combina resultados de búsqueda vectorial y por keywords.
+    Elimina duplicados y prioriza resultados vectoriales.
+    """
+    seen_texts = set()
+    merged = []
+
+    # Primero agregamos resultados vectoriales (mayor relevancia)
+    for r in vector_results:
+        text_preview = (r.get("chunk_text") or "")[:200]
+        if text_preview and text_preview not in seen_texts:
+            seen_texts.add(text_preview)
+            r["source"] = "vector"
+            merged.append(r)
+
+    # Luego agregamos resultados por keyword que no estén duplicados
+    for r in keyword_results:
+        text_preview = (r.get("chunk_text") or "")[:200]
+        if text_preview and text_preview not in seen_texts:
+            seen_texts.add(text_preview)
+            merged.append(r)
+
+    return merged[:top_k]
+
+
+def fuse_results(
+    vector_results: List[Dict[str, Any]],
+    keyword_results: List[Dict[str, Any]],
+    top_k: int,
+    mode: Optional[str] = None,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """Lista fusionada (máx. top_k), cada item con fusion_score y matched_by."""
+    mode = mode or FUSION_MODE
+    if mode == "append":
+        return append_results(vector_results, keyword_results, top_k)
+    weights = weights or FUSION_WEIGHTS
+
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for source, results in (("vector", vector_results), ("keyword", keyword_results)):
+        w = weights.get(source, 1.0)
+        norm = _normalized(results) if mode == "weighted" else []
+        for rank, r in enumerate(results, 1):
+            if not (r.get("chunk_text") or ""):
+                continue
+            contrib = w * norm[rank - 1] if mode == "weighted" else w / (RRF_K + rank)
+            k = _key(r)
+            item = fused.get(k)
+            if item is None:
+                # El primero en llegar (vectorial) conserva sus metadatos completos
+                item = dict(r, source=source, fusion_score=0.0, matched_by=[])
+                fused[k] = item
+            # Mismo chunk por ambas vías: un solo item que suma ambas contribuciones
+            if source not in item["matched_by"]:
+                item["matched_by"].append(source)
+                item["fusion_score"] += contrib
+
+    # sorted es estable: a igual score queda el orden vector -> keyword
+    ranked = sorted(fused.values(), key=lambda e: e["fusion_score"], reverse=True)
+    for e in ranked:
+        e["fusion_score"] = round(e["fusion_score"], 6)
+    return ranked[:top_k]
+
+
+def fusion_stats(fused: List[Dict[str, Any]], mode: Optional[str] = None) -> Dict[str, Any]:
+    """Resumen para el trace: cuántos vinieron de cada vía y cuántos de ambas."""
+    both = sum(1 for e in fused if len(e.get("matched_by") or []) > 1)
+    only_kw = sum(1 for e in fused if (e.get("matched_by") or [e.get("source")]) == ["keyword"])
+    return {"mode": mode or FUSION_MODE, "count": len(fused), "both": both, "keyword_only": only_kw}
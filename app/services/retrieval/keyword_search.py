@@ -0,0 +1,66 @@
+# app/services/retrieval/keyword_search.py
+# Motor de búsqueda por keywords (complemento de la vectorial).
+#
+#   KEYWORD_ENGINE=fts    (default) chunks.text_tsv @@ tsquery, índice GIN y score
+#                         ts_rank_cd. Requiere migrations/002_chunks_fts.sql.
+#   KEYWORD_ENGINE=ilike  c.text ILIKE '%kw%' OR ... (Seq Scan, sin relevancia)
+#
+# Cada keyword se convierte con plainto_tsquery (sus palabras con AND) y las
+# keywords se combinan con || (OR), igual que el OR de ILIKE. Todo parametrizado.
+# Si la base aún no tiene la migración, el primer error cambia el proceso a ilike.
+
+import os
+from typing import Any, List, Tuple
+
+KEYWORD_ENGINE = os.getenv("KEYWORD_ENGINE", "fts").strip().lower()
+
+FTS_CONFIG = "public.es_unaccent"
+
+# undefined_column (falta text_tsv) / undefined_object (falta es_unaccent)
+_MISSING_FTS_SQLSTATES = {"42703", "42704"}
+
+_engine = {"name": KEYWORD_ENGINE if KEYWORD_ENGINE in ("fts", "ilike") else "fts"}
+
+
+def keyword_engine() -> str:
+    return _engine["name"]
+
+
+def is_missing_fts(e: Exception) -> bool:
+    """True si el error viene de una base sin la migración 002 (psycopg2 o psycopg 3)."""
+    code = getattr(e, "pgcode", None) or getattr(e, "sqlstate", None)
+    return keyword_engine() == "fts" and code in _MISSING_FTS_SQLSTATES
+
+
+def disable_fts(e: Exception) -> None:
+    _engine["name"] = "ilike"
+    print(f"⚠️ Búsqueda full-text no disponible ({e}); se usa ILIKE. Aplica migrations/002_chunks_fts.sql")
+
+
+def keyword_tsquery(keywords: List[str]) -> Tuple[str, List[Any]]:
+    """Expresión tsquery (OR de plainto_tsquery) y sus params."""
+    parts = [f"plainto_tsquery('{FTS_CONFIG}', %s)" for _ in keywords]
+    return "(" + " || ".join(parts) + ")", list(keywords)
+
+
+def keyword_match(keywords: List[str], tsquery_sql: str = "") -> Tuple[str, List[Any], str, List[Any]]:
+    """
+    (condición WHERE, params, expresión de score, params) sobre el alias c.
+    tsquery_sql permite reutilizar un tsquery ya calculado (p. ej. de un CTE).
+    """
+    if keyword_engine() == "fts":
+        if tsquery_sql:
+            q, q_params = tsquery_sql, []
+        else:
+            q, q_params = keyword_tsquery(keywords)
+        return f"c.text_tsv @@ {q}", q_params, f"ts_rank_cd(c.text_tsv, {q})", list(q_params)
+
+    # Los patrones viajan como parámetros: un '%' literal dentro del SQL choca
+    # con los placeholders del driver.
+    conditions = []
+    params: List[Any] = []
+    for kw in keywords:
+        safe_kw = kw.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append("c.text ILIKE %s")
+        params.append(f"%{safe_kw}%")
+    return " OR ".join(conditions), params, "0::real", []
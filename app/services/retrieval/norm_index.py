@@ -0,0 +1,399 @@
+# app/services/retrieval/norm_index.py
+# Índice en memoria de artículos y reglas RMF (lookups determinísticos sin Postgres).
+#
+# (document_id, norm_id) -> chunks del artículo   (orden: chunk_id)
+# (exercise_year, norm_id) -> chunks de la regla RMF (orden: page_start, chunk_id)
+#
+# Ese mapeo solo cambia con una reingesta, así que se carga completo (texto y
+# páginas incluidos) y se recarga cuando cambia la versión del corpus
+# (corpus_version.py). Con el índice cargado un id inexistente ("Regla 29-A") es
+# un miss definitivo: se responde [] sin tocar la base.
+#
+# Mientras no está cargado (arranque, recarga tras reingesta, corpus sin versión o
+# demasiado grande) se consulta Postgres como siempre; los ids que no existen
+# quedan en una cache negativa por versión. Ninguna petición espera la carga: la
+# hacen el warm-up y una recarga en segundo plano (tarea async / hilo en sync).
+#
+# Memoria por worker: el texto de cada chunk (<= CHUNK_CHARS de reingest.py, ~1
+# byte por carácter) más ~0.6 KB de tuplas y llaves. Antes de cargar se mide en
+# SQL (NORM_INDEX_SIZE_SQL) y si pasa NORM_INDEX_MAX_CHUNKS o NORM_INDEX_MAX_MB
+# el índice queda desactivado sin traer las filas. Con los defaults, como mucho
+# ~256 MB por worker (x workers de uvicorn).
+#
+# El resultado es el mismo que el de try_get_articles_chunks / try_get_rmf_rule_chunks:
+# se reutilizan sus _rows_to_evidence con filas en el mismo formato.
+
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.db import db_connection, async_db_connection
+from app.services.corpus_version import get_corpus_version, get_corpus_version_async
+from . import article_lookup, rmf_rule_lookup
+
+NORM_INDEX_ENABLED = os.getenv("NORM_INDEX_ENABLED", "1") == "1"
+# Topes de memoria (cada chunk guarda su texto), verificados antes de cargar
+NORM_INDEX_MAX_CHUNKS = int(os.getenv("NORM_INDEX_MAX_CHUNKS", "200000"))
+NORM_INDEX_MAX_MB = float(os.getenv("NORM_INDEX_MAX_MB", "256"))
+NORM_INDEX_NEGATIVE_MAX = int(os.getenv("NORM_INDEX_NEGATIVE_MAX", "10000"))
+# Tras una carga fallida no se reintenta antes de esto (cada petición lo intentaría)
+NORM_INDEX_RETRY_S = float(os.getenv("NORM_INDEX_RETRY_S", "30"))
+
+# Bytes de estructura por chunk además del texto (tupla, fechas, llaves del dict)
+_CHUNK_OVERHEAD_BYTES = 600
+
+_NORM_INDEX_FROM = """
+    FROM public.chunks c
+    JOIN public.documents d ON c.document_id = d.document_id
+    WHERE c.norm_id IS NOT NULL
+      AND (c.norm_kind = 'ARTICLE' OR (c.norm_kind = 'RULE' AND d.doc_type = 'rmf'))"""
+
+NORM_INDEX_SIZE_SQL = f"""
+    SELECT count(*), COALESCE(sum(octet_length(c.text)), 0)
+    {_NORM_INDEX_FROM}
+    """
+
+NORM_INDEX_SQL = f"""
+    SELECT
+      c.chunk_id,
+      c.document_id,
+      c.norm_kind,
+      c.norm_id,
+      d.source_filename,
+      c.text,
+      d.doc_type,
+      d.published_date,
+      c.page_start,
+      c.page_end,
+      d.exercise_year
+    {_NORM_INDEX_FROM}
+    ORDER BY c.chunk_id
+    LIMIT %s
+    """
+
+
+def _build(rows) -> Tuple[Dict[Tuple[str, str], List[tuple]], Dict[Tuple[int, str], List[tuple]]]:
+    articles: Dict[Tuple[str, str], List[tuple]] = {}
+    rules: Dict[Tuple[int, str], List[tuple]] = {}
+    for r in rows:
+        chunk_id, document_id, norm_kind, norm_id, source_filename, text, doc_type, published_date, page_start, page_end, year = r
+        if norm_kind == "ARTICLE":
+            # Formato de ARTICLE_CHUNKS_SQL
+            articles.setdefault((document_id, norm_id), []).append(
+                (chunk_id, source_filename, text, doc_type, published_date, page_start, page_end, 1.0)
+            )
+        else:
+            # Formato de RMF_RULE_CHUNKS_SQL
+            rules.setdefault((year, norm_id), []).append(
+                (chunk_id, document_id, norm_kind, norm_id, source_filename, text, doc_type, published_date, page_start, page_end, 1.0)
+            )
+
+    # Filas ya vienen por chunk_id; las reglas además por page_start NULLS LAST
+    for key, rule_rows in rules.items():
+        rule_rows.sort(key=lambda x: (x[8] is None, x[8] or 0, x[0]))
+    return articles, rules
+
+
+class NormIndex:
+    """Índice inmutable por versión: una recarga arma dicts nuevos y los intercambia. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._articles: Dict[Tuple[str, str], List[tuple]] = {}
+        self._rules: Dict[Tuple[int, str], List[tuple]] = {}
+        self._negative: "OrderedDict[tuple, None]" = OrderedDict()
+        self.version: Optional[str] = None   # versión cargada
+        self.seen_version: Optional[str] = None  # última versión observada
+        self.loading = False
+        self._retry_at = 0.0
+        self.disabled_reason: Optional[str] = None if NORM_INDEX_ENABLED else "NORM_INDEX_ENABLED=0"
+        self.chunks = 0
+        self.estimated_mb = 0.0
+        self.loads = 0
+        self.load_ms = 0.0
+        self.hits = 0
+        self.negative_hits = 0
+        self.db_fallbacks = 0
+        self.unversioned = 0
+
+    # ---------- estado ----------
+
+    @property
+    def ready(self) -> bool:
+        return self.version is not None and self.version == self.seen_version
+
+    def _needs_load(self, version: Optional[str]) -> bool:
+        with self._lock:
+            if version != self.seen_version:
+                self.seen_version = version
+                self._negative.clear()
+            if self.disabled_reason or version is None or self.loading or version == self.version:
+                return False
+            if time.monotonic() < self._retry_at:
+                return False
+            self.loading = True
+            return True
+
+    def _too_big(self, count: int, text_bytes: int) -> Optional[str]:
+        mb = (text_bytes + _CHUNK_OVERHEAD_BYTES * count) / 1e6
+        self.estimated_mb = round(mb, 1)
+        if count > NORM_INDEX_MAX_CHUNKS:
+            return f"{count} chunks > NORM_INDEX_MAX_CHUNKS={NORM_INDEX_MAX_CHUNKS}"
+        if mb > NORM_INDEX_MAX_MB:
+            return f"~{mb:.0f} MB > NORM_INDEX_MAX_MB={NORM_INDEX_MAX_MB:g}"
+        return None
+
+    def _disable(self, reason: str) -> None:
+        with self._lock:
+            self.loading = False
+            self.disabled_reason = reason
+        print(f"⚠️ Índice de normas desactivado: {reason} (se usa Postgres)")
+
+    def _install(self, version: str, rows: List[tuple], seconds: float) -> None:
+        # El corpus pudo crecer entre NORM_INDEX_SIZE_SQL y la carga (LIMIT max + 1)
+        if len(rows) > NORM_INDEX_MAX_CHUNKS:
+            self._disable(f"más de NORM_INDEX_MAX_CHUNKS={NORM_INDEX_MAX_CHUNKS} chunks")
+            return
+        articles, rules = _build(rows)
+        with self._lock:
+            self._articles, self._rules = articles, rules
+            self.version = version
+            self.chunks = len(rows)
+            self.loads += 1
+            self.load_ms = round(1000 * seconds, 1)
+            self.loading = False
+        print(
+            f"✅ Índice de normas (versión {version}): {len(articles)} artículos, {len(rules)} reglas "
+            f"(~{self.estimated_mb} MB, {self.load_ms} ms)"
+        )
+
+    def _load_failed(self, e: Exception) -> None:
+        with self._lock:
+            self.loading = False
+            self._retry_at = time.monotonic() + NORM_INDEX_RETRY_S
+        print(f"⚠️ No se pudo cargar el índice de normas (se usa Postgres): {e}")
+
+    # ---------- carga / recarga ----------
+
+    def _load(self, version: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(NORM_INDEX_SIZE_SQL)
+                    reason = self._too_big(*cur.fetchone())
+                    if reason:
+                        self._disable(reason)
+                        return
+                    cur.execute(NORM_INDEX_SQL, (NORM_INDEX_MAX_CHUNKS + 1,))
+                    rows = cur.fetchall()
+                finally:
+                    cur.close()
+        except Exception as e:
+            self._load_failed(e)
+            return
+        self._install(version, rows, time.perf_counter() - t0)
+
+    def refresh(self) -> None:
+        """Sync: carga o recarga si cambió la versión del corpus (bloquea; scripts / warm-up)."""
+        version = get_corpus_version()
+        if self._needs_load(version):
+            self._load(version)
+
+    def refresh_in_background(self, conn=None) -> None:
+        """
+        Sync, para el pipeline: si cambió la versión, recarga en un hilo y la
+        petición actual sigue por Postgres (nunca espera la carga). conn es la
+        conexión que la petición ya tiene: la versión se lee ahí, sin otro checkout.
+        """
+        version = get_corpus_version(conn)
+        if self._needs_load(version):
+            threading.Thread(target=self._load, args=(version,), name="norm-index", daemon=True).start()
+
+    async def _load_async(self, version: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            async with async_db_connection() as aconn:
+                async with aconn.cursor() as cur:
+                    await cur.execute(NORM_INDEX_SIZE_SQL)
+                    reason = self._too_big(*(await cur.fetchone()))
+                    if reason:
+                        self._disable(reason)
+                        return
+                    await cur.execute(NORM_INDEX_SQL, (NORM_INDEX_MAX_CHUNKS + 1,))
+                    rows = await cur.fetchall()
+        except Exception as e:
+            self._load_failed(e)
+            return
+        # Armar los dicts es CPU: fuera del event loop
+        await asyncio.to_thread(self._install, version, rows, time.perf_counter() - t0)
+
+    async def refresh_async(self, wait: bool = False, aconn=None) -> None:
+        """
+        Async: si cambió la versión, recarga en segundo plano (la petición actual
+        sigue por Postgres). wait=True espera la carga (startup / warm-up).
+        aconn: conexión de la petición, para leer la versión sin otro checkout.
+        """
+        version = await get_corpus_version_async(aconn)
+        if not self._needs_load(version):
+            return
+        if wait:
+            await self._load_async(version)
+        else:
+            task = asyncio.create_task(self._load_async(version))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+
+    # ---------- lookups en memoria (None = no cargado, usar Postgres) ----------
+
+    def articles(self, document_ids: Sequence[str], norm_ids: Sequence[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        if not self.ready:
+            return None
+        evidence: List[Dict[str, Any]] = []
+        found = False
+        for norm_id in dict.fromkeys(norm_ids):
+            # Primer documento en el orden del router que tiene el artículo
+            for doc_id in dict.fromkeys(document_ids):
+                rows = self._articles.get((doc_id, norm_id))
+                if rows:
+                    evidence.extend(article_lookup._rows_to_evidence(rows[:limit], doc_id, norm_id))
+                    found = True
+                    break
+        self._count(found)
+        return evidence
+
+    def rmf_rule(self, ejercicio: int, rule_id: str, prefer_document_id: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        if not self.ready:
+            return None
+        rule_id = (rule_id or "").strip()
+        rows = self._rules.get((ejercicio, rule_id)) or []
+        if prefer_document_id:
+            # sorted es estable: se conserva el orden page_start / chunk_id
+            rows = sorted(rows, key=lambda r: 0 if r[1] == prefer_document_id else 1)
+        self._count(bool(rows))
+        return rmf_rule_lookup._rows_to_evidence(rows[:limit], rule_id)
+
+    def _count(self, found: bool) -> None:
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+
+    # ---------- cache negativa (solo cuando se consulta Postgres) ----------
+
+    def known_missing(self, key: tuple) -> bool:
+        with self._lock:
+            if self.seen_version is None:
+                # Sin versión el índice no puede cargarse: no es un fallback por carga
+                self.unversioned += 1
+                return False
+            if key in self._negative:
+                self.negative_hits += 1
+                return True
+            self.db_fallbacks += 1
+            return False
+
+    def remember_missing(self, key: tuple) -> None:
+        with self._lock:
+            if self.seen_version is None:
+                return  # sin versión no hay forma segura de invalidar
+            self._negative[key] = None
+            while len(self._negative) > NORM_INDEX_NEGATIVE_MAX:
+                self._negative.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "version": self.version,
+                "disabled": self.disabled_reason,
+                "chunks": self.chunks,
+                "estimated_mb": self.estimated_mb,
+                "articles": len(self._articles),
+                "rules": len(self._rules),
+                "loads": self.loads,
+                "load_ms": self.load_ms,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "db_fallbacks": self.db_fallbacks,
+                "unversioned": self.unversioned,
+                "negative_size": len(self._negative),
+            }
+
+
+_background: set = set()
+
+norm_index = NormIndex()
+
+
+# =========================
+# Lookups para el pipeline (índice -> cache negativa -> Postgres)
+# =========================
+
+def _article_key(document_ids: Sequence[str], norm_ids: Sequence[str]) -> tuple:
+    return ("article", tuple(document_ids), tuple(norm_ids))
+
+
+def _rule_key(ejercicio: int, rule_id: str, prefer_document_id: Optional[str]) -> tuple:
+    return ("rule", ejercicio, (rule_id or "").strip(), prefer_document_id)
+
+
+def lookup_articles(conn, document_ids: Sequence[str], norm_ids: Sequence[str], limit: int = 50) -> List[Dict[str, Any]]:
+    norm_index.refresh_in_background(conn)
+    served = norm_index.articles(document_ids, norm_ids, limit)
+    if served is not None:
+        return served
+    key = _article_key(document_ids, norm_ids)
+    if norm_index.known_missing(key):
+        return []
+    evidence = article_lookup.try_get_articles_chunks(conn, document_ids, norm_ids, limit=limit)
+    if not evidence:
+        norm_index.remember_missing(key)
+    return evidence
+
+
+async def lookup_articles_async(aconn, document_ids: Sequence[str], norm_ids: Sequence[str], limit: int = 50) -> List[Dict[str, Any]]:
+    await norm_index.refresh_async(aconn=aconn)
+    served = norm_index.articles(document_ids, norm_ids, limit)
+    if served is not None:
+        return served
+    key = _article_key(document_ids, norm_ids)
+    if norm_index.known_missing(key):
+        return []
+    evidence = await article_lookup.try_get_articles_chunks_async(aconn, document_ids, norm_ids, limit=limit)
+    if not evidence:
+        norm_index.remember_missing(key)
+    return evidence
+
+
+def lookup_rmf_rule(conn, ejercicio: int, rule_id: str, prefer_document_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    norm_index.refresh_in_background(conn)
+    served = norm_index.rmf_rule(ejercicio, rule_id, prefer_document_id, limit)
+    if served is not None:
+        return served
+    key = _rule_key(ejercicio, rule_id, prefer_document_id)
+    if norm_index.known_missing(key):
+        return []
+    evidence = rmf_rule_lookup.try_get_rmf_rule_chunks(conn, ejercicio, rule_id, prefer_document_id, limit)
+    if not evidence:
+        norm_index.remember_missing(key)
+    return evidence
+
+
+async def lookup_rmf_rule_async(aconn, ejercicio: int, rule_id: str, prefer_document_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    await norm_index.refresh_async(aconn=aconn)
+    served = norm_index.rmf_rule(ejercicio, rule_id, prefer_document_id, limit)
+    if served is not None:
+        return served
+    key = _rule_key(ejercicio, rule_id, prefer_document_id)
+    if norm_index.known_missing(key):
+        return []
+    evidence = await rmf_rule_lookup.try_get_rmf_rule_chunks_async(aconn, ejercicio, rule_id, prefer_document_id, limit)
+    if not evidence:
+        norm_index.remember_missing(key)
+    return evidence
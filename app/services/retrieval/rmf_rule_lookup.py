@@ -3,26 +3,9 @@ import re
 from typing import List, Dict, Any, Optional
 
 
-def try_get_rmf_rule_chunks(
-    conn,
-    ejercicio: int,
-    rule_id: str,
-    prefer_document_id: Optional[str] = None,
-    limit: int = 50,
-) -> List[Dict[str, Any]]:
-    """
-    Lookup determinístico RMF por norm_id (ej: '2.1.1', '2.7.1.46').
-
-    Requisitos en DB:
-      - documents.doc_type = 'rmf'
-      - documents.exercise_year = ejercicio
-      - chunks.norm_kind = 'RULE'
-      - chunks.norm_id = rule_id
-    """
-
-    rule_id = (rule_id or "").strip()
-
-    sql = """
+# Nota: los %s::text explícitos permiten que el mismo SQL corra con psycopg 3
+# (parámetros server-side), donde un NULL sin tipo no se puede inferir.
+RMF_RULE_CHUNKS_SQL = """
     SELECT
       c.chunk_id,
       c.document_id,
@@ -42,17 +25,14 @@ def try_get_rmf_rule_chunks(
       AND c.norm_kind = 'RULE'
       AND c.norm_id = %s
     ORDER BY
-      CASE WHEN %s IS NOT NULL AND c.document_id = %s THEN 0 ELSE 1 END,
+      CASE WHEN %s::text IS NOT NULL AND c.document_id = %s::text THEN 0 ELSE 1 END,
       c.page_start NULLS LAST,
       c.chunk_id ASC
     LIMIT %s
     """
 
-    cur = conn.cursor()
-    cur.execute(sql, (ejercicio, rule_id, prefer_document_id, prefer_document_id, limit))
-    rows = cur.fetchall()
-    cur.close()
 
+def _rows_to_evidence(rows, rule_id: str) -> List[Dict[str, Any]]:
     evidence: List[Dict[str, Any]] = []
     for r in rows:
         pub_date = r[7].isoformat() if r[7] else "S/F"
@@ -70,7 +50,8 @@ def try_get_rmf_rule_chunks(
             "score": float(r[10]),
             "source": "rmf_rule_lookup",
         })
-        # ------------------------------------------------------------
+
+    # ------------------------------------------------------------
     # Post-proceso: preferir el "cuerpo" de la regla (inicia con "2.x.x.")
     # y evitar encabezados/índices tipo "regla 2.x.x."
     # ------------------------------------------------------------
@@ -79,5 +60,50 @@ def try_get_rmf_rule_chunks(
     body = [e for e in evidence if body_pat.search((e.get("chunk_text") or ""))]
     if body:
         evidence = body
-    
+
     return evidence
+
+
+def try_get_rmf_rule_chunks(
+    conn,
+    ejercicio: int,
+    rule_id: str,
+    prefer_document_id: Optional[str] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """
+    Lookup determinístico RMF por norm_id (ej: '2.1.1', '2.7.1.46').
+
+    Requisitos en DB:
+      - documents.doc_type = 'rmf'
+      - documents.exercise_year = ejercicio
+      - chunks.norm_kind = 'RULE'
+      - chunks.norm_id = rule_id
+    """
+
+    rule_id = (rule_id or "").strip()
+
+    cur = conn.cursor()
+    cur.execute(RMF_RULE_CHUNKS_SQL, (ejercicio, rule_id, prefer_document_id, prefer_document_id, limit))
+    rows = cur.fetchall()
+    cur.close()
+
+    return _rows_to_evidence(rows, rule_id)
+
+
+async def try_get_rmf_rule_chunks_async(
+    aconn,
+    ejercicio: int,
+    rule_id: str,
+    prefer_document_id: Optional[str] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """Igual que try_get_rmf_rule_chunks, sobre una conexión async (psycopg 3)."""
+
+    rule_id = (rule_id or "").strip()
+
+    async with aconn.cursor() as cur:
+        await cur.execute(RMF_RULE_CHUNKS_SQL, (ejercicio, rule_id, prefer_document_id, prefer_document_id, limit))
+        rows = await cur.fetchall()
+
+    return _rows_to_evidence(rows, rule_id)
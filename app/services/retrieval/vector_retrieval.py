@@ -1,31 +1,43 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+
+from app.core.config import VECTOR_IVFFLAT_PROBES, VECTOR_HNSW_EF_SEARCH
+
+# El ORDER BY usa <=> (coseno): el índice debe ser vector_cosine_ops
+# (scripts/pgvector_index.py inspect / rebuild / explain).
+# Los defaults de probes / ef_search se fijan en cada checkout (app/core/db.py);
+# esto solo se ejecuta cuando una consulta necesita otros valores. Dura hasta el
+# siguiente checkout, que vuelve a fijar los defaults.
+VECTOR_TUNING_SQL = "SELECT set_config('ivfflat.probes', %s, false), set_config('hnsw.ef_search', %s, false)"
 
 def _vec_literal(vec: List[float]) -> str:
     return "[" + ",".join(f"{x:.8f}" for x in vec) + "]"
 
-def retrieve_context(
-    conn,
-    query_vec: List[float],
-    ejercicio: int,
-    top_k: int = 8,
-    prefer_doc_type: str | None = None,
-    exclude_doc_type: str | None = None,
-    include_base_year0: bool = True,
-    include_null_year: bool = True,
-) -> List[Dict[str, Any]]:
-    cur = conn.cursor()
-    qv = _vec_literal(query_vec)
-
-    year_clause = "d.exercise_year = %s"
+def year_clause(year_sql: str, include_base_year0: bool, include_null_year: bool) -> str:
+    """Filtro de vigencia sobre d.exercise_year; year_sql es el placeholder o expresión del año."""
     if include_base_year0 and include_null_year:
-        year_clause = "(d.exercise_year = %s OR d.exercise_year = 0 OR d.exercise_year IS NULL)"
-    elif include_base_year0:
-        year_clause = "(d.exercise_year = %s OR d.exercise_year = 0)"
-    elif include_null_year:
-        year_clause = "(d.exercise_year = %s OR d.exercise_year IS NULL)"
+        return f"(d.exercise_year = {year_sql} OR d.exercise_year = 0 OR d.exercise_year IS NULL)"
+    if include_base_year0:
+        return f"(d.exercise_year = {year_sql} OR d.exercise_year = 0)"
+    if include_null_year:
+        return f"(d.exercise_year = {year_sql} OR d.exercise_year IS NULL)"
+    return f"d.exercise_year = {year_sql}"
 
-    sql = f"""
-    SELECT 
+# Los %s::text explícitos permiten reutilizar el SQL con psycopg 3 (async)
+DOC_TYPE_FILTER_SQL = """
+      AND (%s::text IS NULL OR d.doc_type = %s::text)
+      AND (%s::text IS NULL OR d.doc_type <> %s::text)
+      AND (%s::text IS NULL OR %s::text <> 'rmf' OR c.norm_kind IS NOT NULL)
+      AND (d.doc_type <> 'rmf' OR c.norm_kind IS NOT NULL)"""
+
+def doc_type_filter_params(prefer_doc_type: str | None, exclude_doc_type: str | None) -> tuple:
+    return (
+        prefer_doc_type, prefer_doc_type,
+        exclude_doc_type, exclude_doc_type,
+        prefer_doc_type, prefer_doc_type,
+    )
+
+# Columnas que espera _rows_to_evidence
+VECTOR_COLUMNS_SQL = """
         c.chunk_id,
         c.document_id,
         c.norm_kind,
@@ -36,34 +48,47 @@ def retrieve_context(
         d.published_date,
         c.page_start,
         c.page_end,
-        1 - (c.embedding <=> %s::vector) as score
+        1 - (c.embedding <=> %s::vector) as score"""
+
+def _build_vector_query(
+    query_vec: List[float],
+    ejercicio: int,
+    top_k: int,
+    prefer_doc_type: str | None,
+    exclude_doc_type: str | None,
+    include_base_year0: bool,
+    include_null_year: bool,
+) -> Tuple[str, tuple]:
+    qv = _vec_literal(query_vec)
+
+    sql = f"""
+    SELECT{VECTOR_COLUMNS_SQL}
     FROM public.chunks c
     JOIN public.documents d ON c.document_id = d.document_id
-    WHERE {year_clause}
-      AND (%s IS NULL OR d.doc_type = %s)
-      AND (%s IS NULL OR d.doc_type <> %s)
-      AND (%s IS NULL OR %s <> 'rmf' OR c.norm_kind IS NOT NULL)
-      AND (d.doc_type <> 'rmf' OR c.norm_kind IS NOT NULL)
+    WHERE {year_clause("%s", include_base_year0, include_null_year)}{DOC_TYPE_FILTER_SQL}
     ORDER BY c.embedding <=> %s::vector
     LIMIT %s
     """
 
-    cur.execute(
-        sql,
-        (
-            qv,
-            ejercicio,
-            prefer_doc_type, prefer_doc_type,
-            exclude_doc_type, exclude_doc_type,
-            prefer_doc_type, prefer_doc_type,
-            qv,
-            top_k
-        )
+    params = (
+        qv,
+        ejercicio,
+        *doc_type_filter_params(prefer_doc_type, exclude_doc_type),
+        qv,
+        top_k
     )
+    return sql, params
 
-    rows = cur.fetchall()
-    cur.close()
+def tuning_params(top_k: int, ef_search: int | None, probes: int | None) -> tuple | None:
+    """Params para VECTOR_TUNING_SQL, o None si bastan los defaults de la conexión."""
+    # HNSW nunca devuelve más de ef_search filas: con top_k mayor se perderían resultados
+    ef = max(ef_search or VECTOR_HNSW_EF_SEARCH, top_k)
+    pr = probes or VECTOR_IVFFLAT_PROBES
+    if ef == VECTOR_HNSW_EF_SEARCH and pr == VECTOR_IVFFLAT_PROBES:
+        return None
+    return (str(pr), str(ef))
 
+def _rows_to_evidence(rows) -> List[Dict[str, Any]]:
     evidence: List[Dict[str, Any]] = []
     for r in rows:
         pub_date = r[7].isoformat() if r[7] else "S/F"
@@ -83,3 +108,58 @@ def retrieve_context(
         })
 
     return evidence
+
+def retrieve_context(
+    conn,
+    query_vec: List[float],
+    ejercicio: int,
+    top_k: int = 8,
+    prefer_doc_type: str | None = None,
+    exclude_doc_type: str | None = None,
+    include_base_year0: bool = True,
+    include_null_year: bool = True,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> List[Dict[str, Any]]:
+    sql, params = _build_vector_query(
+        query_vec, ejercicio, top_k,
+        prefer_doc_type, exclude_doc_type,
+        include_base_year0, include_null_year,
+    )
+    tuning = tuning_params(top_k, ef_search, probes)
+
+    cur = conn.cursor()
+    if tuning:
+        cur.execute(VECTOR_TUNING_SQL, tuning)
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.close()
+
+    return _rows_to_evidence(rows)
+
+async def retrieve_context_async(
+    aconn,
+    query_vec: List[float],
+    ejercicio: int,
+    top_k: int = 8,
+    prefer_doc_type: str | None = None,
+    exclude_doc_type: str | None = None,
+    include_base_year0: bool = True,
+    include_null_year: bool = True,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> List[Dict[str, Any]]:
+    sql, params = _build_vector_query(
+        query_vec, ejercicio, top_k,
+        prefer_doc_type, exclude_doc_type,
+        include_base_year0, include_null_year,
+    )
+    tuning = tuning_params(top_k, ef_search, probes)
+
+    async with aconn.cursor() as cur:
+        if tuning:
+            await cur.execute(VECTOR_TUNING_SQL, tuning)
+        await cur.execute(sql, params)
+        rows = await cur.fetchall()
+
+    return _rows_to_evidence(rows)
@@ -0,0 +1,80 @@
+# app/services/search.py
+# Búsqueda "solo evidencia" (/search): mismas rutas que /chat (RMF, artículo,
+# vector + fallback) pero sin llamada al LLM. Acepta una pregunta o un lote.
+
+import asyncio
+import os
+from typing import List, Dict, Any, Optional
+
+from app.core.db import async_db_connection
+from app.core.deadline import start_deadline, end_deadline
+from app.services.rag_engine import TOP_K, source_summary
+from app.services.rag_engine_async import retrieve_evidence_async, embed_texts_async
+from app.services.retrieval.query_expansion import expand_query
+
+# Máximo de preguntas por lote y de retrievals simultáneos (cada uno ocupa una conexión)
+SEARCH_MAX_BATCH = int(os.getenv("SEARCH_MAX_BATCH", "50"))
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "8"))
+
+
+def format_search_result(question: str, plan: Dict[str, Any], include_text: bool = False) -> Dict[str, Any]:
+    evidence = plan["evidence"]
+    ranked = []
+    for rank, e in enumerate(evidence, 1):
+        item = {"rank": rank, **source_summary(e, excerpt=not include_text)}
+        if include_text:
+            item["text"] = e.get("chunk_text") or ""
+        ranked.append(item)
+
+    return {
+        "question": question,
+        "expanded_query": plan["expanded_query"],
+        "route_used": plan["route_used"],
+        "used_year": plan["used_year"],
+        "evidence_count": len(evidence),
+        "evidence": ranked,
+    }
+
+
+async def search_evidence_async(
+    questions: List[str],
+    ejercicio: int = 2025,
+    top_k: Optional[int] = None,
+    include_text: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Recupera evidencia para cada pregunta, en el mismo orden de entrada.
+
+    - Todos los embeddings se piden en UNA llamada (lote) a OpenAI.
+    - Los retrievals corren en paralelo, acotados por SEARCH_CONCURRENCY.
+    - Un error en una pregunta no tumba el lote: se reporta en su resultado.
+    - Todo el lote comparte un deadline (REQUEST_DEADLINE_S), igual que /chat: si se
+      agota en el embedding -> DeadlineExceeded (504); en un retrieval, error de esa pregunta.
+    """
+    if len(questions) > SEARCH_MAX_BATCH:
+        raise ValueError(f"Máximo {SEARCH_MAX_BATCH} preguntas por solicitud.")
+
+    top_k = top_k or TOP_K
+
+    start_deadline()
+    try:
+        # El embedding se calcula sobre la consulta expandida, igual que en /chat
+        expanded = [expand_query(q)[0] for q in questions]
+        vectors = await embed_texts_async(expanded)
+
+        sem = asyncio.Semaphore(SEARCH_CONCURRENCY)
+
+        async def one(question: str, query_vec: List[float]) -> Dict[str, Any]:
+            async with sem:
+                try:
+                    async with async_db_connection() as aconn:
+                        plan = await retrieve_evidence_async(aconn, question, ejercicio, top_k=top_k, query_vec=query_vec)
+                except Exception as e:
+                    return {"question": question, "error": str(e)}
+
+            return format_search_result(question, plan, include_text)
+
+        # Las tareas de gather copian el contexto: heredan el deadline
+        return await asyncio.gather(*(one(q, v) for q, v in zip(questions, vectors)))
+    finally:
+        end_deadline()
@@ -0,0 +1,172 @@
+# app/services/sessions.py
+# Sesiones de conversación del lado del servidor.
+#
+# Por sesión se guarda solo lo necesario para el siguiente turno (JSON compacto):
+#   - turns:     últimos SESSION_MAX_TURNS mensajes, con su conteo de tokens
+#                (app/services/history.py los compacta al armar el prompt)
+#   - chunk_ids: evidencia del turno anterior, en orden de relevancia
+#   - article:   artículo resuelto ({document_id, norm_id, source_filename}) si lo hubo
+#   - used_year
+#
+# Un seguimiento tipo "¿y la fracción XI?" (sin citar artículo ni regla) reutiliza
+# esos chunk_ids con un SELECT por llave primaria y los reordena para poner primero
+# la fracción/inciso pedido: sin embedding ni búsqueda vectorial.
+#
+# Vive en memoria del proceso y en shared_backend (SQLite/Redis), así que el turno
+# siguiente puede caer en cualquier worker.
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.tokens import count_tokens
+from app.services.cache.shared_backend import CacheBackend, shared_backend
+
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "7200"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "5000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "12"))
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# "fracción XI", "inciso b", "párrafo 2", "numeral 3"
+FOLLOWUP_RE = re.compile(r"(?i)\b(fracci[oó]n|inciso|p[aá]rrafo|numeral)\s+([ivxlcdm]+|\d{1,3}|[a-z])\b")
+# Si cita artículo o regla de forma explícita ya no es un seguimiento
+EXPLICIT_REF_RE = re.compile(r"(?i)\b(art[ií]culo|art\.|regla)\s*\d")
+
+_PREFIX = "ses:"
+
+
+def valid_session_id(session_id: str) -> bool:
+    return bool(SESSION_ID_RE.match(session_id or ""))
+
+
+class SessionStore:
+    """LRU + TTL en memoria, con copia en el backend compartido. Thread-safe."""
+
+    def __init__(self, max_entries: int = SESSION_MAX, ttl_s: float = SESSION_TTL_S, backend: CacheBackend = shared_backend):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.backend = backend
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.saves = 0
+        self.followups = 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de la sesión o None si no existe / expiró (I/O: desde async usar to_thread)."""
+        # El compartido manda: el turno anterior pudo atenderlo otro worker
+        blob = self.backend.get(_PREFIX + session_id)
+        with self._lock:
+            self.loads += 1
+            if blob is not None:
+                state = json.loads(blob)
+                self._data[session_id] = (time.monotonic(), state)
+                self._data.move_to_end(session_id)
+                return state
+            item = self._data.get(session_id)
+            if item is None or time.monotonic() - item[0] > self.ttl_s:
+                return None
+            return item[1]
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self.saves += 1
+            self._data[session_id] = (time.monotonic(), state)
+            self._data.move_to_end(session_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        self.backend.set(_PREFIX + session_id, json.dumps(state, ensure_ascii=False, default=str).encode("utf-8"), self.ttl_s)
+
+    def count_followup(self) -> None:
+        with self._lock:
+            self.followups += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "loads": self.loads,
+                "saves": self.saves,
+                "followups": self.followups,
+            }
+
+
+session_store = SessionStore()
+
+
+# =========================
+# Helpers para el pipeline
+# =========================
+
+def session_history(session: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
+    return list((session or {}).get("turns") or [])
+
+
+def followup_request(question: str, session: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """{"kind": "fraccion", "ref": "XI"} si la pregunta es un seguimiento reutilizable."""
+    if not session or not session.get("chunk_ids"):
+        return None
+    if EXPLICIT_REF_RE.search(question or ""):
+        return None
+    m = FOLLOWUP_RE.search(question or "")
+    if not m:
+        return None
+    kind = m.group(1).lower().replace("ó", "o").replace("á", "a")
+    return {"kind": kind, "ref": m.group(2)}
+
+
+def _marker_re(followup: Dict[str, Any]) -> Optional["re.Pattern"]:
+    ref = re.escape(followup["ref"])
+    if followup["kind"] == "fraccion":
+        return re.compile(rf"(?im)^\s*{ref}\s*[\.\-–]")
+    if followup["kind"] == "inciso":
+        return re.compile(rf"(?im)^\s*{ref}\)")
+    return None  # párrafo / numeral: sin marcador confiable, se reutiliza todo
+
+
+def narrow_evidence(evidence: List[Dict[str, Any]], followup: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], int]:
+    """Pone primero los chunks que contienen la fracción/inciso pedido; devuelve (evidencia, n_match)."""
+    marker = _marker_re(followup)
+    if marker is None:
+        return evidence, 0
+    hits = [e for e in evidence if marker.search(e.get("chunk_text") or "")]
+    rest = [e for e in evidence if not marker.search(e.get("chunk_text") or "")]
+    return hits + rest, len(hits)
+
+
+def _resolved_article(sources: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    for s in sources:
+        if (s.get("norm_kind") or "").upper() == "ARTICLE" and s.get("norm_id"):
+            return {"document_id": s.get("document_id"), "norm_id": s.get("norm_id"), "source_filename": s.get("source_filename")}
+    return None
+
+
+def session_turn(session: Optional[Dict[str, Any]], question: str, answer: str, debug: Dict[str, Any]) -> Dict[str, Any]:
+    """Nuevo estado de la sesión a partir del debug del turno que acaba de terminar."""
+    prev = session or {}
+    turns = session_history(prev) + [
+        {"role": "user", "content": question, "tokens": count_tokens(question)},
+        {"role": "assistant", "content": answer, "tokens": count_tokens(answer)},
+    ]
+
+    sources = debug.get("sources") or []
+    chunk_ids = debug.get("chunk_ids") or debug.get("literal_selected_chunk_ids") or [
+        s["chunk_id"] for s in sources if s.get("chunk_id") is not None
+    ]
+    # Un seguimiento conserva el artículo del turno que lo originó
+    article = _resolved_article(sources) or (prev.get("article") if debug.get("route_used") == "session_followup" else None)
+
+    return {
+        "turns": turns[-SESSION_MAX_TURNS:],
+        "chunk_ids": chunk_ids or prev.get("chunk_ids") or [],
+        "article": article,
+        "used_year": debug.get("used_year", prev.get("used_year")),
+        "updated_at": time.time(),
+    }
@@ -0,0 +1,81 @@
+# app/services/singleflight.py
+# Coalescencia (single-flight) de preguntas idénticas concurrentes.
+#
+# Cuando sale una regla nueva de la RMF llegan decenas de preguntas iguales en
+# segundos. La primera abre el "vuelo" (embedding + retrieval + LLM) en una tarea
+# propia; las que llegan mientras sigue en curso se cuelgan del mismo vuelo y
+# reciben todos los eventos, incluidos los que ya se emitieron.
+#
+# El vuelo no depende de ningún cliente: si quien lo abrió se desconecta, los
+# demás siguen recibiendo tokens.
+
+import asyncio
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+class _Flight:
+    def __init__(self):
+        self.events: List[Event] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class StreamCoalescer:
+    """Un vuelo por llave; cada consumidor recibe la secuencia completa de eventos."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    async def _run(self, key: str, flight: _Flight, factory: Callable[[], AsyncGenerator[Event, None]]) -> None:
+        try:
+            async for event in factory():
+                async with flight.cond:
+                    flight.events.append(event)
+                    flight.cond.notify_all()
+        except Exception as e:
+            # Se re-lanza en cada consumidor después de los eventos ya emitidos
+            flight.error = e
+        finally:
+            # Quien llegue después ya no se cuelga de este vuelo (irá a la cache)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncGenerator[Event, None]]) -> AsyncGenerator[Event, None]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            self.flights += 1
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+        else:
+            self.coalesced += 1
+
+        i = 0
+        while True:
+            async with flight.cond:
+                while i >= len(flight.events) and not flight.done:
+                    await flight.cond.wait()
+                pending = flight.events[i:]
+                finished = flight.done
+            for event in pending:
+                yield event
+            i += len(pending)
+            if finished and i >= len(flight.events):
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._flights), "flights": self.flights, "coalesced": self.coalesced}
+
+
+answer_flights = StreamCoalescer()
@@ -0,0 +1,148 @@
+# app/services/warmup.py
+# Warm-up después de cada deploy / scale-out, y estado para /api/ready.
+#
+# 1) Importa en segundo plano los módulos pesados que ahora son perezosos (openai, numpy),
+#    crea el cliente AsyncOpenAI y precarga el encoding de tiktoken.
+# 2) Una consulta vectorial representativa por doc_type, cada una en su propia
+#    conexión del pool: abre/valida conexiones y sube al buffer cache las páginas
+#    del índice pgvector que recorre una pregunta real. El vector de consulta es un
+#    embedding ya guardado en chunks (no cuesta llamadas a OpenAI).
+# 3) pg_prewarm de los índices de public.chunks, si la extensión está instalada.
+# 4) Índice en memoria de artículos / reglas RMF (retrieval/norm_index.py).
+#
+# /api/ready responde 200 solo cuando esto terminó; si la base no responde se
+# reintenta cada WARMUP_RETRY_S segundos.
+
+import os
+import json
+import time
+import asyncio
+import importlib
+from typing import Any, Dict, List
+
+from app.core.db import async_db_connection
+from app.core.tokens import preload_encoding
+from app.services.rag_engine import TOP_K
+from app.services.retrieval.norm_index import norm_index
+from app.services.retrieval.vector_retrieval import retrieve_context_async
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_EJERCICIO = int(os.getenv("WARMUP_EJERCICIO", "2025"))
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", "10"))
+
+DOC_TYPES_SQL = "SELECT DISTINCT doc_type FROM public.documents WHERE doc_type IS NOT NULL"
+
+SAMPLE_EMBEDDING_SQL = """
+SELECT c.embedding::text
+FROM public.chunks c
+JOIN public.documents d ON c.document_id = d.document_id
+WHERE d.doc_type = %s AND c.embedding IS NOT NULL
+LIMIT 1
+"""
+
+HAS_PREWARM_SQL = "SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'"
+
+PREWARM_SQL = """
+SELECT i.indexrelid::regclass::text, pg_prewarm(i.indexrelid::regclass)
+FROM pg_index i
+WHERE i.indrelid = 'public.chunks'::regclass
+"""
+
+_state: Dict[str, Any] = {
+    "status": "pending",  # pending | running | ready | retrying
+    "attempts": 0,
+    "started_at": None,
+    "elapsed_s": None,
+    "doc_types": {},
+    "prewarm": None,
+    "norm_index": None,
+    "tokenizer": None,
+    "error": None,
+}
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def readiness() -> Dict[str, Any]:
+    return dict(_state)
+
+
+def _load_deferred_modules() -> None:
+    from app.services.rag_engine_async import get_aclient
+
+    for name in ("openai", "numpy"):
+        importlib.import_module(name)
+    get_aclient()
+    # La primera vez tiktoken descarga el BPE: aquí y no dentro de una petición
+    _state["tokenizer"] = preload_encoding()
+
+
+async def _warm_doc_type(doc_type: str) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    async with async_db_connection() as aconn:
+        async with aconn.cursor() as cur:
+            await cur.execute(SAMPLE_EMBEDDING_SQL, (doc_type,))
+            row = await cur.fetchone()
+        if not row or not row[0]:
+            return {"rows": 0, "ms": round(1000 * (time.perf_counter() - t0), 1), "note": "sin embeddings"}
+
+        query_vec: List[float] = json.loads(row[0])
+        evidence = await retrieve_context_async(aconn, query_vec, WARMUP_EJERCICIO, top_k=TOP_K, prefer_doc_type=doc_type)
+    return {"rows": len(evidence), "ms": round(1000 * (time.perf_counter() - t0), 1)}
+
+
+async def _prewarm_indexes() -> Dict[str, Any]:
+    async with async_db_connection() as aconn:
+        async with aconn.cursor() as cur:
+            await cur.execute(HAS_PREWARM_SQL)
+            if await cur.fetchone() is None:
+                return {"skipped": "extensión pg_prewarm no instalada"}
+            await cur.execute(PREWARM_SQL)
+            return {name: blocks for name, blocks in await cur.fetchall()}
+
+
+async def _warm_once() -> None:
+    await asyncio.to_thread(_load_deferred_modules)
+
+    async with async_db_connection() as aconn:
+        async with aconn.cursor() as cur:
+            await cur.execute(DOC_TYPES_SQL)
+            doc_types = [r[0] for r in await cur.fetchall()]
+
+    results = await asyncio.gather(*(_warm_doc_type(dt) for dt in doc_types))
+    _state["doc_types"] = dict(zip(doc_types, results))
+
+    # Si falla, los lookups siguen por Postgres y se reintenta con la próxima versión
+    await norm_index.refresh_async(wait=True)
+    _state["norm_index"] = {k: norm_index.stats()[k] for k in ("ready", "chunks", "estimated_mb", "load_ms")}
+
+    # Opcional: sin pg_prewarm (o sin permisos) igual quedamos listos
+    try:
+        _state["prewarm"] = await _prewarm_indexes()
+    except Exception as e:
+        _state["prewarm"] = {"error": str(e)}
+
+
+async def run_warmup() -> None:
+    """Corre en segundo plano desde el startup de FastAPI hasta quedar listo."""
+    _state["started_at"] = time.time()
+    t0 = time.perf_counter()
+
+    if not WARMUP_ENABLED:
+        _state.update(status="ready", elapsed_s=0.0)
+        return
+
+    while True:
+        _state["status"] = "running"
+        _state["attempts"] += 1
+        try:
+            await _warm_once()
+            _state.update(status="ready", error=None, elapsed_s=round(time.perf_counter() - t0, 3))
+            print(f"✅ Warm-up listo en {_state['elapsed_s']}s ({len(_state['doc_types'])} doc_types)")
+            return
+        except Exception as e:
+            _state.update(status="retrying", error=str(e))
+            print(f"⚠️ Warm-up falló (intento {_state['attempts']}): {e}")
+            await asyncio.sleep(WARMUP_RETRY_S)
@@ -1,20 +1,87 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Union
+import json
+import asyncio
+from contextlib import ExitStack
+from app.core.db import open_async_pool, close_async_pool, pool_stats
+from app.core.metrics import register_stats, render_metrics
+from app.core.tracing import trace_store
+from app.core.profiler import profiled, should_profile
+from app.core.deadline import DeadlineExceeded, deadline_stats
+from app.services.cache.answer_cache import answer_cache
+from app.services.cache.semantic_cache import semantic_cache
+from app.services.cache.embedding_cache import embedding_cache
+from app.services.cache.shared_backend import shared_backend
+from app.services.singleflight import answer_flights
+from app.services.sessions import session_store, valid_session_id
+from app.services.admission import AdmissionRejected, admission_stats
 from app.services.retrieval.doc_router import resolve_candidate_documents
-from app.services.rag_engine import generate_response_with_rag
+from app.services.retrieval.norm_index import norm_index
+from app.services.rag_engine_async import generate_response_with_rag_async, stream_response_with_rag_async
+from app.services.search import search_evidence_async
+from app.services.warmup import run_warmup, is_ready, readiness
 
 app = FastAPI(title="Agente Fiscal Pro 2025")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+
+# Gauges de /metrics: se leen de los mismos stats() que /api/health
+register_stats("rag_pool", pool_stats, label="driver")
+register_stats("rag_admission", admission_stats, label="lane")
+register_stats("rag_answer_cache", answer_cache.stats)
+register_stats("rag_semantic_cache", semantic_cache.stats)
+register_stats("rag_embedding_cache", embedding_cache.stats)
+register_stats("rag_shared_cache", shared_backend.stats)
+register_stats("rag_sessions", session_store.stats)
+register_stats("rag_singleflight", answer_flights.stats)
+register_stats("rag_trace_store", trace_store.stats)
+register_stats("rag_openai_calls", deadline_stats)
+register_stats("rag_norm_index", norm_index.stats)
+
+_background_tasks = set()
+
+
+@app.on_event("startup")
+async def startup():
+    # Pre-warm: las primeras preguntas no pagan TLS + auth contra Supabase
+    await open_async_pool()
+    # Índice pgvector, clientes y módulos pesados: en segundo plano (ver /api/ready)
+    task = asyncio.create_task(run_warmup())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in list(_background_tasks):
+        task.cancel()
+    await close_async_pool()
+
+
 class QueryRequest(BaseModel):
     question: str
     regimen: Optional[str] = "General"
     ejercicio: Optional[int] = 2025
     trace: Optional[bool] = False # esta linea se coloco para el debug
+    # Conversación del lado del servidor: el cliente genera un id (8-64 de [A-Za-z0-9_-])
+    # y lo repite en cada turno; historial y evidencia previa se guardan aquí
+    session_id: Optional[str] = None
+
+
+def checked_session_id(request: QueryRequest) -> Optional[str]:
+    if request.session_id and not valid_session_id(request.session_id):
+        raise HTTPException(status_code=422, detail="session_id inválido (8-64 caracteres: letras, dígitos, '-' o '_').")
+    return request.session_id or None
+
+class SearchRequest(BaseModel):
+    question: Union[str, List[str]]
+    ejercicio: Optional[int] = 2025
+    top_k: Optional[int] = None
+    include_text: Optional[bool] = False
 
 @app.get("/")
 async def read_root():
@@ -22,37 +89,187 @@ async def read_root():
 
 @app.get("/api/health")
 def health_check():
-    return {"status": "Online", "mode": "Tier 2 RAG", "db": "Supabase"}
+    return {
+        "status": "Online",
+        "ready": is_ready(),
+        "mode": "Tier 2 RAG",
+        "db": "Supabase",
+        "pool": pool_stats(),
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "shared_cache": shared_backend.stats(),
+        "sessions": session_store.stats(),
+        "singleflight": answer_flights.stats(),
+        "admission": admission_stats(),
+        "openai_calls": deadline_stats(),
+        "norm_index": norm_index.stats(),
+        "trace_store": trace_store.stats(),
+    }
+
+
+@app.get("/api/ready")
+def ready_check():
+    """Readiness probe: 200 solo después del warm-up (pool, índice vectorial, clientes)."""
+    return JSONResponse(status_code=200 if is_ready() else 503, content=readiness())
+
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/trace/{trace_id}")
+def get_trace(trace_id: str):
+    """Trace estructurado de una petición reciente (ring buffer en memoria)."""
+    data = trace_store.get(trace_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Trace no encontrado (expiró o no existe).")
+    return JSONResponse(content=data, media_type="application/json; charset=utf-8")
+
+
+def rejected_response(e: Union[AdmissionRejected, DeadlineExceeded]) -> JSONResponse:
+    """Saturación de OpenAI (429/503) o deadline agotado (504): fallar rápido y decir cuándo reintentar."""
+    content = {"error": str(e), "reason": e.reason}
+    if isinstance(e, AdmissionRejected):
+        content["lane"] = e.lane
+    else:
+        content["stage"] = e.stage
+    return JSONResponse(
+        status_code=e.status_code,
+        content=content,
+        headers={"Retry-After": str(e.retry_after)},
+        media_type="application/json; charset=utf-8",
+    )
 
 @app.post("/chat")
-def chat_endpoint(request: QueryRequest):
+async def chat_endpoint(request: QueryRequest, http_request: Request):
+    session_id = checked_session_id(request)
     try:
-        response_text, debug = generate_response_with_rag(
-            question=request.question,
-            regimen=request.regimen or "General",
-            ejercicio=request.ejercicio or 2025,
-            trace=bool(getattr(request, "trace", False)),
-        )
+        # Perfil bajo demanda: header X-Profile con PROFILE_TOKEN o PROFILE_SAMPLE_RATE
+        with profiled("chat", should_profile(http_request.headers.get("x-profile"))) as prof:
+            response_text, debug = await generate_response_with_rag_async(
+                question=request.question,
+                regimen=request.regimen or "General",
+                ejercicio=request.ejercicio or 2025,
+                trace=bool(getattr(request, "trace", False)),
+                session_id=session_id,
+            )
 
+        # Compatibilidad: frontend usa answer; mantenemos response por si algo lo consume
         payload = {"answer": response_text, "response": response_text}
+        if session_id:
+            payload["session_id"] = session_id
         if getattr(request, "trace", False):
-            payload["debug"] = debug
+            # Solo el id: el detalle (etapas, SQL, fuentes) se pide a /trace/{id}
+            payload["trace_id"] = debug.get("trace_id")
 
         return JSONResponse(
             content=payload,
             media_type="application/json; charset=utf-8",
+            headers={"X-Profile-Id": prof.profile_id} if prof is not None else None,
         )
 
+    except (AdmissionRejected, DeadlineExceeded) as e:
+        return rejected_response(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Compatibilidad: frontend usa answer; mantenemos response por si algo lo consume
-        return JSONResponse(
-            content={"answer": response_text, "response": response_text},
-            media_type="application/json; charset=utf-8",
-        )
 
+def sse_format(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: QueryRequest, http_request: Request):
+    """
+    Server-Sent Events: primero `meta` (ruta + evidencia), luego `delta`
+    con cada fragmento del LLM y al final `done` ({"trace_id"}) o `error`.
+    """
+    session_id = checked_session_id(request)
+    events = stream_response_with_rag_async(
+        question=request.question,
+        regimen=request.regimen or "General",
+        ejercicio=request.ejercicio or 2025,
+        trace=bool(getattr(request, "trace", False)),
+        session_id=session_id,
+    )
+
+    # El perfil cubre desde el primer evento (ruta, admisión, retrieval) hasta el cierre del stream
+    profiling = ExitStack()
+    prof = profiling.enter_context(profiled("chat_stream", should_profile(http_request.headers.get("x-profile"))))
+
+    # Se espera el primer evento para poder responder 429/503/504 antes de abrir el stream
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except (AdmissionRejected, DeadlineExceeded) as e:
+        profiling.close()
+        return rejected_response(e)
+    except BaseException:
+        profiling.close()
+        raise
+
+    async def body():
+        with profiling:
+            if first is not None:
+                yield sse_format(*first)
+            try:
+                async for event, data in events:
+                    if event == "done":
+                        data = {"trace_id": data.get("trace_id"), "session_id": session_id}
+                    yield sse_format(event, data)
+            except (AdmissionRejected, DeadlineExceeded) as e:
+                # Ya se enviaron meta/evidencia: el rechazo del LLM viaja como evento
+                yield sse_format("error", {"error": str(e), "status": e.status_code, "retry_after": e.retry_after})
+
+    headers = {
+        "Cache-Control": "no-cache",
+        # Evita que proxies (Render/nginx) acumulen la respuesta
+        "X-Accel-Buffering": "no",
+    }
+    if prof is not None:
+        headers["X-Profile-Id"] = prof.profile_id
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream; charset=utf-8",
+        headers=headers,
+    )
+
+
+@app.post("/search")
+async def search_endpoint(request: SearchRequest):
+    """
+    Solo evidencia (sin LLM). `question` puede ser un string o una lista;
+    la respuesta siempre es {"results": [...]} en el mismo orden.
+    """
+    questions = [request.question] if isinstance(request.question, str) else list(request.question)
+    if not questions:
+        raise HTTPException(status_code=422, detail="Se requiere al menos una pregunta.")
+
+    try:
+        results = await search_evidence_async(
+            questions,
+            ejercicio=request.ejercicio or 2025,
+            top_k=request.top_k,
+            include_text=bool(request.include_text),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except (AdmissionRejected, DeadlineExceeded) as e:
+        return rejected_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    return JSONResponse(
+        content={"results": results},
+        media_type="application/json; charset=utf-8",
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,16 @@
+-- migrations/001_corpus_version.sql
+-- Sello de versión del corpus.
+--
+-- reingest.py lo actualiza al terminar una reingesta exitosa; el backend lo lee
+-- (cacheado unos segundos) y lo incluye en las llaves de sus caches, de modo que
+-- una reingesta invalida automáticamente respuestas y lookups cacheados.
+
+CREATE TABLE IF NOT EXISTS public.corpus_version (
+    id          INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version     TEXT NOT NULL,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO public.corpus_version (id, version)
+VALUES (1, 'inicial')
+ON CONFLICT (id) DO NOTHING;
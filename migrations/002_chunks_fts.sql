@@ -0,0 +1,39 @@
+-- migrations/002_chunks_fts.sql
+-- Búsqueda por keywords con full-text search en español.
+--
+-- Antes: c.text ILIKE '%kw%' OR ... (Seq Scan de todos los chunks, sin relevancia).
+-- Ahora: columna generada text_tsv (configuración es_unaccent = spanish + unaccent),
+-- índice GIN y ts_rank_cd (app/services/retrieval/keyword_search.py).
+--
+-- Backfill: al ser columna GENERATED ... STORED, el ALTER TABLE la calcula para
+-- todas las filas existentes (reescribe la tabla con lock exclusivo: correr fuera
+-- de horario). Las filas nuevas de reingest.py la calculan solas.
+-- Aplicar y verificar con: python scripts/fts_backfill.py
+
+-- En Supabase la extensión puede vivir en el schema "extensions"; el diccionario
+-- se resuelve por search_path al crear la configuración.
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- "artículo" y "articulo" -> mismo lexema; stemming en español
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_ts_config
+        WHERE cfgname = 'es_unaccent' AND cfgnamespace = 'public'::regnamespace
+    ) THEN
+        CREATE TEXT SEARCH CONFIGURATION public.es_unaccent (COPY = pg_catalog.spanish);
+        ALTER TEXT SEARCH CONFIGURATION public.es_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END
+$$;
+
+-- to_tsvector(regconfig, text) con la configuración explícita es IMMUTABLE:
+-- se puede usar en una columna generada
+ALTER TABLE public.chunks
+    ADD COLUMN IF NOT EXISTS text_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('public.es_unaccent'::regconfig, COALESCE(text, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS chunks_text_tsv_idx ON public.chunks USING gin (text_tsv);
+
+ANALYZE public.chunks;
@@ -351,6 +351,20 @@ def delete_chunks(supabase, document_id: str) -> int:
     return len(res.data) if getattr(res, "data", None) else 0
 
 
+def bump_corpus_version(supabase, note: str) -> str:
+    """Escribe un sello nuevo en public.corpus_version (invalida caches del backend).
+
+    Ver migrations/001_corpus_version.sql.
+    """
+    version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{note}"
+    supabase.table("corpus_version").upsert({
+        "id": 1,
+        "version": version,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }).execute()
+    return version
+
+
 def embed_batch(client: OpenAI, texts: List[str]) -> List[Optional[List[float]]]:
     try:
         resp = client.embeddings.create(model=MODEL_EMBED, input=[(t or "").replace("\n", " ") for t in texts])
@@ -377,7 +391,17 @@ def embed_batch(client: OpenAI, texts: List[str]) -> List[Optional[List[float]]]
 # -----------------------------
 
 
-def reingest_law(openai_client: OpenAI, supabase, spec: DocumentSpec, base_path: Path, *, dry_run: bool) -> bool:
+def reingest_law(
+    openai_client: OpenAI,
+    supabase,
+    spec: DocumentSpec,
+    base_path: Path,
+    *,
+    dry_run: bool,
+    changed: Optional[set] = None,
+) -> bool:
+    """True si se insertó algún chunk. `changed` recibe el document_id en cuanto se
+    toca la base (delete / upsert), aunque después fallen todos los inserts."""
     pdf_path = base_path / spec.filename
     if not pdf_path.exists():
         print(f"    ❌ No existe: {pdf_path}")
@@ -386,6 +410,8 @@ def reingest_law(openai_client: OpenAI, supabase, spec: DocumentSpec, base_path:
     print(f"    📄 PDF: {pdf_path}")
 
     if not dry_run:
+        if changed is not None:
+            changed.add(spec.document_id)
         deleted = delete_chunks(supabase, spec.document_id)
         print(f"    🗑️  Chunks previos eliminados: {deleted}")
         upsert_document(supabase, spec, source_path=str(pdf_path))
@@ -516,10 +542,12 @@ def main() -> None:
 
         ok = 0
         bad = 0
+        # Documentos cuyo corpus cambió (chunks borrados), con o sin inserts exitosos
+        changed: set = set()
         for i, spec in enumerate(specs, 1):
             print(f"\n[{i}/{len(specs)}] {spec.title} ({spec.document_id})")
             try:
-                if reingest_law(openai_client, supabase, spec, base_path, dry_run=bool(args.dry_run)):
+                if reingest_law(openai_client, supabase, spec, base_path, dry_run=bool(args.dry_run), changed=changed):
                     ok += 1
                 else:
                     bad += 1
@@ -527,6 +555,15 @@ def main() -> None:
                 bad += 1
                 print(f"    ❌ Error: {e}")
 
+        # Un delete sin inserts también cambia el corpus: las caches no deben
+        # seguir sirviendo chunks que ya no existen
+        if changed and not args.dry_run:
+            try:
+                version = bump_corpus_version(supabase, f"laws-{len(changed)}")
+                print(f"\n🔖 corpus_version = {version}")
+            except Exception as e:
+                print(f"\n⚠️ No se pudo actualizar corpus_version (caches del backend no se invalidan): {e}")
+
         print("\n" + "=" * 70)
         print(f"✅ Éxitos: {ok} | ❌ Fallos: {bad}")
         print("=" * 70)
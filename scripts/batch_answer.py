@@ -0,0 +1,251 @@
+# scripts/batch_answer.py
+# Respuestas por lotes (nocturno) sobre un JSONL de preguntas, sin pasar por HTTP.
+#
+# Entrada: una pregunta por línea, p. ej.
+#   {"id": "c-001", "question": "¿Qué dice el artículo 27 de la LISR?", "ejercicio": 2025}
+#
+# Salida (JSONL, una línea por pregunta, en orden de término):
+#   {"line": 1, "id": "c-001", "question": ..., "answer": ..., "trace": {...}}
+#
+# Reanudación: junto a la salida se guarda <salida>.ckpt con la última línea
+# contigua terminada ("watermark"). Al reiniciar se saltan las líneas <= watermark
+# y las que ya aparecen en la salida por encima de él. Una última línea a medio
+# escribir (crash) se recorta antes de reabrir la salida en modo append.
+# La memoria no depende del tamaño de la entrada: se lee en streaming y solo hay
+# ~2*workers preguntas en vuelo.
+#
+# Uso:
+#   python scripts/batch_answer.py preguntas.jsonl --output respuestas.jsonl --workers 8
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Optional, Set
+
+# Asegura que la raíz del repo esté en sys.path (para importar "app")
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.core.tracing import trace_store
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.rag_engine import generate_response_with_rag, embed_texts, install_embedding_batcher
+
+
+# -----------------------------
+# Checkpoint
+# -----------------------------
+
+def load_watermark(ckpt_path: str) -> int:
+    try:
+        with open(ckpt_path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("watermark", 0))
+    except FileNotFoundError:
+        return 0
+
+
+def save_watermark(ckpt_path: str, watermark: int) -> None:
+    tmp = ckpt_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"watermark": watermark, "updated_at": time.time()}, f)
+    os.replace(tmp, ckpt_path)
+
+
+def truncate_partial_line(output_path: str) -> int:
+    """
+    Recorta la salida hasta el último salto de línea. Si un crash dejó una línea a
+    medio escribir, el siguiente registro en modo append quedaría pegado a ella
+    (dos registros en una línea inválida). Devuelve los bytes recortados.
+    """
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            nl = block.rfind(b"\n")
+            if nl != -1:
+                pos = pos - step + nl + 1
+                break
+            pos -= step
+        if pos < size:
+            f.truncate(pos)
+        return size - pos
+
+
+def done_above_watermark(output_path: str, watermark: int) -> Set[int]:
+    """Líneas ya escritas por encima del watermark (acotadas por la ventana en vuelo)."""
+    done: Set[int] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for raw in f:
+            try:
+                line_no = int(json.loads(raw).get("line", 0))
+            except (ValueError, AttributeError):
+                continue  # línea truncada por un crash a media escritura
+            if line_no > watermark:
+                done.add(line_no)
+    return done
+
+
+class Watermark:
+    """Avanza la última línea contigua terminada; guarda solo los huecos pendientes."""
+
+    def __init__(self, start: int):
+        self.value = start
+        self._ahead: Set[int] = set()
+
+    def complete(self, line_no: int) -> None:
+        self._ahead.add(line_no)
+        while self.value + 1 in self._ahead:
+            self.value += 1
+            self._ahead.discard(self.value)
+
+
+# -----------------------------
+# Worker
+# -----------------------------
+
+def answer_one(line_no: int, record: Dict[str, Any], args) -> Dict[str, Any]:
+    question = (record.get(args.question_field) or "").strip()
+    out: Dict[str, Any] = {"line": line_no, "id": record.get(args.id_field, line_no), "question": question}
+    if not question:
+        out["error"] = f"Campo '{args.question_field}' vacío o ausente"
+        return out
+
+    t0 = time.perf_counter()
+    try:
+        answer, debug = generate_response_with_rag(
+            question,
+            regimen=record.get("regimen") or args.regimen,
+            ejercicio=int(record.get("ejercicio") or args.ejercicio),
+            trace=not args.no_trace,
+        )
+    except Exception as e:
+        answer, debug = "", {"error": str(e)}
+    out["elapsed_s"] = round(time.perf_counter() - t0, 3)
+
+    if isinstance(debug, dict) and debug.get("error"):
+        out["error"] = debug["error"]
+    else:
+        out["answer"] = answer
+    if not args.no_trace:
+        # Trace estructurado (etapas, SQL, años, caches) si sigue en el ring buffer
+        stored = trace_store.get(debug.get("trace_id")) if isinstance(debug, dict) and debug.get("trace_id") else None
+        out["trace"] = stored or debug
+    return out
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Respuestas RAG por lotes sobre un JSONL de preguntas")
+    p.add_argument("input", help="JSONL de entrada (una pregunta por línea)")
+    p.add_argument("--output", required=True, help="JSONL de salida (se agrega; se reanuda si existe)")
+    p.add_argument("--workers", type=int, default=4, help="Preguntas en paralelo (no exceder DB_POOL_MAX)")
+    p.add_argument("--question-field", default="question")
+    p.add_argument("--id-field", default="id")
+    p.add_argument("--ejercicio", type=int, default=2025)
+    p.add_argument("--regimen", default="General")
+    p.add_argument("--no-trace", action="store_true", help="No guarda el trace por respuesta")
+    p.add_argument("--embed-batch", type=int, default=64, help="Máximo de textos por llamada de embeddings")
+    p.add_argument("--embed-wait-ms", type=int, default=25, help="Ventana para juntar embeddings")
+    return p
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+
+    ckpt_path = args.output + ".ckpt"
+    start = load_watermark(ckpt_path)
+    cut = truncate_partial_line(args.output)
+    if cut:
+        print(f"✂️ Salida: se recortó una línea incompleta ({cut} bytes); esa pregunta se vuelve a responder")
+    already: Set[int] = done_above_watermark(args.output, start)
+    mark = Watermark(start)
+    for n in sorted(already):
+        mark.complete(n)
+
+    if start or already:
+        print(f"↻ Reanudando: watermark={start}, ya hechas por encima={len(already)}")
+
+    batcher = EmbeddingBatcher(embed_texts, max_batch=args.embed_batch, max_wait_ms=args.embed_wait_ms)
+    install_embedding_batcher(batcher)
+
+    max_in_flight = max(1, args.workers) * 2
+    ok = bad = 0
+    t_start = time.perf_counter()
+
+    with open(args.input, "r", encoding="utf-8") as fin, \
+         open(args.output, "a", encoding="utf-8") as fout, \
+         ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+
+        pending = set()
+
+        def drain(block: bool) -> None:
+            nonlocal pending, ok, bad
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+            for fut in done:
+                rec = fut.result()
+                fout.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                fout.flush()
+                if rec.get("error"):
+                    bad += 1
+                else:
+                    ok += 1
+                mark.complete(rec["line"])
+            if done:
+                save_watermark(ckpt_path, mark.value)
+
+        for line_no, raw in enumerate(fin, 1):
+            if line_no <= start:
+                continue
+            if line_no in already:
+                already.discard(line_no)
+                continue
+
+            raw = raw.strip()
+            record: Optional[Dict[str, Any]] = None
+            if raw:
+                try:
+                    record = json.loads(raw)
+                except json.JSONDecodeError:
+                    record = None
+            if not isinstance(record, dict):
+                # Línea vacía o inválida: se registra para que el watermark avance
+                rec = {"line": line_no, "id": line_no, "error": "JSON inválido o línea vacía"}
+                fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                fout.flush()
+                bad += 1
+                mark.complete(line_no)
+                continue
+
+            while len(pending) >= max_in_flight:
+                drain(block=True)
+            pending.add(pool.submit(answer_one, line_no, record, args))
+            drain(block=False)
+
+        while pending:
+            drain(block=True)
+
+        save_watermark(ckpt_path, mark.value)
+
+    install_embedding_batcher(None)
+    batcher.close()
+
+    elapsed = time.perf_counter() - t_start
+    print(f"✅ Respondidas: {ok} | ❌ Con error: {bad} | ⏱ {elapsed:.1f}s")
+    print(f"   Embeddings: {batcher.texts} textos en {batcher.calls} llamadas")
+
+
+if __name__ == "__main__":
+    main()
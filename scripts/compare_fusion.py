@@ -0,0 +1,153 @@
+# scripts/compare_fusion.py
+# Compara modos de fusión híbrida (append / rrf / weighted) sobre las mismas preguntas.
+#
+# Por pregunta se hace UNA recuperación (embedding + retrieve_across_years) y se
+# fusiona con cada modo; así las diferencias son solo de la fusión. Se reporta:
+#   - evidence:   chunks que llegan al prompt (tras _robust_selection)
+#   - kw_only:    chunks que solo trajo la búsqueda por keywords
+#   - ctx_chars / prompt_tokens: tamaño del mensaje de sistema con la evidencia
+#   - overlap:    fracción de chunk_ids compartidos con el modo base (append)
+#
+# Entrada: JSONL como el de batch_answer.py ({"question": ..., "ejercicio": ...})
+# o --question repetible.
+#
+# Uso:
+#   python scripts/compare_fusion.py preguntas.jsonl --output fusion.jsonl
+#   python scripts/compare_fusion.py --question "¿Qué gastos son deducibles?" --weight-keyword 1.5
+import os
+import sys
+import json
+import argparse
+from typing import Any, Dict, Iterator, List
+
+# Asegura que la raíz del repo esté en sys.path (para importar "app")
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+from app.core.db import db_connection
+from app.core.tokens import count_tokens
+from app.services.rag_engine import build_system_message, embed_text
+from app.services.retrieval.fallback import (
+    _robust_selection,
+    _vector_preferences,
+    retrieve_across_years,
+    years_to_check,
+)
+from app.services.retrieval.fusion import FUSION_MODES, FUSION_WEIGHTS, fuse_results
+from app.services.retrieval.query_expansion import expand_query
+
+BASE_MODE = "append"
+
+
+def read_questions(args) -> Iterator[Dict[str, Any]]:
+    for q in args.question or []:
+        yield {"question": q, "ejercicio": args.ejercicio}
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            for raw in f:
+                raw = raw.strip()
+                if raw:
+                    item = json.loads(raw)
+                    item.setdefault("ejercicio", args.ejercicio)
+                    yield item
+
+
+def measure(ev: List[Dict[str, Any]], base_ids: set) -> Dict[str, Any]:
+    ctx = build_system_message(ev)
+    ids = {e.get("chunk_id") for e in ev if e.get("chunk_id") is not None}
+    return {
+        "evidence": len(ev),
+        "kw_only": sum(1 for e in ev if (e.get("matched_by") or [e.get("source")]) == ["keyword"]),
+        "ctx_chars": len(ctx),
+        "prompt_tokens": count_tokens(ctx),
+        "overlap": round(len(ids & base_ids) / len(ids | base_ids), 3) if (ids or base_ids) else 1.0,
+        "chunk_ids": sorted(ids),
+    }
+
+
+def compare_one(conn, item: Dict[str, Any], modes: List[str], top_k: int, weights: Dict[str, float]) -> Dict[str, Any]:
+    question = item["question"]
+    ejercicio = int(item["ejercicio"])
+    expanded, keywords = expand_query(question)
+    query_vec = embed_text(expanded)
+
+    ev_vector, ev_keywords, used_year = retrieve_across_years(
+        conn, query_vec, years_to_check(ejercicio), top_k, keywords, **_vector_preferences(question)
+    )
+
+    results: Dict[str, Any] = {}
+    base_ids: set = set()
+    for mode in [BASE_MODE] + [m for m in modes if m != BASE_MODE]:
+        # Copias: append_results marca "source" sobre los dicts originales
+        fused = fuse_results([dict(e) for e in ev_vector], [dict(e) for e in ev_keywords], top_k, mode=mode, weights=weights)
+        ev = _robust_selection(fused, top_k)
+        results[mode] = measure(ev, base_ids)
+        if mode == BASE_MODE:
+            base_ids = set(results[mode]["chunk_ids"])
+            results[mode]["overlap"] = 1.0
+
+    return {
+        "id": item.get("id"),
+        "question": question,
+        "used_year": used_year,
+        "vector_rows": len(ev_vector),
+        "keyword_rows": len(ev_keywords),
+        "modes": results,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compara modos de fusión vector + keywords")
+    ap.add_argument("input", nargs="?", default=None, help="JSONL de preguntas")
+    ap.add_argument("--question", action="append", default=None)
+    ap.add_argument("--ejercicio", type=int, default=2025)
+    ap.add_argument("--top-k", type=int, default=12)
+    ap.add_argument("--modes", default=",".join(FUSION_MODES), help="p. ej. append,rrf,weighted")
+    ap.add_argument("--weight-vector", type=float, default=FUSION_WEIGHTS["vector"])
+    ap.add_argument("--weight-keyword", type=float, default=FUSION_WEIGHTS["keyword"])
+    ap.add_argument("--output", default=None, help="JSONL con el detalle por pregunta")
+    args = ap.parse_args()
+
+    if not args.input and not args.question:
+        ap.error("indica un JSONL de preguntas o --question")
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip() in FUSION_MODES]
+    weights = {"vector": args.weight_vector, "keyword": args.weight_keyword}
+    totals: Dict[str, Dict[str, float]] = {m: {} for m in [BASE_MODE] + modes}
+    n = 0
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        with db_connection() as conn:
+            for item in read_questions(args):
+                row = compare_one(conn, item, modes, args.top_k, weights)
+                n += 1
+                if out:
+                    out.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                parts = []
+                for mode, r in row["modes"].items():
+                    for k in ("evidence", "kw_only", "ctx_chars", "prompt_tokens", "overlap"):
+                        totals[mode][k] = totals[mode].get(k, 0) + r[k]
+                    parts.append(f"{mode}: ev={r['evidence']} kw={r['kw_only']} tok={r['prompt_tokens']} ov={r['overlap']}")
+                print(f"[{n}] {row['question'][:60]!r} -> " + " | ".join(parts))
+    finally:
+        if out:
+            out.close()
+
+    if not n:
+        return 1
+
+    print("\nPromedios por pregunta:")
+    print(f"{'modo':<10}{'evidence':>10}{'kw_only':>10}{'ctx_chars':>12}{'tokens':>10}{'overlap':>10}")
+    for mode, t in totals.items():
+        if not t:
+            continue
+        print(
+            f"{mode:<10}{t['evidence'] / n:>10.2f}{t['kw_only'] / n:>10.2f}"
+            f"{t['ctx_chars'] / n:>12.0f}{t['prompt_tokens'] / n:>10.0f}{t['overlap'] / n:>10.3f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
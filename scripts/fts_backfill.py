@@ -0,0 +1,127 @@
+# scripts/fts_backfill.py
+# Aplica migrations/002_chunks_fts.sql (columna text_tsv + GIN) y verifica el backfill.
+#
+# La columna es GENERATED ... STORED: el ALTER TABLE calcula text_tsv para todas
+# las filas existentes. Después se comprueba:
+#   - que no queden chunks con texto y tsvector vacío
+#   - que el índice GIN exista y sea válido
+#   - que una búsqueda de ejemplo use el índice (EXPLAIN) y cuántas filas devuelve
+#
+# Uso:
+#   python scripts/fts_backfill.py                     # aplica (idempotente) y verifica
+#   python scripts/fts_backfill.py --check-only        # solo verifica
+#   python scripts/fts_backfill.py --sample "deducciones autorizadas" --sample "persona moral"
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Dict, List
+
+# Asegura que la raíz del repo esté en sys.path (para importar "app")
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+import psycopg2
+
+from app.core.db import get_conn_str
+from app.services.retrieval.keyword_search import keyword_tsquery
+
+MIGRATION = os.path.join(ROOT, "migrations", "002_chunks_fts.sql")
+
+COVERAGE_SQL = """
+    SELECT
+      count(*)                                                       AS total,
+      count(*) FILTER (WHERE COALESCE(text, '') <> '' AND text_tsv = ''::tsvector) AS empty_tsv
+    FROM public.chunks
+    """
+
+INDEX_SQL = """
+    SELECT ix.indisvalid
+    FROM pg_index ix
+    JOIN pg_class i ON i.oid = ix.indexrelid
+    WHERE i.relname = 'chunks_text_tsv_idx'
+    """
+
+
+def connect():
+    """Conexión propia (no del pool): la reescritura de la tabla puede tardar minutos."""
+    conn = psycopg2.connect(get_conn_str())
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT set_config('statement_timeout', '0', false)")
+    return conn
+
+
+def apply_migration(conn) -> None:
+    with open(MIGRATION, "r", encoding="utf-8") as f:
+        sql = f.read()
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(sql)
+    print(f"✅ {os.path.basename(MIGRATION)} aplicada en {time.perf_counter() - t0:.1f}s")
+
+
+def _index_nodes(plan: Dict[str, Any], found: List[str]) -> List[str]:
+    if plan.get("Index Name"):
+        found.append(f"{plan['Node Type']} using {plan['Index Name']}")
+    for child in plan.get("Plans") or []:
+        _index_nodes(child, found)
+    return found
+
+
+def check(conn, samples: List[str]) -> int:
+    failures = 0
+    with conn.cursor() as cur:
+        cur.execute(COVERAGE_SQL)
+        total, empty_tsv = cur.fetchone()
+        print(f"chunks: {total} | con texto y text_tsv vacío: {empty_tsv}")
+        if empty_tsv:
+            failures += 1
+            print("⚠️ Hay chunks sin tsvector (¿solo números/stopwords?); revisa una muestra")
+
+        cur.execute(INDEX_SQL)
+        row = cur.fetchone()
+        if not row or not row[0]:
+            failures += 1
+            print("⚠️ chunks_text_tsv_idx no existe o es INVALID")
+        else:
+            print("✅ chunks_text_tsv_idx válido")
+
+        tsq, params = keyword_tsquery(samples)
+        query = f"SELECT chunk_id FROM public.chunks c WHERE c.text_tsv @@ {tsq} LIMIT 50"
+        cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        used = _index_nodes(plan[0]["Plan"], [])
+
+        cur.execute(f"SELECT count(*) FROM public.chunks c WHERE c.text_tsv @@ {tsq}", params)
+        hits = cur.fetchone()[0]
+
+    print(f"muestra {samples!r}: {hits} chunks")
+    if used:
+        print("✅ " + "; ".join(used))
+    else:
+        # Con pocas filas el planner puede preferir Seq Scan aunque el índice exista
+        print("⚠️ La búsqueda de ejemplo no usa el índice GIN (¿tabla chica o sin ANALYZE?)")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Aplica la migración FTS de chunks y verifica el backfill")
+    ap.add_argument("--check-only", action="store_true", help="No aplica la migración, solo verifica")
+    ap.add_argument("--sample", action="append", default=None, help="Keyword de prueba (repetible)")
+    args = ap.parse_args()
+
+    conn = connect()
+    try:
+        if not args.check_only:
+            apply_migration(conn)
+        return check(conn, args.sample or ["deducciones autorizadas", "persona moral"])
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+# scripts/pgvector_index.py
+# Administración del índice vectorial de public.chunks.embedding.
+#
+# vector_retrieval.py ordena por `embedding <=> q` (distancia coseno). Un índice
+# creado con vector_l2_ops (como el del esquema original) NO sirve para <=>: el
+# planner hace Seq Scan sobre todos los chunks en cada pregunta. Este script:
+#
+#   inspect  -> índices sobre embedding (método, opclass, parámetros, tamaño) y si
+#               son compatibles con <=>
+#   rebuild  -> crea el índice correcto (CONCURRENTLY, sin bloquear lecturas) y
+#               después borra los que no coinciden
+#   explain  -> EXPLAIN de la consulta que ejecuta el serving path (el CTE de años de
+#               fallback.py, mismas preferencias y keywords que retrieve_evidence)
+#               con su tuning; sale con código 1 si no se usa el índice
+#
+# Uso:
+#   python scripts/pgvector_index.py inspect
+#   python scripts/pgvector_index.py rebuild --method hnsw --m 16 --ef-construction 64
+#   python scripts/pgvector_index.py rebuild --method ivfflat            # lists según filas
+#   python scripts/pgvector_index.py explain --ejercicio 2025 --question "¿Qué dice la regla 2.7.1.1?"
+import os
+import re
+import sys
+import json
+import math
+import random
+import argparse
+from typing import Any, Dict, List
+
+# Asegura que la raíz del repo esté en sys.path (para importar "app")
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+import psycopg2
+
+from app.core.config import VECTOR_IVFFLAT_PROBES, VECTOR_HNSW_EF_SEARCH
+from app.core.db import get_conn_str
+from app.services.retrieval.fallback import _build_fallback_query, _vector_preferences, years_to_check
+from app.services.retrieval.query_expansion import expand_query
+
+# Opclass que corresponde al operador <=> usado en vector_retrieval.py
+EXPECTED_OPCLASS = "vector_cosine_ops"
+EMBED_DIM = 1536
+# Mismo default que rag_engine.TOP_K
+TOP_K_DEFAULT = int(os.getenv("TOP_K_DEFAULT", 12))
+MEM_RE = re.compile(r"^\d+\s*(kB|MB|GB)$")
+
+INDEXES_SQL = """
+    SELECT
+      i.relname                                  AS index_name,
+      am.amname                                  AS method,
+      opc.opcname                                AS opclass,
+      COALESCE(array_to_string(i.reloptions, ','), '') AS options,
+      pg_relation_size(i.oid)                    AS size_bytes,
+      ix.indisvalid                              AS valid
+    FROM pg_index ix
+    JOIN pg_class i   ON i.oid = ix.indexrelid
+    JOIN pg_class t   ON t.oid = ix.indrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    JOIN pg_am am     ON am.oid = i.relam
+    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ix.indkey[0]
+    JOIN pg_opclass opc ON opc.oid = ix.indclass[0]
+    WHERE n.nspname = 'public' AND t.relname = 'chunks' AND a.attname = 'embedding'
+    ORDER BY i.relname
+    """
+
+ROWS_SQL = "SELECT count(*) FROM public.chunks WHERE embedding IS NOT NULL"
+PGVECTOR_SQL = "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+
+
+def connect():
+    """Conexión propia (no del pool): los CREATE/DROP INDEX pueden tardar minutos."""
+    conn = psycopg2.connect(get_conn_str())
+    # CONCURRENTLY no puede ir dentro de una transacción
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT set_config('statement_timeout', '0', false)")
+    return conn
+
+
+def fetch_indexes(conn) -> List[Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(INDEXES_SQL)
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+
+def count_rows(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute(ROWS_SQL)
+        return int(cur.fetchone()[0])
+
+
+def matches(ix: Dict[str, Any]) -> bool:
+    return ix["method"] in ("hnsw", "ivfflat") and ix["opclass"] == EXPECTED_OPCLASS and ix["valid"]
+
+
+def ivfflat_lists(rows: int) -> int:
+    """Recomendación de pgvector: filas/1000 hasta 1M filas, sqrt(filas) por encima."""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+# =========================
+# inspect
+# =========================
+
+def cmd_inspect(args) -> int:
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(PGVECTOR_SQL)
+            row = cur.fetchone()
+        indexes = fetch_indexes(conn)
+        rows = count_rows(conn)
+    finally:
+        conn.close()
+
+    print(f"pgvector: {row[0] if row else 'NO INSTALADO'}")
+    print(f"chunks con embedding: {rows}")
+    print(f"operador de consulta: <=> (requiere {EXPECTED_OPCLASS})")
+    print(f"tuning serving path: ivfflat.probes={VECTOR_IVFFLAT_PROBES} hnsw.ef_search={VECTOR_HNSW_EF_SEARCH}")
+
+    if not indexes:
+        print("⚠️ No hay índice sobre chunks.embedding: cada consulta hace Seq Scan")
+        return 1
+
+    ok = False
+    for ix in indexes:
+        good = matches(ix)
+        ok = ok or good
+        mark = "✅" if good else "⚠️"
+        print(
+            f"{mark} {ix['index_name']}: {ix['method']} ({ix['opclass']}) "
+            f"[{ix['options'] or 'defaults'}] {ix['size_bytes'] / 1e6:.1f} MB"
+            + ("" if ix["valid"] else " INVALID")
+        )
+
+    if not ok:
+        print("⚠️ Ningún índice coincide con <=>; ejecuta: python scripts/pgvector_index.py rebuild")
+        return 1
+    return 0
+
+
+# =========================
+# rebuild
+# =========================
+
+def index_name(args) -> str:
+    name = args.name or f"chunks_embedding_{args.method}_cos_idx"
+    if not re.match(r"^[a-z_][a-z0-9_]{0,62}$", name):
+        raise SystemExit(f"Nombre de índice inválido: {name!r}")
+    return name
+
+
+def rebuild_sql(args, rows: int) -> str:
+    name = index_name(args)
+    if args.method == "hnsw":
+        opts = f"m = {args.m}, ef_construction = {args.ef_construction}"
+    else:
+        opts = f"lists = {args.lists or ivfflat_lists(rows)}"
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+        f"ON public.chunks USING {args.method} (embedding {EXPECTED_OPCLASS}) WITH ({opts})"
+    )
+
+
+def cmd_rebuild(args) -> int:
+    conn = connect()
+    try:
+        rows = count_rows(conn)
+        create_sql = rebuild_sql(args, rows)
+        new_name = index_name(args)
+        # Solo se borran los que no sirven para <=>; otro índice coseno válido se conserva
+        old = [ix for ix in fetch_indexes(conn) if ix["index_name"] != new_name and not matches(ix)]
+
+        if args.method == "ivfflat" and rows < 1000:
+            # IVFFlat calcula los centroides con los datos presentes al crear el índice
+            print(f"⚠️ Solo {rows} filas: los centroides de IVFFlat serán pobres; considera --method hnsw")
+
+        build = []
+        if args.maintenance_work_mem:
+            build.append(("SELECT set_config('maintenance_work_mem', %s, false)", (args.maintenance_work_mem,)))
+        build.append((create_sql, None))
+        cleanup = [] if args.keep_old else [f'DROP INDEX CONCURRENTLY IF EXISTS public."{ix["index_name"]}"' for ix in old]
+        cleanup.append("ANALYZE public.chunks")
+
+        if args.dry_run:
+            for sql, params in build:
+                print("[dry-run] " + sql + (f" {params}" if params else ""))
+            for sql in cleanup:
+                print("[dry-run] " + sql)
+            return 0
+
+        for sql, params in build:
+            print(sql + (f" {params}" if params else ""))
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+
+        # Los anteriores solo se borran si el nuevo quedó válido (un CREATE
+        # CONCURRENTLY interrumpido deja el índice INVALID y IF NOT EXISTS no lo repara)
+        created = [ix for ix in fetch_indexes(conn) if ix["index_name"] == new_name]
+        if not created or not matches(created[0]):
+            print(f"🔥 {new_name} no quedó válido: bórralo (DROP INDEX CONCURRENTLY) y vuelve a ejecutar")
+            return 1
+
+        for sql in cleanup:
+            print(sql)
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        print(f"✅ {new_name} listo")
+    finally:
+        conn.close()
+
+    if args.method == "ivfflat":
+        lists = args.lists or ivfflat_lists(rows)
+        print(f"Sugerencia: VECTOR_IVFFLAT_PROBES={max(1, int(math.sqrt(lists)))} (≈ sqrt(lists={lists}))")
+    return 0
+
+
+# =========================
+# explain
+# =========================
+
+def _index_nodes(plan: Dict[str, Any], found: List[str]) -> List[str]:
+    if plan.get("Index Name"):
+        found.append(f"{plan['Node Type']} using {plan['Index Name']}")
+    for child in plan.get("Plans") or []:
+        _index_nodes(child, found)
+    return found
+
+
+def cmd_explain(args) -> int:
+    rnd = random.Random(args.seed)
+    vec = [rnd.gauss(0.0, 1.0) for _ in range(EMBED_DIM)]
+    norm = math.sqrt(sum(x * x for x in vec))
+    vec = [x / norm for x in vec]
+
+    # Misma consulta que retrieve_context_with_fallback: preferencias y keywords de
+    # la pregunta, todos los años de years_to_check en un solo CTE
+    _, keywords = expand_query(args.question)
+    sql, params = _build_fallback_query(
+        vec, years_to_check(args.ejercicio), args.top_k,
+        keywords=None if args.no_keywords else keywords,
+        **_vector_preferences(args.question),
+    )
+
+    conn = connect()
+    try:
+        index_names = {ix["index_name"] for ix in fetch_indexes(conn) if matches(ix)}
+        with conn.cursor() as cur:
+            # Mismo tuning que fija app/core/db.py en cada checkout
+            cur.execute(
+                "SELECT set_config('ivfflat.probes', %s, false), set_config('hnsw.ef_search', %s, false)",
+                (str(VECTOR_IVFFLAT_PROBES), str(max(VECTOR_HNSW_EF_SEARCH, args.top_k))),
+            )
+            analyze = "ANALYZE, BUFFERS, " if args.analyze else ""
+            cur.execute(f"EXPLAIN ({analyze}FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+    finally:
+        conn.close()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]
+    if args.verbose:
+        print(json.dumps(root, indent=2, ensure_ascii=False))
+
+    used = [n for n in _index_nodes(root["Plan"], []) if n.split(" using ")[-1] in index_names]
+    if args.analyze:
+        print(f"tiempo de ejecución: {root.get('Execution Time', 0):.1f} ms")
+    if used:
+        print("✅ " + "; ".join(used))
+        return 0
+    print("⚠️ La consulta NO usa el índice vectorial (Seq Scan). Revisa `inspect` o usa --verbose")
+    return 1
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Inspecciona / reconstruye / verifica el índice de chunks.embedding")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("inspect", help="Índices actuales y compatibilidad con <=>")
+
+    rb = sub.add_parser("rebuild", help="Crea el índice con vector_cosine_ops y borra los que no coinciden")
+    rb.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    rb.add_argument("--m", type=int, default=16, help="HNSW: conexiones por nodo")
+    rb.add_argument("--ef-construction", type=int, default=64, help="HNSW: tamaño de la lista al construir")
+    rb.add_argument("--lists", type=int, default=None, help="IVFFlat: listas (default: según número de filas)")
+    rb.add_argument("--name", default=None, help="Nombre del índice nuevo")
+    rb.add_argument("--maintenance-work-mem", default=None, help="p. ej. 1GB (acelera la construcción)")
+    rb.add_argument("--keep-old", action="store_true", help="No borrar los índices anteriores")
+    rb.add_argument("--dry-run", action="store_true", help="Solo imprime el SQL")
+
+    ex = sub.add_parser("explain", help="EXPLAIN de la consulta de retrieval real (fallback de años)")
+    ex.add_argument("--ejercicio", type=int, default=2025)
+    ex.add_argument("--top-k", type=int, default=TOP_K_DEFAULT)
+    ex.add_argument("--question", default="¿Qué gastos son deducibles para una persona moral?",
+                    help="Define preferencias de doc_type y keywords, como en producción")
+    ex.add_argument("--no-keywords", action="store_true", help="Como con presupuesto bajo (sin keywords)")
+    ex.add_argument("--seed", type=int, default=0)
+    ex.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (ejecuta la consulta)")
+    ex.add_argument("--verbose", action="store_true", help="Imprime el plan completo")
+
+    args = ap.parse_args()
+    if args.cmd == "rebuild" and args.maintenance_work_mem and not MEM_RE.match(args.maintenance_work_mem):
+        ap.error("--maintenance-work-mem debe ser como 512MB o 1GB")
+    if args.cmd == "inspect":
+        return cmd_inspect(args)
+    if args.cmd == "rebuild":
+        return cmd_rebuild(args)
+    return cmd_explain(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
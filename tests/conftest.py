@@ -0,0 +1,11 @@
+# tests/conftest.py
+# Asegura que la raíz del repo esté en sys.path (para importar "app"), como en scripts/.
+import os
+import sys
+
+# Sin backend compartido: los tests no escriben .cache/shared.sqlite3
+os.environ.setdefault("SHARED_CACHE_URL", "")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
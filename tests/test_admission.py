@@ -0,0 +1,98 @@
+# tests/test_admission.py
+# Control de admisión por carril (app/services/admission.py).
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app.services.admission import AdmissionLane, AdmissionRejected
+
+
+def test_full_queue_is_rejected_with_429():
+    lane = AdmissionLane("embed", limit=1, max_queue=0, max_wait_s=1.0)
+
+    with lane.slot():
+        with pytest.raises(AdmissionRejected) as exc:
+            with lane.slot():
+                pass
+
+    assert exc.value.reason == "queue_full"
+    assert exc.value.status_code == 429
+    assert exc.value.retry_after >= 1
+    assert lane.stats()["rejected_queue_full"] == 1
+    assert lane.stats()["in_use"] == 0
+
+
+def test_wait_timeout_is_rejected_with_503():
+    lane = AdmissionLane("chat", limit=1, max_queue=4, max_wait_s=0.05)
+
+    with lane.slot():
+        with pytest.raises(AdmissionRejected) as exc:
+            with lane.slot():
+                pass
+
+    assert exc.value.reason == "wait_timeout"
+    assert exc.value.status_code == 503
+    stats = lane.stats()
+    assert stats["rejected_wait_timeout"] == 1
+    assert stats["queue_depth"] == 0 and stats["in_use"] == 0
+
+
+def test_released_slot_goes_to_the_waiter():
+    lane = AdmissionLane("embed", limit=1, max_queue=4, max_wait_s=5.0)
+    entered = threading.Event()
+    order = []
+
+    def waiter():
+        with lane.slot():
+            order.append("waiter")
+        entered.set()
+
+    with lane.slot():
+        t = threading.Thread(target=waiter)
+        t.start()
+        while lane.stats()["queue_depth"] == 0:
+            time.sleep(0.001)
+        order.append("holder")
+
+    assert entered.wait(5)
+    t.join(5)
+    assert order == ["holder", "waiter"]
+    assert lane.stats()["admitted"] == 2 and lane.stats()["in_use"] == 0
+
+
+def test_async_lane_queue_full_and_timeout():
+    async def main():
+        lane = AdmissionLane("chat", limit=1, max_queue=1, max_wait_s=0.05)
+        async with lane.aslot():
+            # El primero espera en la fila y se agota su presupuesto; el segundo no cabe
+            waiting = asyncio.create_task(lane.aslot().__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as full:
+                async with lane.aslot():
+                    pass
+            with pytest.raises(AdmissionRejected) as timeout:
+                await waiting
+        return full.value.reason, timeout.value.reason, lane.stats()
+
+    full, timeout, stats = asyncio.run(main())
+    assert (full, timeout) == ("queue_full", "wait_timeout")
+    assert stats["in_use"] == 0 and stats["queue_depth"] == 0
+
+
+def test_async_cancel_while_queued_frees_the_queue():
+    async def main():
+        lane = AdmissionLane("embed", limit=1, max_queue=1, max_wait_s=5.0)
+        async with lane.aslot():
+            waiting = asyncio.create_task(lane.aslot().__aenter__())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            depth = lane.stats()["queue_depth"]
+        return depth, lane.stats()
+
+    depth, stats = asyncio.run(main())
+    assert depth == 0
+    assert stats["in_use"] == 0
@@ -0,0 +1,43 @@
+# tests/test_answer_cache.py
+# Cache exacta de respuestas (app/services/cache/answer_cache.py).
+from app.services.cache.answer_cache import AnswerCache, answer_cache_key, normalize_question
+from app.services.cache.shared_backend import CacheBackend
+
+
+def test_normalize_question():
+    assert normalize_question("¿Qué dice el Artículo 27 de la LISR?") == "que dice el articulo 27 de la lisr"
+    assert normalize_question("  qué   DICE  ") == "que dice"
+
+
+def test_key_ignores_accents_case_and_punctuation():
+    a = answer_cache_key("¿Qué dice el Artículo 27 de la LISR?", 2025, "General")
+    b = answer_cache_key("que dice el articulo 27 de la lisr", 2025, "general")
+    assert a == b
+
+
+def test_key_depends_on_ejercicio_and_regimen():
+    q = "¿Qué dice el artículo 27?"
+    assert answer_cache_key(q, 2025, "General") != answer_cache_key(q, 2024, "General")
+    assert answer_cache_key(q, 2025, "General") != answer_cache_key(q, 2025, "RESICO")
+    assert answer_cache_key(q, 2025, "") == answer_cache_key(q, 2025, "General")
+
+
+def test_new_corpus_version_invalidates():
+    cache = AnswerCache(max_entries=10, ttl_s=60, backend=CacheBackend())
+    cache.put("k", "v1", {"answer": "a"})
+
+    assert cache.get("k", "v1") == {"answer": "a"}
+    assert cache.get("k", "v2") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_lru_and_ttl():
+    cache = AnswerCache(max_entries=2, ttl_s=60, backend=CacheBackend())
+    for k in ("a", "b", "c"):
+        cache.put(k, "v1", {"answer": k})
+    assert cache.get("a", "v1") is None
+    assert cache.get("c", "v1") == {"answer": "c"}
+
+    expired = AnswerCache(ttl_s=-1, backend=CacheBackend())
+    expired.put("k", "v1", {"answer": "a"})
+    assert expired.get("k", "v1") is None
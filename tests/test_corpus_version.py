@@ -0,0 +1,80 @@
+# tests/test_corpus_version.py
+# Lectura de la versión del corpus (app/services/corpus_version.py).
+from contextlib import contextmanager
+
+import pytest
+
+from app.services import corpus_version as cv
+
+
+class FakeConn:
+    def __init__(self, version=None, error=None):
+        self.version = version
+        self.error = error
+        self.queries = 0
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql, params=None):
+        self.queries += 1
+        if self.error is not None:
+            raise self.error
+
+    def fetchone(self):
+        return (self.version,)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(cv, "_state", {"version": None, "checked_at": None, "warned": False})
+
+
+def use_pool(monkeypatch, conn):
+    checkouts = []
+
+    @contextmanager
+    def db_connection():
+        checkouts.append(1)
+        yield conn
+
+    monkeypatch.setattr(cv, "db_connection", db_connection)
+    return checkouts
+
+
+def test_version_is_cached(monkeypatch):
+    conn = FakeConn("20260101T000000-laws-3")
+    checkouts = use_pool(monkeypatch, conn)
+
+    assert cv.get_corpus_version() == "20260101T000000-laws-3"
+    assert cv.get_corpus_version() == "20260101T000000-laws-3"
+    assert len(checkouts) == 1 and conn.queries == 1
+
+
+def test_missing_table_is_cached_too(monkeypatch):
+    # Sin migrations/001_corpus_version.sql: una consulta fallida por ventana, no por petición
+    conn = FakeConn(error=RuntimeError('relation "public.corpus_version" does not exist'))
+    checkouts = use_pool(monkeypatch, conn)
+
+    assert cv.get_corpus_version() is None
+    assert cv.get_corpus_version() is None
+    assert len(checkouts) == 1 and conn.queries == 1
+
+
+def test_failure_is_retried_after_refresh_window(monkeypatch):
+    conn = FakeConn(error=RuntimeError("sin tabla"))
+    use_pool(monkeypatch, conn)
+    monkeypatch.setattr(cv, "CORPUS_VERSION_REFRESH_S", 0.0)
+
+    cv.get_corpus_version()
+    conn.error, conn.version = None, "v2"
+    assert cv.get_corpus_version() == "v2"
+
+
+def test_reads_on_the_callers_connection(monkeypatch):
+    checkouts = use_pool(monkeypatch, FakeConn("otra"))
+    held = FakeConn("v1")
+
+    assert cv.get_corpus_version(held) == "v1"
+    assert checkouts == [] and held.queries == 1
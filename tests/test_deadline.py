@@ -0,0 +1,142 @@
+# tests/test_deadline.py
+# Deadline por petición, reintentos y hedging (app/core/deadline.py).
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app.core import deadline
+from app.core.deadline import DeadlineExceeded, LatencyTracker, hedged, hedged_async, with_retries, with_retries_async
+
+
+class RateLimitError(Exception):
+    """Mismo nombre que el error de openai: se reintenta."""
+
+
+@pytest.fixture(autouse=True)
+def no_sleep_and_no_deadline(monkeypatch):
+    monkeypatch.setattr(deadline.random, "uniform", lambda a, b: 0.0)
+    deadline.end_deadline()
+    yield
+    deadline.end_deadline()
+
+
+def flaky(failures, exc=RateLimitError):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise exc("falla")
+        return "ok"
+    return fn, calls
+
+
+def test_retries_transient_errors():
+    fn, calls = flaky(2)
+    assert with_retries(fn, "embed_api", retries=2) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_retries():
+    fn, calls = flaky(5)
+    with pytest.raises(RateLimitError):
+        with_retries(fn, "embed_api", retries=2)
+    assert len(calls) == 3
+
+
+def test_non_transient_error_is_not_retried():
+    fn, calls = flaky(1, exc=ValueError)
+    with pytest.raises(ValueError):
+        with_retries(fn, "embed_api", retries=2)
+    assert len(calls) == 1
+
+
+def test_expired_deadline_stops_before_calling():
+    deadline.start_deadline(0.001)
+    time.sleep(0.01)
+    fn, calls = flaky(0)
+    with pytest.raises(DeadlineExceeded) as exc:
+        with_retries(fn, "embed_api")
+    assert exc.value.stage == "embed_api" and exc.value.status_code == 504
+    assert calls == []
+
+
+def test_retry_that_does_not_fit_the_deadline_is_skipped(monkeypatch):
+    monkeypatch.setattr(deadline.random, "uniform", lambda a, b: 10.0)
+    deadline.start_deadline(1.0)
+    fn, calls = flaky(1)
+    with pytest.raises(RateLimitError):
+        with_retries(fn, "embed_api", retries=2)
+    assert len(calls) == 1
+
+
+def test_async_retries():
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise TimeoutError()
+        return "ok"
+
+    assert asyncio.run(with_retries_async(fn, "llm_stream", retries=1)) == "ok"
+    assert len(calls) == 2
+
+
+def warm_tracker(seconds=0.01):
+    tracker = LatencyTracker(percentile=0.95, min_samples=3)
+    for _ in range(5):
+        tracker.add(seconds)
+    return tracker
+
+
+def test_hedged_without_history_calls_once():
+    calls = []
+    tracker = LatencyTracker(min_samples=3)
+    assert hedged(lambda: calls.append(1) or "ok", tracker=tracker, enabled=True) == "ok"
+    assert len(calls) == 1
+
+
+def test_hedged_second_call_wins_when_first_is_slow():
+    lock = threading.Lock()
+    calls = []
+
+    def fn():
+        with lock:
+            calls.append(1)
+            n = len(calls)
+        if n == 1:
+            time.sleep(0.5)
+            return "lenta"
+        return "rápida"
+
+    t0 = time.perf_counter()
+    assert hedged(fn, tracker=warm_tracker(), enabled=True) == "rápida"
+    assert time.perf_counter() - t0 < 0.4
+    assert len(calls) == 2
+
+
+def test_hedged_async_cancels_the_loser():
+    cancelled = []
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(0.5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "lenta"
+        return "rápida"
+
+    async def main():
+        out = await hedged_async(fn, tracker=warm_tracker(), enabled=True)
+        await asyncio.sleep(0)
+        return out
+
+    assert asyncio.run(main()) == "rápida"
+    assert cancelled == [1]
@@ -0,0 +1,83 @@
+# tests/test_fallback.py
+# Fallback de años en una sola consulta (retrieve_across_years).
+from app.services.retrieval import fallback
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if "winner" in sql:
+            self.conn.queries.append(params)
+
+    def fetchall(self):
+        return self.conn.results.pop(0)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    """Cada consulta del fallback devuelve el siguiente resultado de la lista."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def winner_row(year):
+    return ("winner", year) + (None,) * 13
+
+
+def vector_row(year, chunk_id, text="Artículo 27. Las deducciones autorizadas..."):
+    return ("vector", year, chunk_id, "doc-lisr", "ARTICLE", "27", "LISR.pdf", text, "ley", None, 1, 2, 0.82, None, None)
+
+
+def test_winner_with_rows_is_one_round_trip():
+    conn = FakeConn([[vector_row(2025, 10), winner_row(2025)]])
+
+    ev_vector, ev_keywords, used_year = fallback.retrieve_across_years(conn, [0.1, 0.2], [2025, 2024], 12)
+
+    assert used_year == 2025
+    assert [e["chunk_id"] for e in ev_vector] == [10]
+    assert ev_keywords == []
+    assert len(conn.queries) == 1
+
+
+def test_exists_true_but_index_scan_empty_tries_next_year():
+    # 2025 gana por EXISTS pero el scan HNSW / IVFFlat no devuelve filas
+    conn = FakeConn([
+        [winner_row(2025)],
+        [vector_row(2024, 20), winner_row(2024)],
+    ])
+
+    ev_vector, ev_keywords, used_year = fallback.retrieve_across_years(conn, [0.1, 0.2], [2025, 2024, 2023, 2022], 12)
+
+    assert used_year == 2024
+    assert [e["chunk_id"] for e in ev_vector] == [20]
+    # La segunda consulta solo considera los años posteriores al ganador vacío
+    assert [q[0] for q in conn.queries] == [[2025, 2024, 2023, 2022], [2024, 2023, 2022]]
+
+
+def test_winner_with_only_empty_text_is_skipped():
+    conn = FakeConn([
+        [vector_row(2025, 30, text=""), winner_row(2025)],
+        [],
+    ])
+
+    ev_vector, ev_keywords, used_year = fallback.retrieve_across_years(conn, [0.1], [2025, 2024], 12)
+
+    assert used_year is None
+    assert len(conn.queries) == 2
+
+
+def test_last_year_without_evidence_returns_nothing():
+    conn = FakeConn([[winner_row(2022)]])
+
+    assert fallback.retrieve_across_years(conn, [0.1], [2025, 2024, 2023, 2022], 12) == ([], [], None)
+    assert len(conn.queries) == 1
+
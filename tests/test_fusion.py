@@ -0,0 +1,70 @@
+# tests/test_fusion.py
+# Fusión híbrida vector + keywords (app/services/retrieval/fusion.py).
+from app.services.retrieval.fusion import NEUTRAL_SCORE, fuse_results, fusion_stats
+
+
+def vec(chunk_id, score):
+    return {"chunk_id": chunk_id, "chunk_text": f"texto {chunk_id}", "score": score, "source": "vector"}
+
+
+def kw(chunk_id, score=0.0):
+    return {"chunk_id": chunk_id, "chunk_text": f"texto {chunk_id}", "score": score, "source": "keyword"}
+
+
+def ids(fused):
+    return [e["chunk_id"] for e in fused]
+
+
+def test_rrf_dedupes_by_chunk_id_and_boosts_both_sources():
+    fused = fuse_results([vec(1, 0.9), vec(2, 0.8), vec(3, 0.7)], [kw(3), kw(4)], top_k=10, mode="rrf")
+
+    assert ids(fused) == [3, 1, 2, 4]
+    assert fused[0]["matched_by"] == ["vector", "keyword"]
+    assert fused[0]["source"] == "vector"
+    assert ids(fused).count(3) == 1
+
+
+def test_rrf_weights_per_source():
+    fused = fuse_results([vec(1, 0.9)], [kw(2)], top_k=10, mode="rrf", weights={"vector": 1.0, "keyword": 2.0})
+    assert ids(fused) == [2, 1]
+
+
+def test_weighted_constant_keyword_scores_do_not_outrank_vector():
+    # ILIKE: todos los hits por keyword con score 0
+    vector = [vec(1, 0.90), vec(2, 0.85), vec(3, 0.80), vec(4, 0.70)]
+    keyword = [kw(10), kw(11)]
+
+    fused = fuse_results(vector, keyword, top_k=10, mode="weighted")
+    scores = {e["chunk_id"]: e["fusion_score"] for e in fused}
+
+    assert scores[10] == scores[11] == NEUTRAL_SCORE
+    assert ids(fused)[:2] == [1, 2]
+    assert scores[2] > scores[10]
+
+
+def test_weighted_min_max_normalization():
+    fused = fuse_results([vec(1, 0.9), vec(2, 0.5), vec(3, 0.1)], [], top_k=10, mode="weighted")
+    assert [e["fusion_score"] for e in fused] == [1.0, 0.5, 0.0]
+
+
+def test_append_keeps_previous_behaviour():
+    fused = fuse_results([vec(1, 0.9), vec(2, 0.8)], [kw(9, 5.0), kw(1)], top_k=10, mode="append")
+    assert ids(fused) == [1, 2, 9]
+
+
+def test_top_k_and_empty_text():
+    empty = {"chunk_id": 7, "chunk_text": "", "score": 0.99}
+    fused = fuse_results([empty, vec(1, 0.9), vec(2, 0.8), vec(3, 0.7)], [], top_k=2, mode="rrf")
+    assert ids(fused) == [1, 2]
+
+
+def test_rows_without_chunk_id_dedupe_by_text():
+    a = {"chunk_text": "mismo texto", "score": 0.9}
+    b = {"chunk_text": "mismo texto", "score": 1.0}
+    fused = fuse_results([a], [b], top_k=10, mode="rrf")
+    assert len(fused) == 1 and fused[0]["matched_by"] == ["vector", "keyword"]
+
+
+def test_fusion_stats():
+    fused = fuse_results([vec(1, 0.9), vec(2, 0.8)], [kw(2), kw(5)], top_k=10, mode="rrf")
+    assert fusion_stats(fused, "rrf") == {"mode": "rrf", "count": 3, "both": 1, "keyword_only": 1}
@@ -0,0 +1,59 @@
+# tests/test_history.py
+# Historial con presupuesto de tokens (app/services/history.py).
+from app.services.history import citations, compact_history, compact_line
+
+
+def msg(role, content, tokens):
+    return {"role": role, "content": content, "tokens": tokens}
+
+
+def test_everything_fits():
+    history = [msg("user", "¿Qué es la UMA?", 10), msg("assistant", "Es la unidad...", 20)]
+
+    messages, info = compact_history(history, budget=100)
+
+    assert messages == [{"role": "user", "content": "¿Qué es la UMA?"}, {"role": "assistant", "content": "Es la unidad..."}]
+    assert info == {"kept": 2, "summarized": 0, "tokens": 30}
+
+
+def test_older_turns_become_a_summary_with_citations():
+    history = [
+        msg("user", "¿Qué dice el artículo 27 de la LISR?", 10),
+        msg("assistant", "Conforme al Art. 27 LISR y la Regla 3.5.1, las deducciones...", 400),
+        msg("user", "¿Y para personas físicas?", 10),
+        msg("assistant", "Aplica el Artículo 147 de la LISR.", 50),
+    ]
+
+    messages, info = compact_history(history, budget=100)
+
+    assert info["kept"] == 2 and info["summarized"] == 2
+    assert messages[0]["role"] == "system"
+    assert "P: ¿Qué dice el artículo 27 de la LISR?" in messages[0]["content"]
+    assert "R: citó Art. 27 LISR, Regla 3.5.1" in messages[0]["content"]
+    assert [m["content"] for m in messages[1:]] == ["¿Y para personas físicas?", "Aplica el Artículo 147 de la LISR."]
+
+
+def test_latest_message_is_truncated_when_it_alone_exceeds_budget():
+    history = [msg("user", "hola", 1), msg("assistant", "x" * 4000, 5000)]
+
+    messages, info = compact_history(history, budget=50)
+
+    assert info["kept"] == 1 and info["tokens"] >= 50
+    assert messages[-1]["role"] == "assistant"
+    assert len(messages[-1]["content"]) < 4000
+
+
+def test_token_count_comes_from_session_when_present():
+    # Las sesiones guardan el conteo por mensaje: no se vuelve a tokenizar
+    _, info = compact_history([msg("user", "corto", 999)], budget=1000)
+    assert info["tokens"] == 999
+
+
+def test_citations_dedupe_case_insensitive():
+    assert citations("Art. 27 LISR ... art. 27 lisr ... regla 2.7.1.46") == ["Art. 27 LISR", "regla 2.7.1.46"]
+
+
+def test_compact_line():
+    assert compact_line({"role": "assistant", "content": "Sin fundamento expreso."}) == "R: (sin citas)"
+    long_q = "¿" + "a" * 300 + "?"
+    assert compact_line({"role": "user", "content": long_q}).endswith("…")
@@ -0,0 +1,199 @@
+# tests/test_norm_index.py
+# Índice en memoria de artículos / reglas RMF (app/services/retrieval/norm_index.py).
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from app.services import corpus_version as cv
+from app.services.retrieval import norm_index as ni
+
+
+def norm_row(chunk_id, document_id, kind, norm_id, text, year=0, doc_type="ley", page=1):
+    return (chunk_id, document_id, kind, norm_id, f"{document_id}.pdf", text, doc_type, None, page, page, year)
+
+
+ROWS = [
+    norm_row(1, "lisr", "ARTICLE", "27", "Artículo 27. Las deducciones autorizadas..."),
+    norm_row(2, "cff", "ARTICLE", "27", "Artículo 27. Las personas morales..."),
+    norm_row(3, "rmf2025", "RULE", "2.7.1.1", "2.7.1.1. Para los efectos...", year=2025, doc_type="rmf", page=9),
+    norm_row(4, "rmf2025", "RULE", "2.7.1.1", "2.7.1.1. (continúa)", year=2025, doc_type="rmf", page=3),
+]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = None
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if sql == cv.CORPUS_VERSION_SQL:
+            self.result = ("v1",)
+        else:
+            self.result = self.conn.size if sql is ni.NORM_INDEX_SIZE_SQL else self.conn.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, rows, size=None):
+        self.rows = rows
+        self.size = size or (len(rows), sum(len(r[5]) for r in rows))
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def index(monkeypatch):
+    idx = ni.NormIndex()
+    idx.disabled_reason = None
+    monkeypatch.setattr(ni, "norm_index", idx)
+    monkeypatch.setattr(ni, "get_corpus_version", lambda conn=None: "v1")
+    return idx
+
+
+def use_db(monkeypatch, conn):
+    @contextmanager
+    def db_connection():
+        yield conn
+    monkeypatch.setattr(ni, "db_connection", db_connection)
+
+
+def test_refresh_loads_and_serves_from_memory(index, monkeypatch):
+    use_db(monkeypatch, FakeConn(ROWS))
+    index.refresh()
+
+    assert index.ready
+    ev = index.articles(["cff", "lisr"], ["27"], limit=5)
+    # Primer documento del router que tiene el artículo
+    assert [(e["document_id"], e["chunk_id"]) for e in ev] == [("cff", 2)]
+
+    rule = index.rmf_rule(2025, "2.7.1.1", None, limit=5)
+    assert {e["chunk_id"] for e in rule} == {3, 4}
+    assert index.rmf_rule(2025, "29-A", None, limit=5) == []
+
+
+def test_oversized_corpus_is_not_fetched(index, monkeypatch):
+    conn = FakeConn(ROWS, size=(ni.NORM_INDEX_MAX_CHUNKS + 1, 10))
+    use_db(monkeypatch, conn)
+    index.refresh()
+
+    assert not index.ready
+    assert index.disabled_reason
+    assert conn.executed == [ni.NORM_INDEX_SIZE_SQL]
+
+
+def test_memory_cap(index, monkeypatch):
+    conn = FakeConn(ROWS, size=(10, int(ni.NORM_INDEX_MAX_MB * 1e6) + 1))
+    use_db(monkeypatch, conn)
+    index.refresh()
+
+    assert index.disabled_reason and "NORM_INDEX_MAX_MB" in index.disabled_reason
+    assert conn.executed == [ni.NORM_INDEX_SIZE_SQL]
+
+
+def test_sync_lookup_does_not_wait_for_load(index, monkeypatch):
+    release = threading.Event()
+    loaded = threading.Event()
+
+    def slow_load(version):
+        release.wait(5)
+        index._install(version, ROWS, 0.0)
+        loaded.set()
+
+    monkeypatch.setattr(index, "_load", slow_load)
+    db_calls = []
+    monkeypatch.setattr(ni.article_lookup, "try_get_articles_chunks", lambda conn, d, n, limit: db_calls.append(n) or [])
+
+    # La carga sigue en curso: la petición va a Postgres
+    assert ni.lookup_articles(None, ["lisr"], ["27"]) == []
+    assert db_calls == [["27"]]
+
+    release.set()
+    assert loaded.wait(5)
+    assert [e["chunk_id"] for e in ni.lookup_articles(None, ["lisr"], ["27"])] == [1]
+    assert db_calls == [["27"]]
+
+
+def test_negative_cache_while_not_loaded(index, monkeypatch):
+    # Carga fallida hace poco: no se reintenta y las peticiones van a Postgres
+    index._retry_at = time.monotonic() + 3600
+    db_calls = []
+    monkeypatch.setattr(ni.rmf_rule_lookup, "try_get_rmf_rule_chunks", lambda *a: db_calls.append(a) or [])
+
+    assert ni.lookup_rmf_rule(None, 2025, "29-A") == []
+    assert ni.lookup_rmf_rule(None, 2025, "29-A") == []
+    assert len(db_calls) == 1
+    assert index.stats()["negative_hits"] == 1
+
+
+class OneConnectionPool:
+    """Pool de tamaño 1: un checkout anidado se queda sin conexión."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.sem = threading.Semaphore(1)
+        self.checkouts = 0
+        self.timeouts = 0
+
+    @contextmanager
+    def connection(self):
+        if not self.sem.acquire(timeout=0.5):
+            self.timeouts += 1
+            raise TimeoutError("pool agotado: checkout anidado")
+        self.checkouts += 1
+        try:
+            yield self.conn
+        finally:
+            self.sem.release()
+
+
+def test_lookup_with_pool_of_one_does_not_nest_checkouts(index, monkeypatch):
+    conn = FakeConn(ROWS)
+    pool = OneConnectionPool(conn)
+    monkeypatch.setattr(ni, "get_corpus_version", cv.get_corpus_version)
+    monkeypatch.setattr(ni, "db_connection", pool.connection)
+    monkeypatch.setattr(cv, "db_connection", pool.connection)
+    # Versión vencida: hay que leerla de nuevo
+    monkeypatch.setattr(cv, "_state", {"version": None, "checked_at": None, "warned": False})
+    monkeypatch.setattr(ni.article_lookup, "try_get_articles_chunks", lambda c, d, n, limit: [])
+
+    with pool.connection() as held:
+        # La petición tiene la única conexión: la versión se lee sobre ella
+        assert ni.lookup_articles(held, ["lisr"], ["27"]) == []
+        assert cv.CORPUS_VERSION_SQL in conn.executed
+        assert pool.timeouts == 0
+
+    # La recarga en segundo plano toma la conexión cuando la petición la suelta
+    for _ in range(200):
+        if index.ready:
+            break
+        time.sleep(0.01)
+    assert index.ready
+    assert [e["chunk_id"] for e in ni.lookup_articles(conn, ["lisr"], ["27"])] == [1]
+
+
+def test_without_version_is_not_a_load_fallback(index, monkeypatch):
+    monkeypatch.setattr(ni, "get_corpus_version", lambda conn=None: None)
+    monkeypatch.setattr(ni.article_lookup, "try_get_articles_chunks", lambda c, d, n, limit: [])
+
+    ni.lookup_articles(None, ["lisr"], ["99"])
+    stats = index.stats()
+    assert stats["unversioned"] == 1 and stats["db_fallbacks"] == 0
@@ -0,0 +1,40 @@
+# tests/test_semantic_cache.py
+# Cache semántica de respuestas (app/services/cache/semantic_cache.py).
+from app.services.cache.semantic_cache import SemanticCache, semantic_scope
+
+
+def test_scope_keeps_numbers_ejercicio_and_regimen():
+    # Solo cuentan los números: la fracción en romano no cambia el scope
+    assert semantic_scope("Art. 27 fracción V", 2025, "General") == "2025|general|27"
+    assert semantic_scope("¿Qué dice el artículo 27?", 2025, "General") == "2025|general|27"
+    assert semantic_scope("Regla 2.7.1.1 y artículo 29-A", 2025, "") == "2025|general|2.7.1.1,29-A"
+
+
+def test_paraphrase_with_other_article_is_another_scope():
+    # Dos preguntas casi iguales con distinto número nunca comparten respuesta
+    a = semantic_scope("¿Qué dice el artículo 27 de la LISR?", 2025, "General")
+    b = semantic_scope("¿Qué dice el artículo 28 de la LISR?", 2025, "General")
+    assert a != b
+
+
+def test_lookup_respects_scope_threshold_and_version():
+    cache = SemanticCache(capacity=4, threshold=0.9)
+    cache.put([1.0, 0.0], "2025|general|27", "v1", {"answer": "art 27"})
+
+    hit = cache.lookup([0.99, 0.05], "2025|general|27", "v1")
+    assert hit is not None and hit[0] == {"answer": "art 27"} and hit[1] > 0.9
+
+    assert cache.lookup([0.99, 0.05], "2025|general|28", "v1") is None
+    assert cache.lookup([0.0, 1.0], "2025|general|27", "v1") is None
+    assert cache.lookup([1.0, 0.0], "2025|general|27", "v2") is None
+
+
+def test_ring_buffer_overwrites_oldest():
+    cache = SemanticCache(capacity=2, threshold=0.99)
+    cache.put([1.0, 0.0, 0.0], "s", "v1", {"n": 1})
+    cache.put([0.0, 1.0, 0.0], "s", "v1", {"n": 2})
+    cache.put([0.0, 0.0, 1.0], "s", "v1", {"n": 3})
+
+    assert cache.lookup([1.0, 0.0, 0.0], "s", "v1") is None
+    assert cache.lookup([0.0, 0.0, 1.0], "s", "v1")[0] == {"n": 3}
+    assert cache.stats()["size"] == 2
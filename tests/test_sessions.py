@@ -0,0 +1,89 @@
+# tests/test_sessions.py
+# Sesiones del lado del servidor y seguimientos (app/services/sessions.py).
+from app.services.cache.shared_backend import CacheBackend
+from app.services.sessions import (
+    SESSION_MAX_TURNS,
+    SessionStore,
+    followup_request,
+    narrow_evidence,
+    session_turn,
+    valid_session_id,
+)
+
+SESSION = {"turns": [], "chunk_ids": [11, 12], "article": {"document_id": "lisr", "norm_id": "27"}}
+
+
+def test_followup_request():
+    assert followup_request("¿Y la fracción XI?", SESSION) == {"kind": "fraccion", "ref": "XI"}
+    assert followup_request("¿y el párrafo 2?", SESSION) == {"kind": "parrafo", "ref": "2"}
+    assert followup_request("¿Y el inciso b)?", SESSION) == {"kind": "inciso", "ref": "b"}
+
+
+def test_not_a_followup():
+    # Cita explícita, sin evidencia previa o sin fracción / inciso
+    assert followup_request("¿Qué dice el artículo 28, fracción XI?", SESSION) is None
+    assert followup_request("¿Y la fracción XI?", {"chunk_ids": []}) is None
+    assert followup_request("¿Y la fracción XI?", None) is None
+    assert followup_request("¿Qué es la UMA?", SESSION) is None
+
+
+def test_narrow_evidence_puts_requested_fraction_first():
+    evidence = [
+        {"chunk_id": 1, "chunk_text": "I. Los donativos..."},
+        {"chunk_id": 2, "chunk_text": "X. Las cuotas...\nXI. Los gastos de previsión social..."},
+        {"chunk_id": 3, "chunk_text": "XII. Las aportaciones..."},
+    ]
+
+    ev, n = narrow_evidence(evidence, {"kind": "fraccion", "ref": "XI"})
+
+    assert n == 1
+    assert [e["chunk_id"] for e in ev] == [2, 1, 3]
+
+
+def test_narrow_evidence_without_marker_keeps_order():
+    evidence = [{"chunk_id": 1, "chunk_text": "a"}, {"chunk_id": 2, "chunk_text": "b"}]
+    assert narrow_evidence(evidence, {"kind": "parrafo", "ref": "2"}) == (evidence, 0)
+
+
+def test_session_turn_keeps_evidence_and_bounds_turns():
+    prev = {"turns": [{"role": "user", "content": "q", "tokens": 1}] * (SESSION_MAX_TURNS + 4), "chunk_ids": [1]}
+    debug = {
+        "route_used": "vector_fallback",
+        "used_year": 2025,
+        "sources": [{"chunk_id": 7, "norm_kind": "ARTICLE", "norm_id": "27", "document_id": "lisr", "source_filename": "LISR.pdf"}],
+    }
+
+    state = session_turn(prev, "¿Qué dice el artículo 27?", "Dice...", debug)
+
+    assert len(state["turns"]) == SESSION_MAX_TURNS
+    assert state["turns"][-1]["role"] == "assistant"
+    assert state["chunk_ids"] == [7]
+    assert state["article"]["norm_id"] == "27"
+    assert state["used_year"] == 2025
+
+
+def test_followup_turn_keeps_previous_article():
+    debug = {"route_used": "session_followup", "chunk_ids": [12]}
+    state = session_turn(SESSION, "¿Y la fracción XI?", "La fracción XI...", debug)
+    assert state["article"] == SESSION["article"]
+    assert state["chunk_ids"] == [12]
+
+
+def test_store_lru_and_ttl():
+    store = SessionStore(max_entries=2, ttl_s=60, backend=CacheBackend())
+    store.save("sesion-a1", {"n": 1})
+    store.save("sesion-b2", {"n": 2})
+    store.save("sesion-c3", {"n": 3})
+
+    assert store.get("sesion-a1") is None
+    assert store.get("sesion-c3") == {"n": 3}
+
+    expired = SessionStore(ttl_s=-1, backend=CacheBackend())
+    expired.save("sesion-d4", {"n": 4})
+    assert expired.get("sesion-d4") is None
+
+
+def test_valid_session_id():
+    assert valid_session_id("abc12345")
+    assert not valid_session_id("corta")
+    assert not valid_session_id("../../etc/passwd")
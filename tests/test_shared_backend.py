@@ -0,0 +1,176 @@
+# tests/test_shared_backend.py
+# Backend compartido (app/services/cache/shared_backend.py): SQLite en archivo y un
+# servidor RESP2 mínimo en proceso (solo lo que usa RedisBackend: SET/MGET con EX).
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from app.services.cache import shared_backend as sb
+
+
+# =========================
+# SQLite
+# =========================
+
+def test_sqlite_get_set_and_miss(tmp_path):
+    backend = sb.make_backend(f"sqlite:///{tmp_path / 'shared.sqlite3'}")
+
+    backend.set("a", b"1")
+    assert backend.get("a") == b"1"
+    assert backend.get("b") is None
+    assert backend.get_many(["a", "b"]) == {"a": b"1"}
+
+
+def test_sqlite_ttl_expiry(tmp_path, monkeypatch):
+    backend = sb.SQLiteBackend(str(tmp_path / "shared.sqlite3"))
+    now = [1_000.0]
+    monkeypatch.setattr(sb.time, "time", lambda: now[0])
+
+    backend.set("k", b"v", ttl_s=10)
+    assert backend.get("k") == b"v"
+    now[0] += 11
+    assert backend.get("k") is None
+
+
+def test_sqlite_two_instances_share_writes(tmp_path):
+    # Dos workers = dos backends sobre el mismo archivo
+    path = str(tmp_path / "shared.sqlite3")
+    one, two = sb.SQLiteBackend(path), sb.SQLiteBackend(path)
+
+    one.set("k", b"from-one")
+    assert two.get("k") == b"from-one"
+    two.set("k", b"from-two")
+    assert one.get("k") == b"from-two"
+
+
+# =========================
+# RESP2 (servidor mínimo en proceso)
+# =========================
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RespHandler)
+        self.data = {}
+        self.clock = 0.0  # reloj propio: el test lo avanza para expirar llaves
+
+    def lookup(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= self.clock:
+            del self.data[key]
+            return None
+        return value
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line.startswith(b"*"), line
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def bulk(self, value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        server = self.server
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            if cmd == b"SET":
+                expires_at = None
+                if len(args) >= 5 and args[3].upper() == b"EX":
+                    expires_at = server.clock + int(args[4])
+                server.data[args[1]] = (args[2], expires_at)
+                reply = b"+OK\r\n"
+            elif cmd == b"MGET":
+                values = [server.lookup(k) for k in args[1:]]
+                reply = b"*%d\r\n" % len(values) + b"".join(self.bulk(v) for v in values)
+            elif cmd == b"PING":
+                reply = b"+PONG\r\n"
+            else:
+                # CLIENT SETINFO y similares: el cliente ignora el error
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+@pytest.fixture
+def resp_server():
+    pytest.importorskip("redis")
+    server = RespServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def redis_url(server):
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+
+def test_resp_get_set_and_miss(resp_server):
+    backend = sb.make_backend(redis_url(resp_server))
+    assert isinstance(backend, sb.RedisBackend)
+
+    backend.set_many({"a": b"1", "b": b"2"})
+    assert backend.get_many(["a", "b", "c"]) == {"a": b"1", "b": b"2"}
+    assert backend.get("c") is None
+    assert backend.stats()["hits"] == 2 and backend.errors == 0
+
+
+def test_resp_ttl_expiry(resp_server):
+    backend = sb.make_backend(redis_url(resp_server))
+
+    backend.set("k", b"v", ttl_s=5)
+    assert resp_server.data[b"k"] == (b"v", 5.0)
+    assert backend.get("k") == b"v"
+    resp_server.clock += 6
+    assert backend.get("k") is None
+
+
+def test_resp_server_down_is_skipped(monkeypatch):
+    pytest.importorskip("redis")
+    # Puerto libre sin nadie escuchando
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    backend = sb.make_backend(f"redis://127.0.0.1:{port}/0")
+
+    started = time.monotonic()
+    assert backend.get("k") is None
+    backend.set("k", b"v")
+    assert time.monotonic() - started < 2.0
+    # El primer fallo abre la ventana de SHARED_CACHE_RETRY_S: el set ya no se intenta
+    assert backend.errors == 1
+    assert backend.stats()["available"] is False
+
+
+def test_resp_server_going_away_mid_run(resp_server, monkeypatch):
+    monkeypatch.setattr(sb, "SHARED_CACHE_RETRY_S", 0.0)
+    backend = sb.make_backend(redis_url(resp_server))
+    backend.set("k", b"v")
+    assert backend.get("k") == b"v"
+
+    resp_server.shutdown()
+    resp_server.server_close()
+    backend._redis().connection_pool.disconnect()
+
+    assert backend.get("k") is None
+    assert backend.errors >= 1
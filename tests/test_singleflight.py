@@ -0,0 +1,76 @@
+# tests/test_singleflight.py
+# Coalescencia de preguntas idénticas concurrentes (app/services/singleflight.py).
+import asyncio
+
+from app.services.singleflight import StreamCoalescer
+
+
+def make_factory(calls, events, gate=None, error=None):
+    async def factory():
+        calls.append(1)
+        for i, ev in enumerate(events):
+            if gate is not None and i == 1:
+                await gate.wait()
+            yield ev
+        if error is not None:
+            raise error
+    return factory
+
+
+async def collect(agen):
+    return [ev async for ev in agen]
+
+
+def test_concurrent_consumers_share_one_flight():
+    async def main():
+        sf = StreamCoalescer()
+        calls = []
+        gate = asyncio.Event()
+        events = [("meta", {"n": 0}), ("delta", {"t": "hola"}), ("done", {})]
+        factory = make_factory(calls, events, gate)
+
+        first = asyncio.create_task(collect(sf.stream("k", factory)))
+        await asyncio.sleep(0.01)
+        # Llega cuando ya se emitió "meta": igual recibe la secuencia completa
+        second = asyncio.create_task(collect(sf.stream("k", factory)))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await first, await second, calls, sf.stats()
+
+    first, second, calls, stats = asyncio.run(main())
+    assert first == second == [("meta", {"n": 0}), ("delta", {"t": "hola"}), ("done", {})]
+    assert len(calls) == 1
+    assert stats == {"in_flight": 0, "flights": 1, "coalesced": 1}
+
+
+def test_error_reaches_every_consumer_after_emitted_events():
+    async def main():
+        sf = StreamCoalescer()
+        gate = asyncio.Event()
+        factory = make_factory([], [("meta", {}), ("delta", {})], gate, error=RuntimeError("LLM caído"))
+        seen = {"a": [], "b": []}
+
+        async def consume(name):
+            async for ev in sf.stream("k", factory):
+                seen[name].append(ev[0])
+
+        tasks = [asyncio.create_task(consume("a")), asyncio.create_task(consume("b"))]
+        await asyncio.sleep(0.01)
+        gate.set()
+        return seen, await asyncio.gather(*tasks, return_exceptions=True)
+
+    seen, results = asyncio.run(main())
+    assert seen == {"a": ["meta", "delta"], "b": ["meta", "delta"]}
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_finished_flight_is_not_reused():
+    async def main():
+        sf = StreamCoalescer()
+        calls = []
+        factory = make_factory(calls, [("done", {})])
+        await collect(sf.stream("k", factory))
+        await collect(sf.stream("k", factory))
+        return calls
+
+    assert len(asyncio.run(main())) == 2
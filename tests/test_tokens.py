@@ -0,0 +1,53 @@
+# tests/test_tokens.py
+# Conteo de tokens (app/core/tokens.py), con y sin el encoding de tiktoken.
+import sys
+import types
+
+import pytest
+
+from app.core import tokens
+
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch):
+    """tiktoken instalado pero sin poder descargar su BPE (host sin salida a internet)."""
+    calls = []
+
+    def get_encoding(name):
+        calls.append(name)
+        raise OSError("Max retries exceeded with url: openaipublic.blob.core.windows.net")
+
+    def encoding_for_model(model):
+        calls.append(model)
+        return get_encoding("o200k_base")
+
+    mod = types.SimpleNamespace(get_encoding=get_encoding, encoding_for_model=encoding_for_model)
+    monkeypatch.setitem(sys.modules, "tiktoken", mod)
+    tokens._encoding.cache_clear()
+    yield calls
+    tokens._encoding.cache_clear()
+
+
+def test_download_failure_falls_back_to_estimate(fake_tiktoken):
+    assert tokens.count_tokens("a" * 40, model="modelo-x") == 10
+    assert tokens.truncate_tokens("abcdefghij", 2, model="modelo-x") == "abcdefgh"
+
+
+def test_download_failure_is_cached(fake_tiktoken):
+    for _ in range(3):
+        tokens.count_tokens("hola mundo", model="modelo-x")
+    assert fake_tiktoken == ["modelo-x", "o200k_base"]
+
+
+def test_preload_reports_estimate(fake_tiktoken):
+    assert tokens.preload_encoding("modelo-x") == "estimate"
+
+
+def test_message_tokens_use_overhead(fake_tiktoken):
+    messages = [{"role": "user", "content": "a" * 8}]
+    assert tokens.count_message_tokens(messages, model="modelo-x") == 4 + 2 + 3
+
+
+def test_empty_text():
+    assert tokens.count_tokens("") == 0
+    assert tokens.truncate_tokens("abc", 0) == ""